@@ -0,0 +1,8 @@
+"""
+Lets the command line tools run with python -m mysite.apps.nlp (see cli.py)
+"""
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -14,6 +14,7 @@ class NlpConfig(AppConfig):
         """
         # need to import here otherwise we get circular import errors
         from .parser_utils import load_combined_synonyms
+        from .synonym_refresh import connect_synonym_signals
 
         print("Loading parser synonyms...")
         try:
@@ -24,5 +25,12 @@ class NlpConfig(AppConfig):
             print(f"Warning: Couldn't load from database: {e}")
             print("We will be using default synonyms")
         # endtry
+
+        # keep the synonyms up to date as courses and subject requirements are saved or deleted
+        try:
+            connect_synonym_signals()
+        except Exception as e:
+            print(f"Warning: Couldn't watch the database for synonym changes: {e}")
+        # endtry
     # enddef
 # endclass
@@ -0,0 +1,207 @@
+"""
+Async wrapper around GradeParser for ASGI views, so parsing doesn't block the event loop.
+
+    parser = AsyncGradeParser(max_concurrency=8)
+
+    async def view(request):
+        result = await parser.aparse(request.GET["q"])
+"""
+import asyncio
+import copy
+import functools
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Callable, Dict, Hashable, Iterable, List
+
+from .grade_parser import GradeParser, _init_parse_worker, _parse_chunk
+from .parse_result import ParseResult
+from .parser_utils import get_synonyms
+
+
+def make_process_executor(workers: int | None = None) -> ProcessPoolExecutor:
+    """
+    Makes a process pool for AsyncGradeParser where every worker starts with this process's synonyms.
+    Loads the synonyms if they aren't yet, so make it at startup rather than inside a request.
+
+    :param workers: Number of worker processes, defaults to the number of CPUs
+    :return: ProcessPoolExecutor ready to pass to AsyncGradeParser
+    """
+
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker, initargs=(get_synonyms(),))
+
+
+# enddef
+
+
+def _parse_now(parser: GradeParser, text: str) -> ParseResult:
+    """
+    Parses an input and works out every field of the result straight away,
+    so the parsing happens in the executor and not when the result is first read.
+
+    :param parser: Parser to use
+    :param text: Input to parse
+    :return: Parse result with every field worked out
+    """
+    return parser.parse(text).evaluate()
+
+
+# enddef
+
+
+class AsyncGradeParser:
+    """
+    Runs GradeParser.parse in an executor so it can be awaited.
+    At most max_concurrency parses run at once, the rest wait their turn in order,
+    so a burst of requests can't pile up unbounded work in the executor.
+    Identical inputs that are already being parsed share the same parse instead of starting another.
+    """
+
+    def __init__(self, parser: GradeParser | None = None, executor: Executor | None = None,
+                 max_concurrency: int = 8):
+        """
+        :param parser: Parser to run, defaults to GradeParser()
+        :param executor: Executor to parse in. None uses the event loop's default thread pool.
+            A ProcessPoolExecutor should come from make_process_executor so its workers have the synonyms.
+            Process workers use a fresh parser with the same class and engine, without its cache or timing hook.
+        :param max_concurrency: Most parses running at once
+        """
+
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        # endif
+
+        self.parser: GradeParser = parser if parser is not None else GradeParser()
+        self.executor: Executor | None = executor
+        self.max_concurrency: int = max_concurrency
+
+        # Made on first use so they belong to the event loop that uses them
+        self._semaphore: asyncio.Semaphore | None = None
+        self._synonyms_lock: asyncio.Lock | None = None
+        self._synonyms_ready: bool = False
+
+        # key -> task of the parse currently running for that input
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    # enddef
+
+    async def _ensure_synonyms(self) -> None:
+        """
+        Loads the synonyms once, in a thread since it can query the database.
+        Concurrent first calls wait for the same load instead of each starting one.
+        """
+
+        if self._synonyms_ready:
+            return
+        # endif
+
+        if self._synonyms_lock is None:
+            self._synonyms_lock = asyncio.Lock()
+        # endif
+
+        async with self._synonyms_lock:
+            if not self._synonyms_ready:
+                await asyncio.get_running_loop().run_in_executor(None, get_synonyms)
+                self._synonyms_ready = True
+            # endif
+        # endwith
+
+    # enddef
+
+    def _parse_function(self, text: str) -> Callable[[], ParseResult]:
+        """
+        :param text: Input to parse
+        :return: Function that parses it, in a form the executor can run
+        """
+
+        if isinstance(self.executor, ProcessPoolExecutor):
+            # Parsers can hold locks (e.g. their cache), so process workers make their own
+            return functools.partial(_parse_chunk, type(self.parser), self.parser.engine, [text])
+        # endif
+
+        return functools.partial(_parse_now, self.parser, text)
+
+    # enddef
+
+    async def _run(self, text: str) -> ParseResult:
+        """
+        Parses one input in the executor once there is room under the concurrency limit.
+
+        :param text: Input to parse
+        :return: Parse result
+        """
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        # endif
+
+        async with self._semaphore:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, self._parse_function(text))
+        # endwith
+
+        if isinstance(self.executor, ProcessPoolExecutor):
+            return result[0]
+        # endif
+
+        return result
+
+    # enddef
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        """
+        Removes a finished parse from the in-flight ones.
+
+        :param key: Key the parse was stored under
+        :param task: The finished task
+        """
+
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # endif
+
+        # Mark any error as seen, every caller waiting on it gets it raised already
+        if not task.cancelled():
+            task.exception()
+        # endif
+
+    # enddef
+
+    async def aparse(self, input: str) -> ParseResult:
+        """
+        Async version of GradeParser.parse.
+
+        :param input: User input containing grades, dropped subjects, and course interests
+        :return: Same as GradeParser.parse. Each caller gets its own copy, even when a parse was shared.
+        """
+
+        await self._ensure_synonyms()
+
+        # Same key as the parse cache: inputs that only differ by surrounding whitespace parse the same
+        key: tuple[int, str, str] = (get_synonyms()["version"], self.parser.engine, input.strip())
+
+        task: asyncio.Task | None = self._in_flight.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(self._run(input))
+            self._in_flight[key] = task
+            task.add_done_callback(functools.partial(self._forget, key))
+        # endif
+
+        # Shielded so a caller that gets cancelled doesn't cancel the parse for everyone else sharing it
+        result: ParseResult = await asyncio.shield(task)
+
+        return copy.deepcopy(result)
+
+    # enddef
+
+    async def aparse_many(self, inputs: Iterable[str]) -> List[ParseResult]:
+        """
+        Async version of GradeParser.parse_many, parses the inputs concurrently under the concurrency limit.
+
+        :param inputs: The user inputs to parse
+        :return: One parse result per input, in the same order as the inputs
+        """
+
+        return list(await asyncio.gather(*(self.aparse(text) for text in inputs)))
+    # enddef
+
+
+# endclass
@@ -0,0 +1,545 @@
+"""
+Benchmarks for each stage of the grade parser, run on a generated corpus of inputs.
+
+Run it as a module from the project root, e.g.
+    python -m mysite.apps.nlp.benchmark run --size 2000 --output before.json
+    python -m mysite.apps.nlp.benchmark compare before.json after.json
+    python -m mysite.apps.nlp.benchmark memory --workers 4
+    python -m mysite.apps.nlp.benchmark adversarial --max-size 32000
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+from typing import Callable, Dict, List
+
+from .grade_parser import GradeParser
+from .parser_utils import freeze_lexicon
+from .synonyms import SYNONYMS
+
+# Kinds of input the corpus generator can make, and how often each one comes up by default
+DEFAULT_MIX: Dict[str, float] = {
+    "multi_grade": 0.25,
+    "colon": 0.2,
+    "dropped": 0.2,
+    "interest": 0.2,
+    "long": 0.15,
+}
+
+GRADES: List[str] = ["A*", "A", "B", "C", "D", "E"]
+
+# Inputs made to be as slow as possible for patterns that backtrack: the same few words repeated to the given length,
+# so any stage that takes time quadratic in the length of its input shows up as the time growing 4x per doubling
+ADVERSARIAL_INPUTS: Dict[str, Callable[[int], str]] = {
+    "prose": lambda size: ("i did maths and physics at school and liked them a lot " * size)[:size],
+    "grades_in": lambda size: "ab in cd ef " * (size // 12) + "1",
+    "multi_grade": lambda size: "AA in x " * (size // 8) + "1",
+    "got_grade_in": lambda size: "got A in ab " * (size // 12) + "1",
+    "in_is": lambda size: "in ab " * (size // 6) + "1",
+    "interest": lambda size: "interested in " * (size // 14) + "1",
+    "dropped": lambda size: "i " * (size // 2) + "dropped",
+    "letters": lambda size: "a " * (size // 2) + "1",
+    "colon": lambda size: "maths " * (size // 6) + ": 1",
+    "spaces": lambda size: "A" + " " * size + "in",
+}
+
+# Parser stages that get timed, in pipeline order
+STAGES: List[str] = ["clean_input", "find_dropped_subjects", "find_all_grades", "find_course_interest", "parse"]
+
+
+def generate_corpus(size: int, mix: Dict[str, float] | None = None, seed: int = 0) -> List[str]:
+    """
+    Makes a list of realistic looking inputs from the subjects, courses and phrases in SYNONYMS.
+
+    :param size: Number of inputs to make
+    :param mix: Dictionary of input kind to weight (see DEFAULT_MIX), defaults to DEFAULT_MIX
+    :param seed: Random seed, the same seed always gives the same corpus
+    :return: List of input strings
+    """
+
+    if mix is None:
+        mix = DEFAULT_MIX
+    # endif
+
+    unknown: List[str] = [kind for kind in mix if kind not in DEFAULT_MIX]
+    if unknown:
+        raise ValueError(f"Unknown input kinds: {', '.join(unknown)}")
+    # endif
+
+    rnd = random.Random(seed)
+    subjects: List[str] = [alias for aliases in SYNONYMS["subjects"].values() for alias in aliases]
+    courses: List[str] = [alias for aliases in SYNONYMS["courses"].values() for alias in aliases]
+
+    def multi_grade() -> str:
+        count: int = rnd.randint(2, 4)
+        grades: str = "".join(rnd.choice(GRADES) for _ in range(count))
+        picked: List[str] = [rnd.choice(subjects) for _ in range(count)]
+        return f"I got {grades} in {', '.join(picked[:-1])} and {picked[-1]}"
+
+    # enddef
+
+    def colon() -> str:
+        pairs: List[str] = [f"{rnd.choice(subjects)}: {rnd.choice(GRADES)}" for _ in range(rnd.randint(2, 4))]
+        return ", ".join(pairs)
+
+    # enddef
+
+    def dropped() -> str:
+        return (f"{rnd.choice(GRADES)} in {rnd.choice(subjects)}, {rnd.choice(GRADES)} in {rnd.choice(subjects)} "
+                f"and {rnd.choice(SYNONYMS['dropped'])} {rnd.choice(subjects)}")
+
+    # enddef
+
+    def interest() -> str:
+        return (f"{rnd.choice(GRADES)} in {rnd.choice(subjects)}, "
+                f"{rnd.choice(SYNONYMS['interest'])} {rnd.choice(courses)}")
+
+    # enddef
+
+    def long() -> str:
+        # A few sentences of everything, like a pasted personal statement
+        parts: List[str] = [rnd.choice([multi_grade, colon, dropped, interest])() for _ in range(rnd.randint(4, 8))]
+        return ". ".join(parts) + "."
+
+    # enddef
+
+    makers: Dict[str, Callable[[], str]] = {
+        "multi_grade": multi_grade,
+        "colon": colon,
+        "dropped": dropped,
+        "interest": interest,
+        "long": long,
+    }
+
+    kinds: List[str] = list(mix)
+    weights: List[float] = [mix[kind] for kind in kinds]
+
+    corpus: List[str] = []
+    for _ in range(size):
+        kind: str = rnd.choices(kinds, weights=weights)[0]
+        corpus.append(makers[kind]())
+    # endfor
+
+    return corpus
+
+
+# enddef
+
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    """
+    Gets a percentile from already sorted values (nearest rank).
+
+    :param sorted_values: Values sorted from smallest to largest
+    :param percent: Percentile to get, 0 to 100
+    :return: The value at that percentile, 0 if there are no values
+    """
+
+    if not sorted_values:
+        return 0.0
+    # endif
+
+    index: int = max(0, min(len(sorted_values) - 1, int(round(percent / 100 * len(sorted_values))) - 1))
+
+    return sorted_values[index]
+
+
+# enddef
+
+
+def time_stage(stage: Callable[[str], object], corpus: List[str], repeat: int = 1) -> Dict[str, float]:
+    """
+    Times one parser stage on every input in the corpus.
+
+    :param stage: Function that takes one input string
+    :param corpus: Inputs to run it on
+    :param repeat: How many times to go over the corpus
+    :return: Dictionary with calls, ops_per_sec, mean_us, p50_us and p99_us
+    """
+
+    timings: List[float] = []
+
+    for _ in range(repeat):
+        for text in corpus:
+            start: int = time.perf_counter_ns()
+            stage(text)
+            timings.append((time.perf_counter_ns() - start) / 1000)
+        # endfor
+    # endfor
+
+    timings.sort()
+    total_us: float = sum(timings)
+
+    return {
+        "calls": len(timings),
+        "ops_per_sec": len(timings) / (total_us / 1_000_000) if total_us else 0.0,
+        "mean_us": total_us / len(timings) if timings else 0.0,
+        "p50_us": percentile(timings, 50),
+        "p99_us": percentile(timings, 99),
+    }
+
+
+# enddef
+
+
+def run_benchmarks(size: int = 1000, mix: Dict[str, float] | None = None, seed: int = 0,
+                   repeat: int = 1, engine: str = "grammar") -> Dict:
+    """
+    Generates a corpus and times every parser stage on it.
+
+    :param size: Number of inputs in the corpus
+    :param mix: Dictionary of input kind to weight, defaults to DEFAULT_MIX
+    :param seed: Random seed for the corpus
+    :param repeat: How many times to go over the corpus per stage
+    :param engine: Grade engine for the parser ("grammar" or "regex")
+    :return: Dictionary with the run settings and the timings of each stage
+    """
+
+    corpus: List[str] = generate_corpus(size, mix, seed)
+    parser = GradeParser(engine=engine)
+
+    # Warm up once so loading the synonyms isn't counted in the first stage
+    parser.parse(corpus[0] if corpus else "").evaluate()
+
+    functions: Dict[str, Callable[[str], object]] = {name: getattr(parser, name) for name in STAGES}
+    # parse only works the fields out when they are used
+    functions["parse"] = lambda text: parser.parse(text).evaluate()
+
+    stages: Dict[str, Dict[str, float]] = {}
+    for name in STAGES:
+        stages[name] = time_stage(functions[name], corpus, repeat)
+    # endfor
+
+    return {
+        "settings": {
+            "size": size,
+            "mix": mix or DEFAULT_MIX,
+            "seed": seed,
+            "repeat": repeat,
+            "engine": engine,
+            "python": platform.python_version(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "stages": stages,
+    }
+
+
+# enddef
+
+
+def run_adversarial(max_size: int = 32000, engines: List[str] | None = None, repeat: int = 3) -> Dict:
+    """
+    Times parsing each adversarial input (see ADVERSARIAL_INPUTS) at sizes doubling from 1000 characters,
+    to check that parse time only grows linearly with the length of the input.
+
+    :param max_size: Largest input size in characters
+    :param engines: Grade engines to time, defaults to all of them
+    :param repeat: Parses of each input, the fastest one counts
+    :return: Dictionary with the settings and, for each engine and input, the milliseconds taken at each size
+        and the growth (time at one size / time at half the size, about 2 if linear and 4 if quadratic)
+    """
+
+    sizes: List[int] = []
+    size: int = 1000
+    while size <= max_size:
+        sizes.append(size)
+        size *= 2
+    # endwhile
+
+    results: Dict[str, Dict[str, Dict]] = {}
+
+    for engine in engines or GradeParser.ENGINES:
+        parser = GradeParser(engine=engine)
+        parser.parse("").evaluate()
+
+        results[engine] = {}
+        for name, make_input in ADVERSARIAL_INPUTS.items():
+            times_ms: List[float] = []
+            for size in sizes:
+                text: str = make_input(size)
+                best: float = float("inf")
+                for _ in range(repeat):
+                    start: float = time.perf_counter()
+                    parser.parse(text).evaluate()
+                    best = min(best, time.perf_counter() - start)
+                # endfor
+                times_ms.append(best * 1000)
+            # endfor
+
+            growth: List[float] = [new / old if old else 0.0 for old, new in zip(times_ms, times_ms[1:])]
+            results[engine][name] = {"ms": times_ms, "growth": growth}
+        # endfor
+    # endfor
+
+    return {
+        "settings": {"sizes": sizes, "repeat": repeat, "python": platform.python_version()},
+        "engines": results,
+    }
+
+
+# enddef
+
+
+def compare(before: Dict, after: Dict) -> List[str]:
+    """
+    Compares two benchmark results stage by stage.
+
+    :param before: Result from run_benchmarks (the baseline)
+    :param after: Result from run_benchmarks (the new run)
+    :return: Lines of a text table with ops/sec and p99 for both runs and the speedup
+    """
+
+    lines: List[str] = [
+        f"{'stage':<24}{'before ops/s':>14}{'after ops/s':>14}{'speedup':>10}{'before p99':>13}{'after p99':>13}"
+    ]
+
+    for name in STAGES:
+        if name not in before["stages"] or name not in after["stages"]:
+            continue
+        # endif
+
+        old: Dict[str, float] = before["stages"][name]
+        new: Dict[str, float] = after["stages"][name]
+        speedup: float = new["ops_per_sec"] / old["ops_per_sec"] if old["ops_per_sec"] else 0.0
+
+        lines.append(f"{name:<24}{old['ops_per_sec']:>14.1f}{new['ops_per_sec']:>14.1f}{speedup:>9.2f}x"
+                     f"{old['p99_us']:>11.1f}us{new['p99_us']:>11.1f}us")
+    # endfor
+
+    return lines
+
+
+# enddef
+
+
+def read_process_memory() -> Dict[str, int]:
+    """
+    Reads how much memory this process uses (Linux only).
+
+    :return: Dictionary with rss_kb, pss_kb (shared pages split between the processes sharing them),
+        private_kb (pages only this process has, e.g. ones copied after a fork) and shared_kb
+    """
+
+    fields: Dict[str, int] = {}
+
+    with open("/proc/self/smaps_rollup") as smaps:
+        for line in smaps:
+            name, _, value = line.partition(":")
+            if value.strip().endswith("kB"):
+                fields[name] = int(value.split()[0])
+            # endif
+        # endfor
+    # endwith
+
+    return {
+        "rss_kb": fields.get("Rss", 0),
+        "pss_kb": fields.get("Pss", 0),
+        "private_kb": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "shared_kb": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+    }
+
+
+# enddef
+
+
+def measure_worker_memory(workers: int = 4, size: int = 1000, freeze: bool = True, seed: int = 0) -> Dict:
+    """
+    Measures how much memory each forked worker needs of its own, like gunicorn workers forked from
+    a master that preloaded the app. The lexicon is loaded before forking, then each worker parses a corpus
+    and reports its memory. Linux only.
+
+    :param workers: Number of workers to fork, one at a time
+    :param size: Number of inputs each worker parses
+    :param freeze: Call freeze_lexicon before forking, as a preloading master should
+    :param seed: Random seed for the corpus
+    :return: Dictionary with the settings, the parent's memory and the memory of each worker (see read_process_memory)
+    """
+
+    corpus: List[str] = generate_corpus(size, seed=seed)
+
+    parser = GradeParser()
+    parser.parse(corpus[0] if corpus else "").evaluate()
+
+    if freeze:
+        freeze_lexicon()
+    # endif
+
+    worker_memory: List[Dict[str, int]] = []
+
+    for _ in range(workers):
+        read_end, write_end = os.pipe()
+        pid: int = os.fork()
+
+        if pid == 0:
+            # the worker: parse everything, collect like a long running worker would, and report back
+            os.close(read_end)
+            try:
+                for text in corpus:
+                    parser.parse(text).evaluate()
+                # endfor
+                gc.collect()
+                os.write(write_end, json.dumps(read_process_memory()).encode())
+            finally:
+                os._exit(0)
+            # endtry
+        # endif
+
+        os.close(write_end)
+        with os.fdopen(read_end, "rb") as reader:
+            report: bytes = reader.read()
+        # endwith
+        os.waitpid(pid, 0)
+
+        worker_memory.append(json.loads(report))
+    # endfor
+
+    if freeze:
+        gc.unfreeze()
+    # endif
+
+    return {
+        "settings": {"workers": workers, "size": size, "freeze": freeze, "seed": seed,
+                     "python": platform.python_version()},
+        "parent": read_process_memory(),
+        "workers": worker_memory,
+    }
+
+
+# enddef
+
+
+def parse_mix(values: List[str]) -> Dict[str, float]:
+    """
+    Reads the --mix command line values.
+
+    :param values: Strings like "dropped=2" or "long=0.5"
+    :return: Dictionary of input kind to weight
+    """
+
+    mix: Dict[str, float] = {}
+
+    for value in values:
+        kind, _, weight = value.partition("=")
+        mix[kind.strip()] = float(weight) if weight else 1.0
+    # endfor
+
+    return mix
+
+
+# enddef
+
+
+def main(argv: List[str] | None = None) -> int:
+    """
+    Command line entry point.
+
+    :param argv: Command line arguments, defaults to sys.argv
+    :return: Exit code
+    """
+
+    arg_parser = argparse.ArgumentParser(description="Benchmark each stage of the grade parser")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    run_command = commands.add_parser("run", help="run the benchmarks and save the results")
+    run_command.add_argument("--size", type=int, default=1000, help="number of inputs to generate")
+    run_command.add_argument("--seed", type=int, default=0, help="random seed for the corpus")
+    run_command.add_argument("--repeat", type=int, default=1, help="times to go over the corpus per stage")
+    run_command.add_argument("--mix", nargs="*", default=[],
+                             help=f"input kinds and weights, e.g. long=2 dropped=1 (kinds: {', '.join(DEFAULT_MIX)})")
+    run_command.add_argument("--engine", choices=GradeParser.ENGINES, default="grammar",
+                             help="grade engine to benchmark")
+    run_command.add_argument("--output", help="file to write the results to as JSON")
+
+    memory_command = commands.add_parser("memory", help="measure the memory of workers forked after loading the lexicon")
+    memory_command.add_argument("--workers", type=int, default=4, help="number of workers to fork")
+    memory_command.add_argument("--size", type=int, default=1000, help="number of inputs each worker parses")
+    memory_command.add_argument("--no-freeze", action="store_true", help="don't freeze the lexicon before forking")
+    memory_command.add_argument("--output", help="file to write the results to as JSON")
+
+    adversarial_command = commands.add_parser("adversarial",
+                                              help="check parse time grows linearly on inputs made to backtrack")
+    adversarial_command.add_argument("--max-size", type=int, default=32000, help="largest input size in characters")
+    adversarial_command.add_argument("--engine", choices=GradeParser.ENGINES, action="append",
+                                     help="grade engine to time, can be repeated (default: all)")
+    adversarial_command.add_argument("--repeat", type=int, default=3, help="parses of each input, the fastest counts")
+    adversarial_command.add_argument("--output", help="file to write the results to as JSON")
+
+    compare_command = commands.add_parser("compare", help="compare two saved results")
+    compare_command.add_argument("before", help="baseline results file")
+    compare_command.add_argument("after", help="new results file")
+
+    args = arg_parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.before) as before_file, open(args.after) as after_file:
+            lines: List[str] = compare(json.load(before_file), json.load(after_file))
+        # endwith
+        print("\n".join(lines))
+        return 0
+    # endif
+
+    if args.command == "memory":
+        memory: Dict = measure_worker_memory(args.workers, args.size, not args.no_freeze)
+
+        print(f"parent  rss {memory['parent']['rss_kb']:>8} kB")
+        for number, worker in enumerate(memory["workers"], start=1):
+            print(f"worker {number} rss {worker['rss_kb']:>8} kB   private {worker['private_kb']:>8} kB"
+                  f"   pss {worker['pss_kb']:>8} kB")
+        # endfor
+
+        if args.output:
+            with open(args.output, "w") as output_file:
+                json.dump(memory, output_file, indent=2)
+            # endwith
+        # endif
+
+        return 0
+    # endif
+
+    if args.command == "adversarial":
+        adversarial: Dict = run_adversarial(args.max_size, args.engine, args.repeat)
+
+        sizes: List[int] = adversarial["settings"]["sizes"]
+        print(f"{'engine':<9}{'input':<14}" + "".join(f"{size:>10}" for size in sizes) + f"{'max growth':>12}")
+        for engine, inputs in adversarial["engines"].items():
+            for name, timing in inputs.items():
+                print(f"{engine:<9}{name:<14}" + "".join(f"{ms:>8.1f}ms" for ms in timing["ms"])
+                      + f"{max(timing['growth'], default=0.0):>11.2f}x")
+            # endfor
+        # endfor
+
+        if args.output:
+            with open(args.output, "w") as output_file:
+                json.dump(adversarial, output_file, indent=2)
+            # endwith
+        # endif
+
+        return 0
+    # endif
+
+    results: Dict = run_benchmarks(args.size, parse_mix(args.mix) or None, args.seed, args.repeat, args.engine)
+
+    for name, timing in results["stages"].items():
+        print(f"{name:<24}{timing['ops_per_sec']:>12.1f} ops/s   p50 {timing['p50_us']:>9.1f}us"
+              f"   p99 {timing['p99_us']:>9.1f}us")
+    # endfor
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+        # endwith
+    # endif
+
+    return 0
+
+
+# enddef
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+# endif
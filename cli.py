@@ -0,0 +1,274 @@
+"""
+Command line tool for parsing a lot of inputs at once, e.g. a database export.
+
+Reads one input per line (plain text or JSONL) from a file or stdin and writes one JSON result per line
+to stdout, in the same order. Lines are streamed through the parser so big files are never loaded into
+memory. Works without Django, using the hardcoded synonyms.
+
+Run it as a module from the project root, e.g.
+    python -m mysite.apps.nlp parse export.jsonl --field answer --workers 4 > parsed.jsonl
+    cat answers.txt | python -m mysite.apps.nlp parse > parsed.jsonl
+"""
+import argparse
+import itertools
+import json
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, TextIO, Tuple
+
+from .grade_parser import GradeParser
+from .instrumentation import StageStats
+from .lexicon_snapshot import lexicon_fingerprint, read_fixture_rows, save_snapshot
+from .metrics import MetricsExporter
+from .parse_result import ParseResult
+from .parser_utils import build_combined_synonyms
+
+# Ways each input line can be read
+FORMATS: List[str] = ["auto", "jsonl", "lines"]
+
+
+def read_records(lines: Iterable[str], format: str = "auto", field: str = "text") -> Iterator[Tuple[Dict, str | None]]:
+    """
+    Turns input lines into records and the text to parse from each one. Blank lines are skipped.
+
+    :param lines: Input lines (e.g. an open file)
+    :param format: "jsonl" if every line is JSON, "lines" if every line is plain text,
+        "auto" to read lines starting with "{" as JSON and the rest as plain text
+    :param field: Key of the text to parse in JSON objects
+    :return: Iterator of (record, text) pairs. The record is the JSON object, or {field: line} for plain text.
+        If the text can't be found the record has an "error" and the text is None.
+    """
+
+    for number, line in enumerate(lines, start=1):
+        line: str = line.rstrip("\r\n")
+
+        if not line.strip():
+            continue
+        # endif
+
+        if format == "lines" or (format == "auto" and not line.lstrip().startswith("{")):
+            yield {field: line}, line
+            continue
+        # endif
+
+        try:
+            value = json.loads(line)
+        except ValueError as e:
+            yield {"line": number, "error": f"invalid JSON: {e}"}, None
+            continue
+        # endtry
+
+        # A bare JSON string is the text itself
+        if isinstance(value, str):
+            yield {field: value}, value
+        elif isinstance(value, dict) and isinstance(value.get(field), str):
+            yield value, value[field]
+        else:
+            yield {"line": number, "error": f"no {field!r} string to parse"}, None
+        # endif
+    # endfor
+
+
+# enddef
+
+
+def parse_records(parser: GradeParser, records: Iterable[Tuple[Dict, str | None]], output_field: str = "parsed",
+                  workers: int | None = 1, chunksize: int = 64) -> Iterator[Tuple[Dict, bool]]:
+    """
+    Parses the text of each record and yields the records with their results added, in order.
+    Records with an error are passed through without being parsed.
+
+    :param parser: Parser to use
+    :param records: (record, text) pairs from read_records
+    :param output_field: Key the parse result is stored under in each record
+    :param workers: Number of worker processes, 1 parses everything in this process
+    :param chunksize: How many inputs each worker gets at a time
+    :return: Iterator of (output record, whether it was parsed) pairs
+    """
+
+    # Two views of the same stream, one feeding the parser and one pairing its results back up
+    # with their records. Only the records being parsed are buffered between them.
+    for_parser, for_output = itertools.tee(records)
+
+    texts: Iterator[str] = (text for record, text in for_parser if text is not None)
+    results: Iterator[ParseResult] = parser.parse_stream(texts, workers=workers, chunksize=chunksize)
+
+    for record, text in for_output:
+        if text is not None:
+            record: Dict = dict(record)
+            record[output_field] = next(results).to_dict()
+        # endif
+
+        yield record, text is not None
+    # endfor
+
+
+# enddef
+
+
+def report(stderr: TextIO, count: int, errors: int, started: float) -> None:
+    """
+    Writes how far the run has got and how fast it is going.
+
+    :param stderr: Where to write it
+    :param count: Records written so far
+    :param errors: Records that couldn't be parsed so far
+    :param started: time.perf_counter() when the run started
+    """
+
+    elapsed: float = time.perf_counter() - started
+    rate: float = count / elapsed if elapsed > 0 else 0.0
+
+    print(f"{count} records ({errors} errors) in {elapsed:.1f}s, {rate:.1f} records/s", file=stderr)
+
+
+# enddef
+
+
+def run_parse(args: argparse.Namespace, stdin: TextIO, stdout: TextIO, stderr: TextIO) -> int:
+    """
+    Runs the parse command.
+
+    :param args: Parsed command line arguments
+    :param stdin: Input stream used when no input file is given (or it is "-")
+    :param stdout: Where the output records go
+    :param stderr: Where the stats go
+    :return: Exit code
+    """
+
+    stats: StageStats | None = StageStats() if args.metrics else None
+    parser = GradeParser(engine=args.engine, timing_hook=stats, timing_sample=args.metrics_sample)
+    exporter = MetricsExporter(stats) if args.metrics else None
+
+    input_file: TextIO = stdin if args.input == "-" else open(args.input, encoding="utf-8")
+
+    count: int = 0
+    errors: int = 0
+    started: float = time.perf_counter()
+
+    try:
+        records = read_records(input_file, args.format, args.field)
+
+        for record, parsed in parse_records(parser, records, args.output_field, args.workers, args.chunksize):
+            stdout.write(json.dumps(record, ensure_ascii=False))
+            stdout.write("\n")
+
+            count += 1
+            if not parsed:
+                errors += 1
+            # endif
+
+            if args.progress and count % args.progress == 0:
+                report(stderr, count, errors, started)
+                if exporter is not None:
+                    exporter.write(args.metrics)
+                # endif
+            # endif
+        # endfor
+    finally:
+        if input_file is not stdin:
+            input_file.close()
+        # endif
+    # endtry
+
+    stdout.flush()
+    report(stderr, count, errors, started)
+    if exporter is not None:
+        exporter.write(args.metrics)
+    # endif
+
+    return 0
+
+
+# enddef
+
+
+def run_build_lexicon(args: argparse.Namespace, stdout: TextIO, stderr: TextIO) -> int:
+    """
+    Runs the build-lexicon command.
+
+    :param args: Parsed command line arguments
+    :param stdout: Where the snapshot path goes
+    :param stderr: Where the stats go
+    :return: Exit code
+    """
+
+    started: float = time.perf_counter()
+
+    rows = read_fixture_rows(args.fixtures)
+    fingerprint: str = lexicon_fingerprint(rows)
+    path: str | None = save_snapshot(args.output, build_combined_synonyms(rows), fingerprint)
+
+    if path is None:
+        print(f"Couldn't write a snapshot to {args.output}", file=stderr)
+        return 1
+    # endif
+
+    print(path, file=stdout)
+    print(f"{len(rows.courses)} courses and {len(rows.subjects)} subjects, fingerprint {fingerprint[:12]}, "
+          f"built in {time.perf_counter() - started:.2f}s", file=stderr)
+
+    return 0
+
+
+# enddef
+
+
+def main(argv: List[str] | None = None, stdin: TextIO | None = None, stdout: TextIO | None = None,
+         stderr: TextIO | None = None) -> int:
+    """
+    Command line entry point.
+
+    :param argv: Command line arguments, defaults to sys.argv
+    :param stdin: Defaults to sys.stdin
+    :param stdout: Defaults to sys.stdout
+    :param stderr: Defaults to sys.stderr
+    :return: Exit code
+    """
+
+    arg_parser = argparse.ArgumentParser(prog="python -m mysite.apps.nlp",
+                                         description="Command line tools for the grade parser")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    parse_command = commands.add_parser("parse", help="parse one input per line and write the results as JSONL")
+    parse_command.add_argument("input", nargs="?", default="-", help="input file, - (default) reads stdin")
+    parse_command.add_argument("--format", choices=FORMATS, default="auto",
+                               help="jsonl, plain lines, or auto (lines starting with { are JSON)")
+    parse_command.add_argument("--field", default="text", help="key of the text to parse in JSON objects")
+    parse_command.add_argument("--output-field", default="parsed", help="key to store the parse result under")
+    parse_command.add_argument("--engine", choices=GradeParser.ENGINES, default="grammar", help="grade engine")
+    parse_command.add_argument("--workers", type=int, default=1,
+                               help="worker processes, 0 uses one per CPU (default 1)")
+    parse_command.add_argument("--chunksize", type=int, default=256, help="inputs sent to a worker at a time")
+    parse_command.add_argument("--progress", type=int, default=0,
+                               help="write stats to stderr every this many records (default only at the end)")
+    parse_command.add_argument("--metrics", metavar="FILE",
+                               help="also write parser metrics in the Prometheus text format to this file, "
+                                    "with the stats (stages of inputs parsed in worker processes aren't timed)")
+    parse_command.add_argument("--metrics-sample", type=int, default=1, metavar="N",
+                               help="only time one in N parser stage runs for --metrics (default all of them)")
+
+    build_command = commands.add_parser("build-lexicon",
+                                        help="build a lexicon snapshot from a fixtures dump (see lexicon_snapshot.py)")
+    build_command.add_argument("fixtures", help="dumpdata output (json or jsonl) with the Course and SubjectRequirement rows")
+    build_command.add_argument("--output", required=True, help="snapshot directory, as in NLP_LEXICON_SNAPSHOT_DIR")
+
+    args = arg_parser.parse_args(argv)
+
+    if args.command == "build-lexicon":
+        return run_build_lexicon(args, stdout or sys.stdout, stderr or sys.stderr)
+    # endif
+
+    if args.workers == 0:
+        args.workers = None
+    # endif
+
+    return run_parse(args, stdin or sys.stdin, stdout or sys.stdout, stderr or sys.stderr)
+
+
+# enddef
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+# endif
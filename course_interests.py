@@ -1,8 +1,8 @@
 """
 Parse course interests from natural language input
 """
-import re
 from typing import Dict, List
+from .matchers import find_tails
 from .parser_utils import get_synonyms
 
 
@@ -25,35 +25,31 @@ def parse_interests(input_text: str) -> Dict[str, List[str]]:
     text = input_text.lower()
     synonyms = get_synonyms()
 
-    # check for interest phrases
-    interest_phrases = synonyms.get("interest", [])
+    # pattern to find course after any interest phrase
+    interest_pattern = synonyms["phrase_patterns"]["interest_tail"]
     courses_dict = synonyms.get("courses", {})
 
     # look for "interested in X", "want to study Y", etc
-    for phrase in interest_phrases:
-        # pattern to find course after interest phrase
-        pattern = rf"{phrase}\s+([a-z\s]+)"
-        matches = re.findall(pattern, text)
-
-        for match in matches:
-            course_name = match.strip()
-
-            # check if it's a known course
-            for main_course, aliases in courses_dict.items():
-                if course_name in aliases or course_name == main_course:
-                    if main_course not in result["interests"]:
-                        result["interests"].append(main_course)
-                    # endif
-                    break
+    matches = [text[start:end] for start, end in find_tails(interest_pattern, text)]
+
+    for match in matches:
+        course_name = match.strip()
+
+        # check if it's a known course
+        for main_course, aliases in courses_dict.items():
+            if course_name in aliases or course_name == main_course:
+                if main_course not in result["interests"]:
+                    result["interests"].append(main_course)
                 # endif
-                # also check partial matches
-                elif any(alias in course_name for alias in aliases):
-                    if main_course not in result["interests"]:
-                        result["interests"].append(main_course)
-                    # endif
-                    break
+                break
+            # endif
+            # also check partial matches
+            elif any(alias in course_name for alias in aliases):
+                if main_course not in result["interests"]:
+                    result["interests"].append(main_course)
                 # endif
-            # endfor
+                break
+            # endif
         # endfor
     # endfor
 
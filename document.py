@@ -0,0 +1,160 @@
+"""
+One user input, with the forms of it the parser stages work on made once and shared between them
+"""
+from typing import List, Mapping, Tuple
+
+from .grade_grammar import Token, tokenize
+from .matchers import find_sentences
+from .parser_utils import get_synonyms
+
+
+def clean_text(text: str) -> str:
+    """
+    Cleans and standardizes the user input by converting to lowercase, removing unnecessary
+    words such as 'and' or 'commas' and stripping extra whitespace.
+
+    :param text: Raw user input describing subjects, grades, and additional info.
+    :return: Cleaned and normalized input string.
+    """
+
+    # Replace 'and' with ',' for easier splitting, lowercase the whole string, strip extra spaces
+    text = text.replace(" and ", ",").lower().strip()
+    parts: list[str] = text.split(",")
+
+    clean_parts: list[str] = []
+
+    # Remove empty or whitespace-only parts
+    for p in parts:
+        if p.strip():
+            clean_parts.append(p.strip())
+        # endif
+    # endfor
+
+    # Join the cleaned parts back together, comma separated
+    return ", ".join(clean_parts)
+
+
+# enddef
+
+
+class Document:
+    """
+    A user input and the forms of it that the parser stages look at: the lowercase text, the cleaned text
+    (see clean_text), the grammar tokens (with their offsets in the input) and where its sentences are.
+    Each form is made the first time a stage asks for it and then shared, so one parse lowercases,
+    cleans and tokenizes the input once however many stages use it.
+
+    Every stage looks things up in the document's synonyms, which are fixed the first time they are used
+    (or when the document is made), so a document parsed bit by bit while the synonyms are refreshed
+    is still parsed with one version of them all the way through.
+    """
+
+    __slots__ = ("text", "_synonyms", "_lower", "_cleaned", "_tokens", "_sentences")
+
+    def __init__(self, text: str, synonyms: Mapping | None = None):
+        """
+        :param text: Raw user input
+        :param synonyms: Lexicon to parse the input with (see get_synonyms), None takes the current one when it is
+            first needed
+        """
+
+        self.text: str = text
+        self._synonyms: Mapping | None = synonyms
+        self._lower: str | None = None
+        self._cleaned: str | None = None
+        self._tokens: List[Token] | None = None
+        self._sentences: List[Tuple[int, int]] | None = None
+
+    # enddef
+
+    @property
+    def synonyms(self) -> Mapping:
+        """
+        :return: Lexicon the input is parsed with
+        """
+
+        if self._synonyms is None:
+            self._synonyms = get_synonyms()
+        # endif
+
+        return self._synonyms
+
+    # enddef
+
+    @property
+    def lower(self) -> str:
+        """
+        :return: The input in lowercase
+        """
+
+        if self._lower is None:
+            self._lower = self.text.lower()
+        # endif
+
+        return self._lower
+
+    # enddef
+
+    @property
+    def cleaned(self) -> str:
+        """
+        :return: The input cleaned by clean_text (lowercase, "and" turned into commas, blank parts removed)
+        """
+
+        if self._cleaned is None:
+            self._cleaned = clean_text(self.text)
+        # endif
+
+        return self._cleaned
+
+    # enddef
+
+    @property
+    def tokens(self) -> List[Token]:
+        """
+        :return: Grammar tokens of the input (see tokenize), made with the document's synonyms
+        """
+
+        if self._tokens is None:
+            self._tokens = tokenize(self.text, self.synonyms["grammar"])
+        # endif
+
+        return self._tokens
+
+    # enddef
+
+    @property
+    def sentences(self) -> List[Tuple[int, int]]:
+        """
+        :return: (start, end) of each sentence of the input (see find_sentences), split where the document's
+            synonyms allow, so no rule of the parser looks from one sentence into another
+        """
+
+        if self._sentences is None:
+            self._sentences = find_sentences(self.synonyms["sentence_pattern"], self.text)
+        # endif
+
+        return self._sentences
+
+    # enddef
+
+    @property
+    def case_matters(self) -> bool:
+        """
+        :return: False if the whole input is in capitals, so capitals don't show what is a grade
+        """
+        return self.text != self.text.upper()
+    # enddef
+
+
+# endclass
+
+
+def as_document(input: "str | Document", synonyms: Mapping | None = None) -> Document:
+    """
+    :param input: User input, or a Document already made for it
+    :param synonyms: Lexicon for a new document (see Document), a Document given keeps its own
+    :return: Document for the input
+    """
+    return input if isinstance(input, Document) else Document(input, synonyms)
+# enddef
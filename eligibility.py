@@ -0,0 +1,329 @@
+"""
+Matching parsed grades against every course's grade requirements (the SubjectRequirement rows) at once.
+
+    table = RequirementTable(read_requirement_rows())
+    matches = table.match(parser.parse(text), k=10)
+
+The requirements are compiled once into arrays with one row per course and one column per subject
+(the parser's main subject names), so each applicant is compared against every course in one pass
+instead of a Python loop per course. NumPy is used when it is installed (it is an optional dependency,
+see requirements-optional.txt); without it the same comparison runs over the compiled rows in plain Python
+and gives the same matches.
+"""
+from typing import Dict, Hashable, Iterable, List, Mapping, NamedTuple, Tuple
+
+from .parser_utils import get_synonyms
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+# endtry
+
+# A-level grades from worst to best. A requirement or grade's ordinal is its place in this list plus one,
+# so 0 means no grade (the subject wasn't taken, or isn't required)
+GRADE_ORDER: Tuple[str, ...] = ("U", "E", "D", "C", "B", "A", "A*")
+GRADE_ORDINALS: Dict[str, int] = {grade: ordinal for ordinal, grade in enumerate(GRADE_ORDER, 1)}
+
+# UCAS tariff points of each A-level grade
+TARIFF_POINTS: Dict[str, int] = {"A*": 56, "A": 48, "B": 40, "C": 32, "D": 24, "E": 16, "U": 0}
+
+# Fields of the SubjectRequirement rows the requirements are read from
+REQUIREMENT_FIELDS: Tuple[str, str, str] = ("course", "subject", "grade")
+
+# Most applicant x course x subject cells compared in one go by match_many, to bound the memory used
+MAX_BATCH_CELLS: int = 1 << 24
+
+# Number of set bits in each byte, for counting the missing subjects in the packed bitsets
+_POPCOUNT = numpy.array([bin(byte).count("1") for byte in range(256)], dtype=numpy.uint8) \
+    if numpy is not None else None
+
+
+class CourseMatch(NamedTuple):
+    """
+    How one applicant's grades compare to one course's requirements.
+
+    missing is how many required subjects the applicant has no A-level grade in.
+    shortfall is how many grades short the applicant is, added up over the required subjects
+    (a missing subject is short by the whole required grade, e.g. 6 for a required A).
+    tariff_shortfall is how many UCAS tariff points short of the course's minimum the applicant is.
+    """
+    course: Hashable
+    eligible: bool
+    missing: int
+    shortfall: int
+    tariff_shortfall: int
+
+
+# endclass
+
+
+def grade_ordinal(grade: str | None) -> int:
+    """
+    :param grade: Grade, e.g. "A*" or "b"
+    :return: Ordinal of the grade (see GRADE_ORDER), 0 for no grade or a grade that isn't an A-level grade
+    """
+    return GRADE_ORDINALS.get((grade or "").strip().upper(), 0)
+
+
+# enddef
+
+
+def read_requirement_rows() -> List[Tuple[Hashable, str, str]]:
+    """
+    Reads every subject requirement from the database.
+
+    :return: List of (course primary key, subject, grade), empty if Django or the database isn't available
+    """
+
+    try:
+        from django.apps import apps
+
+        if apps.ready:
+            from mysite.apps.coursefinder.models import SubjectRequirement
+
+            course_field, subject_field, grade_field = REQUIREMENT_FIELDS
+            return list(SubjectRequirement.objects.values_list(f"{course_field}_id", subject_field, grade_field))
+        # endif
+
+    except Exception:
+        pass
+    # endtry
+
+    return []
+
+
+# enddef
+
+
+class RequirementTable:
+    """
+    Every course's grade requirements, compiled for comparing applicants against all of them at once.
+
+    For each course it keeps the lowest grade needed in each required subject (the grade ordinal matrix),
+    which subjects are required (packed into one bitset per course) and the minimum tariff points.
+    A course is eligible when the applicant has at least the required grade in every required subject
+    and at least the minimum tariff points.
+
+    Build a new table when the requirements change; a table is never changed once built,
+    so it can be shared between threads.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[Hashable, str, str | None]],
+                 tariffs: Mapping[Hashable, int] | None = None):
+        """
+        :param rows: (course, subject, lowest grade) for each subject requirement. Subjects can be any synonym,
+            a blank grade means any grade in the subject will do, and the highest of repeated rows counts
+        :param tariffs: Course -> minimum UCAS tariff points, for courses that have one
+        """
+
+        subject_index: Dict[str, str] = get_synonyms()["subject_index"]
+        tariffs = tariffs or {}
+
+        # course -> {subject: required ordinal}, in the order the courses come up
+        requirements: Dict[Hashable, Dict[str, int]] = {}
+
+        for course, subject, grade in rows:
+            name: str = subject.lower().strip()
+            name = subject_index.get(name, name)
+
+            ordinal: int = grade_ordinal(grade) if grade and grade.strip() else GRADE_ORDINALS["U"]
+            if grade and grade.strip() and not ordinal:
+                raise ValueError(f"Unknown grade {grade!r} required in {subject!r} for course {course!r}")
+            # endif
+
+            required: Dict[str, int] = requirements.setdefault(course, {})
+            required[name] = max(required.get(name, 0), ordinal)
+        # endfor
+
+        for course in tariffs:
+            requirements.setdefault(course, {})
+        # endfor
+
+        self.courses: Tuple[Hashable, ...] = tuple(requirements)
+        self.subjects: Tuple[str, ...] = tuple(sorted({name for required in requirements.values() for name in required}))
+        self._columns: Dict[str, int] = {name: column for column, name in enumerate(self.subjects)}
+
+        # course row -> ((subject column, required ordinal), ...), used when NumPy isn't installed
+        self._rows: List[Tuple[Tuple[int, int], ...]] = [
+            tuple((self._columns[name], ordinal) for name, ordinal in required.items())
+            for required in requirements.values()
+        ]
+        self._tariffs: List[int] = [int(tariffs.get(course, 0)) for course in self.courses]
+
+        if numpy is not None:
+            self._grade_matrix = numpy.zeros((len(self.courses), len(self.subjects)), dtype=numpy.int8)
+            for row, required in enumerate(self._rows):
+                for column, ordinal in required:
+                    self._grade_matrix[row, column] = ordinal
+                # endfor
+            # endfor
+            self._required_bits = numpy.packbits(self._grade_matrix > 0, axis=1)
+            self._tariff_array = numpy.array(self._tariffs, dtype=numpy.int32)
+        # endif
+
+    # enddef
+
+    def __len__(self) -> int:
+        return len(self.courses)
+
+    # enddef
+
+    def _applicant(self, result: Mapping) -> Tuple[List[int], int]:
+        """
+        :param result: Parse result (or anything with "grades" like it)
+        :return: (grade ordinal in each subject column, tariff points of all the grades)
+        """
+
+        ordinals: List[int] = [0] * len(self.subjects)
+        tariff: int = 0
+
+        for subject, grade in result["grades"].items():
+            grade = grade.strip().upper()
+            tariff += TARIFF_POINTS.get(grade, 0)
+
+            column: int | None = self._columns.get(subject)
+            if column is not None:
+                ordinals[column] = max(ordinals[column], GRADE_ORDINALS.get(grade, 0))
+            # endif
+        # endfor
+
+        return ordinals, tariff
+
+    # enddef
+
+    def match(self, result: Mapping, k: int = 10, eligible_only: bool = False) -> List[CourseMatch]:
+        """
+        Compares one applicant's grades against every course.
+
+        :param result: GradeParser.parse result (or anything with "grades" like it)
+        :param k: Most matches to return
+        :param eligible_only: Only return courses the applicant is eligible for
+        :return: Up to k best matches: eligible courses first, then by fewest missing subjects,
+            then smallest shortfall, then smallest tariff shortfall, then in course order
+        """
+        return self.match_many([result], k, eligible_only)[0]
+
+    # enddef
+
+    def match_many(self, results: Iterable[Mapping], k: int = 10,
+                   eligible_only: bool = False) -> List[List[CourseMatch]]:
+        """
+        Compares many applicants' grades against every course, in batches.
+
+        :param results: GradeParser.parse results (or anything with "grades" like them)
+        :param k: Most matches to return for each applicant
+        :param eligible_only: Only return courses the applicant is eligible for
+        :return: The matches of each applicant (see match), in the order of the results
+        """
+
+        applicants: List[Tuple[List[int], int]] = [self._applicant(result) for result in results]
+
+        if not self.courses or k <= 0:
+            return [[] for _ in applicants]
+        # endif
+
+        if numpy is None:
+            return [self._match_rows(ordinals, tariff, k, eligible_only) for ordinals, tariff in applicants]
+        # endif
+
+        matches: List[List[CourseMatch]] = []
+        batch: int = max(1, MAX_BATCH_CELLS // max(1, len(self.courses) * len(self.subjects)))
+
+        for start in range(0, len(applicants), batch):
+            matches.extend(self._match_arrays(applicants[start:start + batch], k, eligible_only))
+        # endfor
+
+        return matches
+
+    # enddef
+
+    def _match_rows(self, ordinals: List[int], tariff: int, k: int, eligible_only: bool) -> List[CourseMatch]:
+        """
+        match for one applicant without NumPy, one course at a time.
+        """
+
+        found: List[Tuple[Tuple[int, int, int, int], CourseMatch]] = []
+
+        for row, required in enumerate(self._rows):
+            missing: int = 0
+            shortfall: int = 0
+            for column, ordinal in required:
+                have: int = ordinals[column]
+                if not have:
+                    missing += 1
+                # endif
+                if have < ordinal:
+                    shortfall += ordinal - have
+                # endif
+            # endfor
+            tariff_shortfall: int = max(0, self._tariffs[row] - tariff)
+
+            eligible: bool = not (missing or shortfall or tariff_shortfall)
+            if eligible or not eligible_only:
+                found.append(((missing, shortfall, tariff_shortfall, row),
+                              CourseMatch(self.courses[row], eligible, missing, shortfall, tariff_shortfall)))
+            # endif
+        # endfor
+
+        found.sort(key=lambda item: item[0])
+
+        return [match for _, match in found[:k]]
+
+    # enddef
+
+    def _match_arrays(self, applicants: List[Tuple[List[int], int]], k: int,
+                      eligible_only: bool) -> List[List[CourseMatch]]:
+        """
+        match for a batch of applicants with NumPy, every course at once.
+        """
+
+        courses: int = len(self.courses)
+        ordinals = numpy.array([ordinals for ordinals, _ in applicants], dtype=numpy.int8) \
+            .reshape(len(applicants), len(self.subjects))
+        tariffs = numpy.array([tariff for _, tariff in applicants], dtype=numpy.int32)
+
+        # applicant x course x subject grades short, 0 where the subject isn't required
+        short = numpy.maximum(self._grade_matrix[None, :, :] - ordinals[:, None, :], 0)
+        shortfall = short.sum(axis=2, dtype=numpy.int32)
+
+        # required subjects the applicant has no grade in: required bits and not the applicant's bits
+        have_bits = numpy.packbits(ordinals > 0, axis=1)
+        missing = _POPCOUNT[self._required_bits[None, :, :] & ~have_bits[:, None, :]].sum(axis=2, dtype=numpy.int32)
+
+        tariff_shortfall = numpy.maximum(self._tariff_array[None, :] - tariffs[:, None], 0)
+
+        # one sort key per course: missing, then shortfall, then tariff shortfall, then course order
+        shortfall_bound: int = int(self._grade_matrix.sum(axis=1, dtype=numpy.int64).max(initial=0)) + 1
+        tariff_bound: int = int(self._tariff_array.max(initial=0)) + 1
+        score = (missing.astype(numpy.int64) * shortfall_bound + shortfall) * tariff_bound + tariff_shortfall
+        keys = score * courses + numpy.arange(courses, dtype=numpy.int64)[None, :]
+
+        if eligible_only:
+            keys = numpy.where(score == 0, keys, numpy.iinfo(numpy.int64).max)
+        # endif
+
+        take: int = min(k, courses)
+        best = numpy.argpartition(keys, take - 1, axis=1)[:, :take] if take < courses \
+            else numpy.broadcast_to(numpy.arange(courses), keys.shape)
+        best = numpy.take_along_axis(best, numpy.argsort(numpy.take_along_axis(keys, best, axis=1), axis=1), axis=1)
+
+        matches: List[List[CourseMatch]] = []
+        for applicant, rows in enumerate(best.tolist()):
+            applicant_matches: List[CourseMatch] = []
+            for row in rows:
+                if eligible_only and score[applicant, row]:
+                    break
+                # endif
+                applicant_matches.append(CourseMatch(
+                    self.courses[row], not score[applicant, row], int(missing[applicant, row]),
+                    int(shortfall[applicant, row]), int(tariff_shortfall[applicant, row])))
+            # endfor
+            matches.append(applicant_matches)
+        # endfor
+
+        return matches
+    # enddef
+
+
+# endclass
@@ -0,0 +1,434 @@
+"""
+Fuzzy lookup of misspelled subject and course names ("phsyics", "chemestry", "psycology"),
+used after the exact lookups find nothing.
+
+    index = FuzzyIndex(synonyms["subject_index"])
+    index.lookup("phsyics")  # "physics"
+
+It is a SymSpell index: every name is stored under each string made by deleting up to two characters
+from the start of it, so a word only has to be looked up under its own deletions (a few dozen dictionary lookups)
+to find every name within two edits of it, instead of working out the edit distance to every name.
+"""
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Mapping, Set, Tuple
+
+# Most edits (deletions, insertions, substitutions, swaps of two letters next to each other) a name can be away
+MAX_DISTANCE: int = 2
+
+# Only the deletions of the first this many characters of each name are stored, which keeps the index small
+# for long course names. Names that differ further on are still checked with the full edit distance
+PREFIX_LENGTH: int = 7
+
+# Words shorter than this are never corrected, there are too many real words one edit away from short names
+# (e.g. "state" from "stats")
+MIN_WORD_LENGTH: int = 6
+
+# Words at least this long can be two edits away from a name, shorter ones only one
+LONG_WORD_LENGTH: int = 9
+
+# Most lookups whose results each index keeps
+CACHE_SIZE: int = 4096
+
+# Most words of a phrase looked up by find_values_in_tails
+MAX_PHRASE_WORDS: int = 3
+
+# Words of the tails find_values_in_tails looks through
+WORD_PATTERN = re.compile(r"[a-z]+")
+
+
+def allowed_edits(word: str) -> int:
+    """
+    :param word: Word or phrase to correct
+    :return: Most edits a name can be away from it and still count as a correction of it
+    """
+
+    if len(word) < MIN_WORD_LENGTH:
+        return 0
+    # endif
+
+    return 1 if len(word) < LONG_WORD_LENGTH else MAX_DISTANCE
+
+
+# enddef
+
+
+def edit_distance(first: str, second: str, limit: int) -> int:
+    """
+    Works out the edit distance between two strings, counting a swap of two letters next to each other
+    as one edit (the optimal string alignment distance). Stops as soon as it is over the limit.
+
+    :param first: One string
+    :param second: The other string
+    :param limit: Largest distance that matters
+    :return: The distance, or limit + 1 if it is more than the limit
+    """
+
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    # endif
+
+    # typos are in one place, so most of both strings is the same start and end, which costs nothing
+    start: int = 0
+    while start < len(first) and start < len(second) and first[start] == second[start]:
+        start += 1
+    # endwhile
+    end: int = 0
+    while end < len(first) - start and end < len(second) - start and first[-1 - end] == second[-1 - end]:
+        end += 1
+    # endwhile
+    first = first[start:len(first) - end]
+    second = second[start:len(second) - end]
+
+    if not first or not second:
+        return min(len(first) + len(second), limit + 1)
+    # endif
+
+    # only the cells at most limit away from the diagonal can be within the limit
+    over: int = limit + 1
+    previous_previous: List[int] = []
+    previous: List[int] = [j if j <= limit else over for j in range(len(second) + 1)]
+
+    for i in range(1, len(first) + 1):
+        current: List[int] = [i if i <= limit else over] + [over] * len(second)
+        for j in range(max(1, i - limit), min(len(second), i + limit) + 1):
+            cost: int = 0 if first[i - 1] == second[j - 1] else 1
+            distance: int = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and first[i - 1] == second[j - 2] and first[i - 2] == second[j - 1]:
+                distance = min(distance, previous_previous[j - 2] + 1)
+            # endif
+            current[j] = min(distance, over)
+        # endfor
+
+        if min(current) > limit:
+            return over
+        # endif
+
+        previous_previous, previous = previous, current
+    # endfor
+
+    return previous[len(second)]
+
+
+# enddef
+
+
+class LookupCache:
+    """
+    Results of one index's lookups of words that aren't names, and how often they were found in it.
+    """
+
+    __slots__ = ("results", "hits", "misses", "lock")
+
+    def __init__(self):
+        self.results: OrderedDict = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.lock = threading.Lock()
+
+    # enddef
+
+
+# endclass
+
+
+# id of each index -> its lookup cache in this process. The caches are kept out of the indexes, so an index
+# (and the lexicon holding it) is never changed once built and stays shared with the workers forked after it was built.
+# The cache of an index goes when the index does, before its id can be used again
+_lookup_caches: Dict[int, LookupCache] = {}
+_lookup_caches_lock = threading.Lock()
+
+
+def _deletions(word: str, distance: int) -> Set[str]:
+    """
+    :param word: String to delete characters from
+    :param distance: Most characters to delete
+    :return: The word and every string made by deleting up to distance characters from it
+    """
+
+    found: Set[str] = {word}
+    layer: Set[str] = {word}
+
+    for _ in range(distance):
+        layer = {text[:i] + text[i + 1:] for text in layer for i in range(len(text))}
+        found |= layer
+    # endfor
+
+    return found
+
+
+# enddef
+
+
+class FuzzyIndex:
+    """
+    Finds the name closest to a misspelled word, out of a fixed set of names that each stand for a value
+    (e.g. subject aliases and the main subject name they stand for).
+
+    A word is only corrected to a name with the same first letter (typos almost never change it,
+    and it keeps everyday words like "trench" from turning into "french"), and only if every closest name
+    stands for the same value. Results are cached (outside the index, see cache), so each word is only worked out
+    once per process.
+
+    Nothing in the index changes once it is built, so one index can be shared between threads
+    and with forked processes.
+    """
+
+    __slots__ = ("max_words", "_values", "_deletions", "__weakref__")
+
+    def __init__(self, names: Mapping[str, str]):
+        """
+        :param names: Lowercase name -> the value it stands for
+        """
+
+        self._values: Dict[str, str] = dict(names)
+
+        # names with the same start have the same deletions, so each start is only worked out once
+        starts: Dict[str, List[str]] = {}
+        for name in self._values:
+            starts.setdefault(name[:PREFIX_LENGTH], []).append(name)
+        # endfor
+
+        # deletion of the start of a name -> every name it came from
+        deletions: Dict[str, List[str]] = {}
+        for start, start_names in starts.items():
+            for deletion in _deletions(start, MAX_DISTANCE):
+                deletions.setdefault(deletion, []).extend(start_names)
+            # endfor
+        # endfor
+        self._deletions: Dict[str, Tuple[str, ...]] = {deletion: tuple(found) for deletion, found in deletions.items()}
+
+        self.max_words: int = max((len(name.split()) for name in self._values), default=0)
+
+    # enddef
+
+    @property
+    def cache(self) -> LookupCache:
+        """
+        :return: Lookup cache of this index in this process, made the first time it is needed
+        """
+
+        cache: LookupCache | None = _lookup_caches.get(id(self))
+        if cache is None:
+            with _lookup_caches_lock:
+                cache = _lookup_caches.get(id(self))
+                if cache is None:
+                    cache = _lookup_caches[id(self)] = LookupCache()
+                    weakref.finalize(self, _lookup_caches.pop, id(self), None)
+                # endif
+            # endwith
+        # endif
+
+        return cache
+
+    # enddef
+
+    def with_names_changed(self, removed: Iterable[str] = (), added: Mapping[str, str] | None = None) -> "FuzzyIndex":
+        """
+        Makes a copy with some names taken out and some added (or standing for another value),
+        e.g. for courses from the database that were added, renamed or deleted. Only the deletions of those names
+        are worked out, and this index isn't changed.
+
+        :param removed: Names to take out, ones that aren't in the index are left alone
+        :param added: Lowercase name -> the value it stands for, applied after the names are taken out
+        :return: New FuzzyIndex, with an empty cache
+        """
+
+        changed: FuzzyIndex = FuzzyIndex.__new__(FuzzyIndex)
+        changed._values = dict(self._values)
+        changed._deletions = dict(self._deletions)
+        # never goes down, a higher value only means a few more phrases are looked up
+        changed.max_words = self.max_words
+
+        for name in removed:
+            if changed._values.pop(name, None) is None:
+                continue
+            # endif
+
+            for deletion in _deletions(name[:PREFIX_LENGTH], MAX_DISTANCE):
+                found: Tuple[str, ...] = tuple(other for other in changed._deletions[deletion] if other != name)
+                if found:
+                    changed._deletions[deletion] = found
+                else:
+                    del changed._deletions[deletion]
+                # endif
+            # endfor
+        # endfor
+
+        for name, value in (added or {}).items():
+            if name not in changed._values:
+                for deletion in _deletions(name[:PREFIX_LENGTH], MAX_DISTANCE):
+                    changed._deletions[deletion] = changed._deletions.get(deletion, ()) + (name,)
+                # endfor
+                changed.max_words = max(changed.max_words, len(name.split()))
+            # endif
+
+            changed._values[name] = value
+        # endfor
+
+        return changed
+
+    # enddef
+
+    def get(self, name: str) -> str | None:
+        """
+        :param name: Lowercase name
+        :return: Value the name stands for, None if it isn't one of the names (misspellings aren't looked up)
+        """
+        return self._values.get(name)
+
+    # enddef
+
+    def lookup(self, word: str) -> str | None:
+        """
+        :param word: Lowercase word or phrase, e.g. "phsyics"
+        :return: Value of the name it is (or is a misspelling of), None if it isn't close enough to any name
+        """
+
+        value: str | None = self._values.get(word)
+        if value is not None:
+            return value
+        # endif
+
+        edits: int = allowed_edits(word)
+        if not edits:
+            return None
+        # endif
+
+        cache: LookupCache = self.cache
+        with cache.lock:
+            if word in cache.results:
+                cache.results.move_to_end(word)
+                cache.hits += 1
+                return cache.results[word]
+            # endif
+            cache.misses += 1
+        # endwith
+
+        value = self._closest(word, edits)
+
+        with cache.lock:
+            cache.results[word] = value
+            if len(cache.results) > CACHE_SIZE:
+                cache.results.popitem(last=False)
+            # endif
+        # endwith
+
+        return value
+
+    # enddef
+
+    def _closest(self, word: str, edits: int) -> str | None:
+        """
+        :param word: Word that isn't one of the names
+        :param edits: Most edits a name can be away from it
+        :return: Value of the closest names, None if there are none or they stand for different values
+        """
+
+        best: int = edits + 1
+        values: Set[str] = set()
+        checked: Set[str] = set()
+
+        for deletion in _deletions(word[:PREFIX_LENGTH], edits):
+            for name in self._deletions.get(deletion, ()):
+                if name in checked or name[0] != word[0]:
+                    continue
+                # endif
+                checked.add(name)
+
+                distance: int = edit_distance(word, name, edits)
+                if distance > edits:
+                    continue
+                elif distance < best:
+                    best = distance
+                    values = {self._values[name]}
+                elif distance == best:
+                    values.add(self._values[name])
+                # endif
+            # endfor
+        # endfor
+
+        return values.pop() if len(values) == 1 else None
+
+    # enddef
+
+    def find_values_in_tails(self, text: str, tails: List[Tuple[int, int]]) -> List[str]:
+        """
+        Finds the names misspelled in the tails after interest phrases (see matchers.find_tails),
+        trying the longest phrases first at each word.
+
+        :param text: Lowercase text the tails are in
+        :param tails: (start, end) of each tail, in text order
+        :return: List of values of the names found, in order with duplicates removed
+        """
+
+        found: List[str] = []
+        most_words: int = min(self.max_words, MAX_PHRASE_WORDS)
+
+        # tails that end at the same place are parts of one run of words, only the longest one is looked through
+        runs: Dict[int, int] = {}
+        for start, end in tails:
+            runs.setdefault(end, start)
+        # endfor
+
+        for end, start in runs.items():
+            words: List[str] = WORD_PATTERN.findall(text, start, end)
+            i: int = 0
+            while i < len(words):
+                length: int = min(most_words, len(words) - i)
+                while length:
+                    value: str | None = self.lookup(" ".join(words[i:i + length]))
+                    if value is not None:
+                        break
+                    # endif
+                    length -= 1
+                # endwhile
+
+                if length:
+                    if value not in found:
+                        found.append(value)
+                    # endif
+                    i += length
+                else:
+                    i += 1
+                # endif
+            # endwhile
+        # endfor
+
+        return found
+
+    # enddef
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Gets the cache counters of this process.
+
+        :return: Dictionary with hits, misses and the current size of the cache
+        """
+
+        cache: LookupCache = self.cache
+        with cache.lock:
+            return {"hits": cache.hits, "misses": cache.misses, "size": len(cache.results)}
+        # endwith
+
+    # enddef
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    # enddef
+
+    def __getstate__(self) -> tuple:
+        # the cache belongs to this process, a copy starts with its own
+        return self.max_words, self._values, self._deletions
+
+    # enddef
+
+    def __setstate__(self, state: tuple) -> None:
+        self.max_words, self._values, self._deletions = state
+    # enddef
+
+
+# endclass
@@ -0,0 +1,561 @@
+"""
+Single pass tokenizer and grammar for finding subject/grade pairs.
+The input is split into tokens once, then one walk over the tokens picks out the pairs,
+instead of running the input through a chain of regexes that each rebuild the string.
+"""
+import re
+import sys
+from typing import Dict, List, NamedTuple, Tuple
+
+# Letters that can be a grade, A* and D* are the only starred grades
+GRADE_LETTERS: str = "ABCDEUMP"
+STARRED_GRADE_LETTERS: str = "AD"
+
+# Words that join a list of subjects together
+SEPARATORS: set[str] = {",", "and", "&"}
+CONNECTIVES: set[str] = {"and", "in", "is", "&"}
+
+# Words that come before a block of grades with no subjects, like "I got BBB"
+GRADE_TRIGGERS: set[str] = {
+    "got", "get", "have", "achieved", "received", "scored", "predicted", "expecting", "expect", "are", "were"
+}
+
+# Longest unknown phrase that is still taken as a subject name (e.g. "A in underwater basket weaving")
+MAX_UNKNOWN_SUBJECT_WORDS: int = 3
+
+# Words (letters, with ' & . - inside them, and * for grades like A*) and single punctuation marks
+TOKEN_PATTERN = re.compile(r"(?P<word>[^\W\d_](?:[^\W\d_]|\*|[.'&\-](?=[^\W\d_]))*)|(?P<punct>[,.;:!?&\-\n])")
+
+
+class Token(NamedTuple):
+    """
+    One token of the input.
+
+    kind is one of "grade", "subject", "dropped", "connective", "word" or "punct".
+    text is the lowercase text (words joined by spaces for multi-word subjects/phrases).
+    value is the main subject name for "subject" tokens and the tuple of grades for "grade" tokens.
+    upper is True when the token was written in capitals.
+    start and end are the offsets of the token in the input.
+    """
+    kind: str
+    text: str
+    value: object
+    upper: bool
+    start: int
+    end: int
+
+
+# endclass
+
+
+def split_grades(word: str) -> Tuple[str, ...] | None:
+    """
+    Splits a block of grades like "A*AB" into single grades.
+
+    :param word: Word to split
+    :return: Tuple of grades (e.g. ("A*", "A", "B")), or None if the word isn't made of grades
+    """
+
+    word = word.upper()
+    grades: list[str] = []
+    i: int = 0
+
+    while i < len(word):
+        letter: str = word[i]
+
+        if letter not in GRADE_LETTERS:
+            return None
+        # endif
+
+        if i + 1 < len(word) and word[i + 1] == "*":
+            if letter not in STARRED_GRADE_LETTERS:
+                return None
+            # endif
+            grades.append(letter + "*")
+            i += 2
+        else:
+            grades.append(letter)
+            i += 1
+        # endif
+    # endwhile
+
+    return tuple(grades) if grades else None
+
+
+# enddef
+
+
+def _phrase_key(phrase: str) -> Tuple[str, ...]:
+    """
+    Splits a phrase into the same lowercase pieces the tokenizer makes, for looking it up.
+
+    :param phrase: Subject alias or dropped phrase
+    :return: Tuple of lowercase token texts, interned as the same words come up in many phrases
+    """
+    return tuple(sys.intern(match.group().lower()) for match in TOKEN_PATTERN.finditer(phrase))
+
+
+# enddef
+
+
+def build_grammar_tables(synonyms: Dict) -> Dict:
+    """
+    Builds the lookup tables the tokenizer needs from the synonyms.
+
+    :param synonyms: Dictionary with "subject_index" and "dropped", and optionally "subject_fuzzy"
+    :return: Dictionary with:
+        "phrases" - token texts of each subject alias/dropped phrase -> (kind, value)
+        "first_words" - every word a phrase can start with, to skip the lookup for most words
+        "max_words" - most tokens in one phrase
+        "fuzzy" - FuzzyIndex for misspelled subjects, None if the synonyms don't have one
+    """
+
+    phrases: Dict[Tuple[str, ...], Tuple[str, object]] = {}
+
+    for phrase in synonyms["dropped"]:
+        key: Tuple[str, ...] = _phrase_key(phrase)
+        if key:
+            phrases.setdefault(key, ("dropped", phrase))
+        # endif
+    # endfor
+
+    for alias, main_subject in synonyms["subject_index"].items():
+        key: Tuple[str, ...] = _phrase_key(alias)
+        if key:
+            phrases.setdefault(key, ("subject", main_subject))
+        # endif
+    # endfor
+
+    return {
+        "phrases": phrases,
+        "first_words": frozenset(key[0] for key in phrases),
+        "max_words": max((len(key) for key in phrases), default=0),
+        "fuzzy": synonyms.get("subject_fuzzy"),
+    }
+
+
+# enddef
+
+
+def tokenize(text: str, tables: Dict) -> List[Token]:
+    """
+    Splits the input into grade, subject, dropped phrase, connective, word and punctuation tokens.
+    Multi-word subjects and phrases (e.g. "further maths", "gave up") become one token, the longest one wins.
+    Words that are nothing else are looked up in the fuzzy index, so misspelled subjects are subject tokens too.
+
+    :param text: Raw user input
+    :param tables: Tables from build_grammar_tables
+    :return: List of tokens in input order
+    """
+
+    raw: list[tuple[str, str, int, int]] = []
+    for match in TOKEN_PATTERN.finditer(text):
+        raw.append((match.group(), match.lastgroup, match.start(), match.end()))
+    # endfor
+
+    phrases: Dict = tables["phrases"]
+    first_words: frozenset = tables["first_words"]
+    max_words: int = tables["max_words"]
+    fuzzy = tables.get("fuzzy")
+
+    tokens: List[Token] = []
+    i: int = 0
+
+    while i < len(raw):
+        word, group, start, end = raw[i]
+        lower: str = word.lower()
+
+        if group == "punct":
+            kind: str = "connective" if lower in CONNECTIVES else "punct"
+            tokens.append(Token(kind, lower, None, False, start, end))
+            i += 1
+            continue
+        # endif
+
+        grades: Tuple[str, ...] | None = split_grades(word)
+
+        # A block of grades followed by "in" is always grades (e.g. "DE in maths" isn't German)
+        if grades and i + 1 < len(raw) and raw[i + 1][0].lower() == "in":
+            tokens.append(Token("grade", lower, grades, word.isupper(), start, end))
+            i += 1
+            continue
+        # endif
+
+        # Longest subject alias or dropped phrase starting here
+        if lower in first_words:
+            found: bool = False
+            for length in range(min(max_words, len(raw) - i), 0, -1):
+                key: Tuple[str, ...] = tuple(piece[0].lower() for piece in raw[i:i + length])
+                phrase = phrases.get(key)
+                if phrase is not None:
+                    kind, value = phrase
+                    tokens.append(Token(kind, " ".join(key), value, word.isupper(), start, raw[i + length - 1][3]))
+                    i += length
+                    found = True
+                    break
+                # endif
+            # endfor
+
+            if found:
+                continue
+            # endif
+        # endif
+
+        if grades:
+            tokens.append(Token("grade", lower, grades, word.isupper(), start, end))
+        elif lower in CONNECTIVES:
+            tokens.append(Token("connective", lower, None, word.isupper(), start, end))
+        else:
+            # a misspelled subject ("phsyics"), only looked for once the exact lookup found nothing
+            subject: str | None = fuzzy.lookup(lower) if fuzzy is not None else None
+            if subject is not None:
+                tokens.append(Token("subject", lower, subject, word.isupper(), start, end))
+            else:
+                tokens.append(Token("word", lower, None, word.isupper(), start, end))
+            # endif
+        # endif
+
+        i += 1
+    # endwhile
+
+    return tokens
+
+
+# enddef
+
+
+def _text_at(tokens: List[Token], i: int) -> str:
+    """
+    :return: Text of the token at i, or "" past the end
+    """
+    return tokens[i].text if i < len(tokens) else ""
+
+
+# enddef
+
+
+def _single_grade_at(tokens: List[Token], i: int) -> str | None:
+    """
+    :return: The grade at i if that token is exactly one grade (e.g. "A*"), otherwise None
+    """
+    if i < len(tokens) and tokens[i].kind == "grade" and len(tokens[i].value) == 1:
+        return tokens[i].value[0]
+    # endif
+    return None
+
+
+# enddef
+
+
+def _owns_grade(tokens: List[Token], i: int) -> bool:
+    """
+    Checks if the subject at i has its own grade right after it ("maths A", "maths: A", "maths is A").
+
+    :return: True if a grade belongs to this subject
+    """
+
+    if _single_grade_at(tokens, i + 1) is not None:
+        return True
+    # endif
+
+    return _text_at(tokens, i + 1) in (":", "-", "is") and _single_grade_at(tokens, i + 2) is not None
+
+
+# enddef
+
+
+def _is_boundary(tokens: List[Token], i: int) -> bool:
+    """
+    Checks if the token at i ends a subject/grade pair (end of input, punctuation, "and" or another subject).
+    """
+
+    if i >= len(tokens):
+        return True
+    # endif
+
+    return tokens[i].kind in ("punct", "subject", "dropped") or tokens[i].text in SEPARATORS
+
+
+# enddef
+
+
+def _skip_dropped(tokens: List[Token], i: int) -> int:
+    """
+    Skips everything after a dropped phrase up to the end of that clause, so the dropped subjects
+    don't get a grade. Stops early if a new grade starts (e.g. "dropped art and got A in maths").
+
+    :param i: Index just after the dropped phrase
+    :return: Index of the first token that isn't part of the dropped clause
+    """
+
+    while i < len(tokens):
+        token: Token = tokens[i]
+
+        if token.kind == "punct":
+            break
+        # endif
+        if token.kind == "grade" and _text_at(tokens, i + 1) == "in":
+            break
+        # endif
+        if token.kind == "subject" and _owns_grade(tokens, i):
+            break
+        # endif
+
+        i += 1
+    # endwhile
+
+    return i
+
+
+# enddef
+
+
+def _grade_in_subjects(tokens: List[Token], i: int, results: Dict[str, str]) -> int:
+    """
+    Handles "A in maths", "A in maths chem and bio" and "AAB in maths, physics and chemistry".
+
+    :param i: Index of the grade token (the next token is "in")
+    :return: Index of the first token after the subjects
+    """
+
+    grades: Tuple[str, ...] = tokens[i].value
+    j: int = i + 2
+    subjects: list[str] = []
+
+    if len(grades) > 1:
+        # Grades go to the subjects in order, commas and "and" are allowed between them.
+        # A subject with its own grade ("..., english D*") ends the list
+        while j < len(tokens):
+            if tokens[j].kind == "subject" and subjects and _owns_grade(tokens, j):
+                break
+            elif tokens[j].kind == "subject":
+                subjects.append(tokens[j].value)
+                j += 1
+            elif tokens[j].text in SEPARATORS and j + 1 < len(tokens) and tokens[j + 1].kind == "subject" \
+                    and not _owns_grade(tokens, j + 1):
+                j += 1
+            else:
+                break
+            # endif
+        # endwhile
+
+        for k in range(len(subjects)):
+            # Use the last grade if there are more subjects than grades
+            results.setdefault(subjects[k], grades[k] if k < len(grades) else grades[-1])
+        # endfor
+
+        return j
+    # endif
+
+    if j < len(tokens) and tokens[j].kind == "subject":
+        # One grade for every subject in a list like "maths chem and bio" (a comma ends the list)
+        while j < len(tokens) and tokens[j].kind == "subject":
+            subjects.append(tokens[j].value)
+            j += 1
+
+            if j < len(tokens) and tokens[j].text in ("and", "&") and j + 1 < len(tokens) \
+                    and tokens[j + 1].kind == "subject":
+                j += 1
+            # endif
+
+            # Stop before a subject that has its own grade ("A in maths physics B")
+            if j < len(tokens) and tokens[j].kind == "subject" and _owns_grade(tokens, j):
+                break
+            # endif
+        # endwhile
+
+        for subject in subjects:
+            results.setdefault(subject, grades[0])
+        # endfor
+
+        return j
+    # endif
+
+    # Not a known subject, take a short run of plain words as the subject name
+    words: list[str] = []
+    while j < len(tokens) and tokens[j].kind == "word" and len(words) <= MAX_UNKNOWN_SUBJECT_WORDS:
+        words.append(tokens[j].text)
+        j += 1
+    # endwhile
+
+    ends_clause: bool = j >= len(tokens) or tokens[j].kind == "punct" or tokens[j].text in SEPARATORS \
+        or (tokens[j].kind == "grade" and _text_at(tokens, j + 1) == "in")
+
+    if words and len(words) <= MAX_UNKNOWN_SUBJECT_WORDS and ends_clause:
+        results.setdefault(" ".join(words), grades[0])
+    # endif
+
+    return j
+
+
+# enddef
+
+
+def _subject_then_grade(tokens: List[Token], i: int, results: Dict[str, str], case_matters: bool) -> int:
+    """
+    Handles a subject followed by its grade: "maths: A", "maths - A", "maths is A" and "maths A".
+
+    :param i: Index of the subject token
+    :param case_matters: False if the whole input is in capitals, so capitals don't show what is a grade
+    :return: Index of the next token to look at
+    """
+
+    subject: str = tokens[i].value
+    j: int = i + 1
+
+    if _text_at(tokens, j) in (":", "-", "is"):
+        grade: str | None = _single_grade_at(tokens, j + 1)
+        if grade is not None:
+            results.setdefault(subject, grade)
+            return j + 2
+        # endif
+        return j
+    # endif
+
+    grade: str | None = _single_grade_at(tokens, j)
+
+    # A grade followed by "in" belongs to the next subject ("A in art B in maths")
+    if grade is None or _text_at(tokens, j + 1) == "in":
+        return j
+    # endif
+
+    # "maths a level" isn't a grade, so a lowercase letter has to end the pair
+    if _is_boundary(tokens, j + 1) or (tokens[j].upper and case_matters):
+        results.setdefault(subject, grade)
+        return j + 1
+    # endif
+
+    return j
+
+
+# enddef
+
+
+def _unknown_subject_then_grade(tokens: List[Token], i: int, results: Dict[str, str]) -> int:
+    """
+    Handles a subject we don't know followed by its grade, at the start of a clause ("hindi: P")
+    or after "in" ("my grade in hindi is P").
+
+    :param i: Index of the first word of the subject
+    :return: Index of the next token to look at
+    """
+
+    j: int = i
+    while j < len(tokens) and tokens[j].kind == "word" and j - i < MAX_UNKNOWN_SUBJECT_WORDS:
+        j += 1
+    # endwhile
+
+    if j > i and _text_at(tokens, j) in (":", "-", "is"):
+        grade: str | None = _single_grade_at(tokens, j + 1)
+        if grade is not None:
+            results.setdefault(" ".join(token.text for token in tokens[i:j]), grade)
+            return j + 2
+        # endif
+    # endif
+
+    return i + 1
+
+
+# enddef
+
+
+def find_grades(text: str, tables: Dict) -> Dict[str, str]:
+    """
+    Finds all subject/grade pairs in the input with one walk over its tokens.
+
+    :param text: Raw user input
+    :param tables: Tables from build_grammar_tables
+    :return: Dictionary of {main_subject: grade}. Grades with no subjects (e.g. "I got AAB")
+        are stored as subject_1, subject_2, ... but only if no subject had a grade.
+    """
+
+    return find_grades_in_tokens(tokenize(text, tables), text != text.upper())
+
+
+# enddef
+
+
+def find_grades_in_tokens(tokens: List[Token], case_matters: bool) -> Dict[str, str]:
+    """
+    The walk over the tokens behind find_grades, for callers that already tokenized the input.
+
+    :param tokens: Tokens from tokenize
+    :param case_matters: False if the whole input is in capitals, so capitals don't show what is a grade
+    :return: Same as find_grades
+    """
+
+    results, standalone = walk_grades(tokens, case_matters)
+
+    return add_standalone_grades(results, standalone)
+
+
+# enddef
+
+
+def walk_grades(tokens: List[Token], case_matters: bool) -> Tuple[Dict[str, str], List[Tuple[str, ...]]]:
+    """
+    Walks over the tokens picking out the subject/grade pairs, keeping the blocks of grades with no subjects
+    apart so the results of several pieces of one input can be put together (see add_standalone_grades).
+
+    :param tokens: Tokens from tokenize
+    :param case_matters: False if the whole input is in capitals, so capitals don't show what is a grade
+    :return: ({main_subject: grade}, list of the grade blocks with no subjects in input order)
+    """
+
+    results: Dict[str, str] = {}
+    standalone: List[Tuple[str, ...]] = []
+
+    i: int = 0
+    while i < len(tokens):
+        token: Token = tokens[i]
+
+        if token.kind == "dropped":
+            i = _skip_dropped(tokens, i + 1)
+        elif token.kind == "grade" and _text_at(tokens, i + 1) == "in":
+            i = _grade_in_subjects(tokens, i, results)
+        elif token.kind == "subject":
+            i = _subject_then_grade(tokens, i, results, case_matters)
+        elif token.kind == "grade":
+            # A block of 2-4 grades with no subjects, only if it really looks like grades
+            previous: str = tokens[i - 1].text if i > 0 else ""
+            looks_like_grades: bool = any("*" in grade for grade in token.value) \
+                or (token.upper and case_matters) or previous in GRADE_TRIGGERS
+            if 2 <= len(token.value) <= 4 and looks_like_grades:
+                standalone.append(token.value)
+            # endif
+            i += 1
+        elif token.text == "in" and _text_at(tokens, i + 1) and tokens[i + 1].kind == "word":
+            i = _unknown_subject_then_grade(tokens, i + 1, results)
+        elif token.kind == "word" and (i == 0 or tokens[i - 1].kind == "punct"):
+            i = _unknown_subject_then_grade(tokens, i, results)
+        else:
+            i += 1
+        # endif
+    # endwhile
+
+    return results, standalone
+
+
+# enddef
+
+
+def add_standalone_grades(results: Dict[str, str], standalone: List[Tuple[str, ...]]) -> Dict[str, str]:
+    """
+    Uses the grade blocks with no subjects as subject_1, subject_2, ... if no subject had a grade.
+
+    :param results: {main_subject: grade} from walk_grades, changed in place
+    :param standalone: Grade blocks with no subjects from walk_grades
+    :return: The results
+    """
+
+    # Only use generic subject names if we didn't find any real subjects
+    if not results:
+        for grades in standalone:
+            for idx, grade in enumerate(grades):
+                results[f"subject_{idx + 1}"] = grade
+            # endfor
+        # endfor
+    # endif
+
+    return results
+# enddef
@@ -1,67 +1,136 @@
 #!/usr/bin/env python3
+import copy
+import itertools
+import os
 import re
-from .parser_utils import get_synonyms
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterable, Iterator, Mapping
+
+from .document import Document, as_document
+from .grade_grammar import find_grades_in_tokens
+from .instrumentation import NULL_TIMER, NullTimer, StageTimer, TimingHook
+from .matchers import PhraseMatcher, build_phrase_pattern, find_tails
+from .parse_cache import ParseCache
+from .parse_result import FIELDS, ParseResult, check_fields
+from .parser_utils import get_synonyms, set_synonyms
+from .traffic import TrafficRecorder
 
 
 class GradeParser:
     GRADE_PATTERN: str = r'\bA\*|D\*|A|B|C|D|E|U|M|P\b'  # Finds grades like A*, D*, B, M, P, etc
+    LIKE_PATTERN: re.Pattern = re.compile(r'\b(?:i\s+)?(?:like|love|enjoy)\s+([a-z]+)')  # "I like maths", "love art"
+
+    # Ways find_all_grades can find grades: one pass over tokens, or the older chain of regexes
+    ENGINES: tuple[str, ...] = ("grammar", "regex")
 
-    def clean_input(self, input: str) -> str:
+    def __init__(self, cache: ParseCache | None = None, engine: str = "grammar",
+                 timing_hook: TimingHook | None = None, timing_sample: int = 1,
+                 recorder: TrafficRecorder | None = None):
         """
-        Cleans and standardizes the user input by converting to lowercase, removing unnecessary
-        words such as 'and' or 'commas' and stripping extra whitespace.
+        :param cache: ParseCache | None
+            Optional cache for parse results. Off by default, so every call parses the input.
+        :param engine: str
+            "grammar" (default) finds grades with a single pass over the tokens of the input,
+            "regex" uses the older chain of regex passes, kept so the outputs can be compared.
+        :param timing_hook: TimingHook | None
+            Optional function that gets a StageTiming (wall/CPU time, input length, matches)
+            after each stage of the parser, e.g. an instrumentation.StageStats. Off by default.
+            Inputs that parse_many sends to worker processes are not timed.
+        :param timing_sample: int
+            Only time one in this many stage runs (1, the default, times them all). Timing a stage costs
+            a few microseconds, so sampling keeps the hook cheap enough to leave on in production.
+        :param recorder: TrafficRecorder | None
+            Optional recorder that gets every input parse is called with and keeps a sample of them,
+            to replay later (see replay.py). Off by default.
+        """
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}, expected one of {', '.join(self.ENGINES)}")
+        # endif
 
-        :param input: str
-            Raw user input describing subjects, grades, and additional info.
-        :return: str
-            Cleaned and normalized input string.
+        if timing_sample < 1:
+            raise ValueError("timing_sample must be at least 1")
+        # endif
+
+        self.cache: ParseCache | None = cache
+        self.engine: str = engine
+        self.timing_hook: TimingHook | None = timing_hook
+        self.timing_sample: int = timing_sample
+        self.recorder: TrafficRecorder | None = recorder
+
+        # stage runs so far, for sampling (a run counted twice by two threads only moves which runs are timed)
+        self._stage_runs: int = 0
+
+    # enddef
+
+    def _stage(self, stage: str, input: str) -> StageTimer | NullTimer:
         """
+        Times one stage of the parser if there is a timing hook.
 
-        # Replace 'and' with ',' for easier splitting, lowercase the whole string, strip extra spaces
-        input: str = input.replace(" and ", ",").lower().strip()
-        parts: list[str] = input.split(",")
+        :param stage: str
+            Name of the stage, passed on to the hook
+        :param input: str
+            Text the stage runs on, only its length is reported
+        :return: StageTimer | NullTimer
+            Context manager around the stage, set .matches on it to report what the stage found
+        """
 
-        clean_parts: list[str] = []
+        if self.timing_hook is None:
+            return NULL_TIMER
+        # endif
 
-        # Remove empty or whitespace-only parts
-        for p in parts:
-            if p.strip():
-                clean_parts.append(p.strip())
+        if self.timing_sample > 1:
+            self._stage_runs += 1
+            if self._stage_runs % self.timing_sample:
+                return NULL_TIMER
             # endif
-        # endfor
+        # endif
+
+        return StageTimer(self.timing_hook, stage, len(input))
+
+    # enddef
 
-        # Join the cleaned parts back together, comma separated
-        input: str = ", ".join(clean_parts)
+    def clean_input(self, input: str | Document) -> str:
+        """
+        Cleans and standardizes the user input by converting to lowercase, removing unnecessary
+        words such as 'and' or 'commas' and stripping extra whitespace.
+
+        :param input: str | Document
+            Raw user input describing subjects, grades, and additional info.
+        :return: str
+            Cleaned and normalized input string.
+        """
 
-        return input
+        return as_document(input).cleaned
 
     # enddef
 
-    def find_dropped_subjects(self, input: str) -> str:
+    def find_dropped_subjects(self, input: str | Document) -> str:
         """
         Removes all dropped/quit/failed subjects from the input string,
         based on recognized phrases like 'dropped', 'quit', 'failed', etc.
         Returns the cleaned input with dropped subjects removed.
 
-        :param input: str
+        :param input: str | Document
             User input describing subjects, grades, and any dropped/abandoned subjects.
         :return: str
             Cleaned input with dropped subjects removed.
         """
 
-        dropped_phrases: list[str] = get_synonyms()["dropped"]
-        sentence: str = self.clean_input(input).lower()
+        document: Document = as_document(input)
+        phrase_patterns: dict[str, re.Pattern] = document.synonyms["phrase_patterns"]
+        sentence: str = self.clean_input(document)
 
-        # Removes 'dropped/quit/failed/...' subject phrases using regex
-        for phrase in dropped_phrases:
-            pattern: str = rf"(?:\bi\s+)?{phrase}\s+([a-z\s]+(?:\sand\s[a-z\s]+)*)"
-            sentence: str = re.sub(pattern, "", sentence)
-        # endfor
+        # Removes 'dropped/quit/failed/...' subject phrases using regex (all phrases in one pass)
+        with self._stage("find_dropped_subjects", sentence) as timer:
+            sentence, timer.matches = phrase_patterns["dropped_clause"].subn("", sentence)
+        # endwith
 
         # Tidies up leftover punctuation/whitespace
         sentence: str = re.sub(r',\s*,+', ',', sentence)  # Remove duplicate commas
         sentence: str = re.sub(r'^\s*,|,\s*$', '', sentence)  # Remove leading/trailing commas
-        sentence: str = re.sub(r'\s+,', ',', sentence)  # Remove spaces before commas
+        # Remove spaces before commas (only from the start of the spaces, or long runs of them take quadratic time)
+        sentence: str = re.sub(r'(?<!\s)\s+,', ',', sentence)
         sentence: str = re.sub(r',\s+', ', ', sentence)  # Space after commas
         sentence: str = re.sub(r'\s+', ' ', sentence)  # Collapse extra spaces
 
@@ -75,13 +144,7 @@ class GradeParser:
         parts = sentence.split(",")
 
         # Check if input has a dropped keyword
-        has_dropped_keyword: bool = False
-        for phrase in dropped_phrases:
-            if phrase in input.lower():
-                has_dropped_keyword = True
-                break
-            # endif
-        # endfor
+        has_dropped_keyword: bool = phrase_patterns["dropped"].search(document.lower) is not None
 
         # Process each part
         for i in range(len(parts)):
@@ -104,17 +167,53 @@ class GradeParser:
 
     # enddef
 
-    def find_all_grades(self, input: str) -> dict[str, str]:
+    def find_all_grades(self, input: str | Document) -> dict[str, str]:
         """
         Unified function to extract all grade/subject pairs from input,
         handling both multi-grade patterns (AAB in ...) and single-grade patterns.
+        Uses the engine picked when the parser was made.
 
-        :param input: str
+        :param input: str | Document
+            The user input containing grade/subject info.
+        :return: dict
+            Returns a dict of {normalized_subject: grade}.
+        """
+
+        if self.engine == "regex":
+            return self.find_all_grades_regex(input)
+        # endif
+
+        document: Document = as_document(input)
+
+        # Tokenizing and the walk over the tokens are timed separately
+        with self._stage("tokenize", document.text) as timer:
+            timer.matches = len(document.tokens)
+        # endwith
+
+        with self._stage("grammar", document.text) as timer:
+            results: dict[str, str] = find_grades_in_tokens(document.tokens, document.case_matters)
+            timer.matches = len(results)
+        # endwith
+
+        return results
+
+    # enddef
+
+    def find_all_grades_regex(self, input: str | Document) -> dict[str, str]:
+        """
+        Older version of find_all_grades that runs the input through a chain of regex passes
+        (dropped subjects, multi-grade, standalone grades, "Maths A" pairs, then the other patterns).
+        Kept so its output can be compared with the grammar engine.
+
+        :param input: str | Document
             The user input containing grade/subject info.
         :return: dict
             Returns a dict of {normalized_subject: grade}.
         """
 
+        document: Document = as_document(input)
+        synonyms: Mapping = document.synonyms
+        input: str = document.text
         results: dict[str, str] = {}
 
         # Keep track of original input for special pattern processing
@@ -124,48 +223,53 @@ class GradeParser:
         # This needs to be done before clean_input replaces "and" with ","
         # Only match when there are multiple single-word subjects (like "Math Chem and Bio")
         single_grade_multiple_subjects_pattern = r'\b(?:got\s+|have\s+|achieved\s+|received\s+)?(A\*|D\*|[A-U])\s+in\s+([A-Za-z]+\s+[A-Za-z]+\s+and\s+[A-Za-z]+)'
-        matches = re.findall(single_grade_multiple_subjects_pattern, input, re.IGNORECASE)
-
-        for match in matches:
-            grade = match[0].strip().upper()
-            subjects_str = match[1].strip()
-
-            # Split by "and" to get individual subjects
-            subjects = subjects_str.split(" and ")
-
-            for subject in subjects:
-                subject = subject.strip()
-                # Each subject might be multiple words like "Further Maths"
-                # But we also need to handle "Math Chem" as two separate subjects
-                # Let's check if the whole phrase is a known subject first
-                subject_norm = self.normalize_subject(subject.lower())
-
-                if subject_norm == subject.lower():
-                    # Not recognized as a whole, try splitting by spaces
-                    words = subject.split()
-                    for word in words:
-                        word_norm = self.normalize_subject(word.lower())
-                        if word_norm != word.lower():  # It got normalized
-                            if word_norm not in results:
-                                results[word_norm] = grade
+        with self._stage("single_grade_multiple_subjects", input) as timer:
+            found: list[re.Match] = list(re.finditer(single_grade_multiple_subjects_pattern, input, re.IGNORECASE))
+            timer.matches = len(found)
+
+            for match in found:
+                grade = match.group(1).strip().upper()
+                subjects_str = match.group(2).strip()
+
+                # Split by "and" to get individual subjects
+                subjects = subjects_str.split(" and ")
+
+                for subject in subjects:
+                    subject = subject.strip()
+                    # Each subject might be multiple words like "Further Maths"
+                    # But we also need to handle "Math Chem" as two separate subjects
+                    # Let's check if the whole phrase is a known subject first
+                    subject_norm = self.normalize_subject(subject.lower(), fuzzy=False, synonyms=synonyms)
+
+                    if subject_norm == subject.lower():
+                        # Not recognized as a whole, try splitting by spaces
+                        words = subject.split()
+                        for word in words:
+                            word_norm = self.normalize_subject(word.lower(), fuzzy=False, synonyms=synonyms)
+                            if word_norm != word.lower():  # It got normalized
+                                if word_norm not in results:
+                                    results[word_norm] = grade
+                                # endif
                             # endif
+                        # endfor
+                    else:
+                        # Recognized as a whole subject
+                        if subject_norm not in results:
+                            results[subject_norm] = grade
                         # endif
-                    # endfor
-                else:
-                    # Recognized as a whole subject
-                    if subject_norm not in results:
-                        results[subject_norm] = grade
                     # endif
-                # endif
+                # endfor
             # endfor
 
-            # Remove the matched pattern from input to avoid double processing
-            pattern_to_remove = rf'\b(?:got\s+|have\s+|achieved\s+|received\s+)?{re.escape(match[0])}\s+in\s+{re.escape(match[1])}'
-            modified_input = re.sub(pattern_to_remove, '', modified_input, flags=re.IGNORECASE)
-        # endfor
+            # Remove the matched patterns from input to avoid double processing, all in one pass
+            if found:
+                modified_input = _remove_spans(input, [match.span() for match in found])
+            # endif
+        # endwith
 
-        # Start with clean sentence, dropped subjects removed  
-        cleaned_sentence: str = self.find_dropped_subjects(modified_input)
+        # Start with clean sentence, dropped subjects removed
+        cleaned_sentence: str = self.find_dropped_subjects(
+            document if modified_input is input else Document(modified_input, synonyms))
 
         def process_multi_grade(match) -> str:
             """
@@ -228,17 +332,11 @@ class GradeParser:
 
             # Pair grades with subjects
             for i in range(len(subjects_list)):
-                subject_norm: str = self.normalize_subject(subjects_list[i])
+                subject_norm: str = self.normalize_subject(subjects_list[i], fuzzy=False, synonyms=synonyms)
                 # Assign grade by position, use last grade if more subjects than grades
                 grade: str = grades[i] if i < len(grades) else grades[-1]
 
-                is_subject = False
-                for main_subj, synonyms in get_synonyms()["subjects"].items():
-                    if subject_norm == main_subj or subjects_list[i] in synonyms:
-                        is_subject = True
-                        break
-                    # endif
-                # endfor
+                is_subject: bool = subjects_list[i] in synonyms["subject_aliases"]
 
                 if subject_norm and is_subject:
                     results[subject_norm] = grade
@@ -252,45 +350,59 @@ class GradeParser:
 
         # First pass: Find and process multi-grade patterns (AAB in ...)
         multi_pattern: str = r'\b((?:A\*|D\*|[A-U]){2,})\s+in\s+([a-zA-Z\s,]+?)(?:\.|,\s*[a-zA-Z]+\s+in\s|$)'
-        remaining: str = re.sub(multi_pattern, process_multi_grade, cleaned_sentence, flags=re.IGNORECASE)
+        with self._stage("multi_grade", cleaned_sentence) as timer:
+            multi_matches: list[re.Match] = list(_finditer_lazy(multi_pattern, r'\b(?:A\*|D\*|[A-U]){2,}\s+in\s+',
+                                                                r'[a-zA-Z\s,]*', cleaned_sentence))
+            timer.matches = len(multi_matches)
+            for match in multi_matches:
+                process_multi_grade(match)
+            # endfor
+            remaining = _remove_spans(cleaned_sentence, [match.span() for match in multi_matches])
+        # endwith
 
         # check for patterns like "I got BBB" where they don't say subjects
         # match 2-4 grades together (not single letters cos they might be words)
         standalone_grades_pattern = r'\b(?:got\s+|have\s+|achieved\s+|received\s+)?((?:A\*|D\*|[ABCDUEPM]){2,4})\b(?!\s+in\s)'
         # only look for this if we haven't already found grades with subjects
-        if not results:
-            standalone_matches = re.findall(standalone_grades_pattern, cleaned_sentence, re.IGNORECASE)
-        else:
-            standalone_matches = []
-        # endif
-
-        for grades_str in standalone_matches:
-            # work out individual grades from stuff like "AAB" or "BBB"
-            grades = []
-            i = 0
-            while i < len(grades_str):
-                if grades_str[i].upper() == "A" and (i + 1) < len(grades_str) and grades_str[i + 1] == "*":
-                    grades.append("A*")
-                    i += 2
-                elif grades_str[i].upper() == "D" and (i + 1) < len(grades_str) and grades_str[i + 1] == "*":
-                    grades.append("D*")
-                    i += 2
-                else:
-                    grades.append(grades_str[i].upper())
-                    i += 1
-                # endif
-            # endwhile
+        with self._stage("standalone_grades", cleaned_sentence) as timer:
+            if not results:
+                standalone_matches = re.findall(standalone_grades_pattern, cleaned_sentence, re.IGNORECASE)
+            else:
+                standalone_matches = []
+            # endif
+            timer.matches = len(standalone_matches)
+
+            for grades_str in standalone_matches:
+                # work out individual grades from stuff like "AAB" or "BBB"
+                grades = []
+                i = 0
+                while i < len(grades_str):
+                    if grades_str[i].upper() == "A" and (i + 1) < len(grades_str) and grades_str[i + 1] == "*":
+                        grades.append("A*")
+                        i += 2
+                    elif grades_str[i].upper() == "D" and (i + 1) < len(grades_str) and grades_str[i + 1] == "*":
+                        grades.append("D*")
+                        i += 2
+                    else:
+                        grades.append(grades_str[i].upper())
+                        i += 1
+                    # endif
+                # endwhile
 
-            # store them with generic subject names cos we don't know what subjects
-            for idx, grade in enumerate(grades):
-                # just call them subject_1, subject_2 etc
-                generic_subject = f"subject_{idx + 1}"
-                results[generic_subject] = grade
+                # store them with generic subject names cos we don't know what subjects
+                for idx, grade in enumerate(grades):
+                    # just call them subject_1, subject_2 etc
+                    generic_subject = f"subject_{idx + 1}"
+                    results[generic_subject] = grade
+                # endfor
             # endfor
 
-            # take this bit out of the remaining text
-            remaining = re.sub(rf'\b{re.escape(grades_str)}\b', '', remaining, flags=re.IGNORECASE)
-        # endfor
+            # take these bits out of the remaining text, all in one pass
+            if standalone_matches:
+                remaining = re.sub(rf'\b(?:{build_phrase_pattern(list(dict.fromkeys(standalone_matches)))})\b', '',
+                                   remaining, flags=re.IGNORECASE)
+            # endif
+        # endwith
 
         # Second pass: Find single-grade patterns in remaining text
         # First handle space-separated format like "Maths A Physics B"
@@ -299,187 +411,215 @@ class GradeParser:
 
         # Match subject-grade pairs with flexible spacing
         # Include A* handling - make sure to match A* first
-        words_and_grades = re.findall(r'\b([a-zA-Z]+(?:\s+[a-zA-Z]+)?)\s+(A\*|D\*|[A-U]\b)', remaining_cleaned,
-                                      re.IGNORECASE)
-        for word, grade in words_and_grades:
-            # Check if this word/phrase is a known subject
-            subject_norm = self.normalize_subject(word.lower().strip())
-            # Add if it's a valid subject (either normalized or already a main subject name)
-            if subject_norm and subject_norm not in results:
-                # Check it's actually a subject by seeing if it's in our subjects dict
-                is_subject = False
-                for main_subj, synonyms in get_synonyms()["subjects"].items():
-                    if subject_norm == main_subj or word.lower().strip() in synonyms:
-                        is_subject = True
-                        break
+        with self._stage("words_and_grades", remaining_cleaned) as timer:
+            words_and_grades = re.findall(r'\b([a-zA-Z]+(?:\s+[a-zA-Z]+)?)\s+(A\*|D\*|[A-U]\b)', remaining_cleaned,
+                                          re.IGNORECASE)
+            timer.matches = len(words_and_grades)
+
+            for word, grade in words_and_grades:
+                # Check if this word/phrase is a known subject
+                subject_norm = self.normalize_subject(word.lower().strip(), fuzzy=False, synonyms=synonyms)
+                # Add if it's a valid subject (either normalized or already a main subject name)
+                if subject_norm and subject_norm not in results:
+                    # Check it's actually a subject by seeing if it's one of our known subject names
+                    is_subject = word.lower().strip() in synonyms["subject_aliases"]
+                    if is_subject:
+                        results[subject_norm] = grade.upper()
                     # endif
-                # endfor
-                if is_subject:
-                    results[subject_norm] = grade.upper()
                 # endif
-            # endif
-        # endfor
+            # endfor
+        # endwith
 
-        patterns: list[tuple[str, str]] = [
+        # (pattern, the start of it every match begins with, mode). A plain findall of these can take time
+        # quadratic in the length of the text, so each one is found in a way that gives the same matches in linear time
+        patterns: list[tuple[str, str | None, str]] = [
             (r'\b(?:got\s+)?(A\*|D\*|[A-U])\s+in\s+([a-zA-Z]+(?:\s+[a-zA-Z]+)*?)(?=\s+[A-U]\s+in\s+|[,.]|$)',
-             "grade_in_subject"),
-            (r"([a-zA-Z\s]+?)\s*[:\-]\s*(A\*|D\*|A|B|C|D|E|U|M|P)", "subject_colon_grade"),
-            (r"(?:my grade in|in)\s+([a-zA-Z\s]+?)\s+is\s+(A\*|D\*|A|B|C|D|E|U|M|P)", "in_subject_is_grade"),
+             r'\b(?:got\s+)?(?:A\*|D\*|[A-U])\s+in\s+', "grade_in_subject"),
+            (r"([a-zA-Z\s]+?)\s*[:\-]\s*(A\*|D\*|A|B|C|D|E|U|M|P)", None, "subject_colon_grade"),
+            (r"(?:my grade in|in)\s+([a-zA-Z\s]+?)\s+is\s+(A\*|D\*|A|B|C|D|E|U|M|P)", r"(?:my grade in|in)\s+",
+             "in_subject_is_grade"),
         ]
 
-        for pattern, mode in patterns:
-            matches: list[tuple[str, str]] = re.findall(pattern, remaining, re.IGNORECASE)
-
-            for match in matches:
-                if mode == "grade_in_subject":
-                    grade: str = match[0]
-                    subject: str = match[1]
+        for pattern, head, mode in patterns:
+            with self._stage(mode, remaining) as timer:
+                matches: list[tuple[str, str]]
+                if head is None:
+                    matches = _find_colon_grades(remaining)
                 else:
-                    subject: str = match[0]
-                    grade: str = match[1]
+                    matches = [match.groups() for match in _finditer_lazy(pattern, head, r'[a-zA-Z\s]*', remaining)]
                 # endif
+                timer.matches = len(matches)
 
-                # Clean and normalize
-                subject_norm: str = self.normalize_subject(subject.strip().lower())
-                grade_clean: str = grade.strip().upper()
+                for match in matches:
+                    if mode == "grade_in_subject":
+                        grade: str = match[0]
+                        subject: str = match[1]
+                    else:
+                        subject: str = match[0]
+                        grade: str = match[1]
+                    # endif
 
-                # Only add if not already found
-                if subject_norm and subject_norm not in results:
-                    results[subject_norm] = grade_clean
-                # endif
-            # endfor
+                    # Clean and normalize
+                    subject_norm: str = self.normalize_subject(subject.strip().lower(), fuzzy=False, synonyms=synonyms)
+                    grade_clean: str = grade.strip().upper()
+
+                    # Only add if not already found
+                    if subject_norm and subject_norm not in results:
+                        results[subject_norm] = grade_clean
+                    # endif
+                # endfor
+            # endwith
         # endfor
 
         return results
 
     # enddef
 
-    def normalize_subject(self, subject: str) -> str:
+    def normalize_subject(self, subject: str, fuzzy: bool = True, synonyms: Mapping | None = None) -> str:
         """
         Converts a subject synonym to its main subject name.
 
         :param subject: str
             The subject name or synonym, e.g. "maths", "comp sci", "bio".
+        :param fuzzy: bool
+            Also look the subject up as a misspelling if it isn't a known name. The regex engine turns this off,
+            as it normalizes every chunk of words it tries and so its output is kept as it was.
+        :param synonyms: Mapping | None
+            Lexicon to look the subject up in, e.g. the one of the Document being parsed. Defaults to the current one.
         :return: str
             The standardized main subject name (e.g. "mathematics", "computer science", "biology").
+            Misspelled subjects (e.g. "phsyics") give the subject they are close to, anything else is returned as it is.
         """
 
         subject: str = subject.lower().strip()
 
-        subject_phrases: list[str] = get_synonyms()["subjects"]
+        if synonyms is None:
+            synonyms = get_synonyms()
+        # endif
 
-        # Loop through all main subjects and their synonyms
-        for main_subject, synonyms in subject_phrases.items():
-            if subject == main_subject:
-                return main_subject
-            # endif
+        # Every main subject and synonym maps straight to its main subject name
+        subject_norm: str | None = synonyms["subject_index"].get(subject)
 
-            for synonym in synonyms:
-                if subject == synonym:
-                    return main_subject
-                # endif
-            # endfor
-        # endfor
+        # Only once the exact lookup misses, try it as a misspelling
+        if subject_norm is None and fuzzy and synonyms.get("subject_fuzzy") is not None:
+            subject_norm = synonyms["subject_fuzzy"].lookup(subject)
+        # endif
 
-        return subject
+        return subject_norm if subject_norm is not None else subject
 
     # enddef
 
-    def find_course_interest(self, input: str) -> list[str]:
+    def find_course_interest(self, input: str | Document) -> list[str]:
         """
         Extracts all course interests mentioned by the user in their input,
         by matching against a predefined set of interest phrases and course synonyms.
 
-        :param input: str
+        :param input: str | Document
             Raw user input (e.g., "I'm interested in medicine and law")
         :return: list[str]
             List of main course names found in the input (duplicates/overlaps removed)
         """
 
-        # List of phrases showing a user's interest in a subject (e.g., "interested in", "looking for")
-        interest_phrases: list[str] = get_synonyms()["interest"]
+        document: Document = as_document(input)
+        synonyms: Mapping = document.synonyms
+
+        # Patterns for the phrases showing a user's interest in a subject (e.g., "interested in", "looking for")
+        phrase_patterns: dict[str, re.Pattern] = synonyms["phrase_patterns"]
 
-        # Dictionary of all courses and their list of synonyms (e.g., {"medicine": ["med", "mbbs"]})
-        courses_dict: dict[str, list[str]] = get_synonyms()["courses"]
+        # Finds every course name and synonym in one pass (e.g., "med" and "mbbs" both give "medicine")
+        course_matcher: PhraseMatcher = synonyms["course_matcher"]
 
         # Will collect the main course names found in the user input
         found_courses: list[str] = []
 
         # Cleans up the input: makes lowercase, removes extra words like "and"
-        cleaned: str = self.clean_input(input)
-
-        # Lowercase, stripped version for searching
-        cleaned_joined: str = cleaned.lower()
+        cleaned_joined: str = self.clean_input(document)
 
         # Checks if any interest phrase is present (e.g., "interested in", "hoping to study")
-        found_interest_phrase: bool = False
-
-        for phrase in interest_phrases:
-            if phrase in cleaned_joined:
-                found_interest_phrase = True
-                break
-            # endif
-        # endfor
+        found_interest_phrase: bool = phrase_patterns["interest"].search(cleaned_joined) is not None
 
         # If an interest phrase is found, only look at text after those phrases
         if found_interest_phrase:
-            input_lower = input.lower()
-            for phrase in interest_phrases:
-                pattern = rf"{re.escape(phrase)}\s+([a-z\s]+)"
-                matches = re.findall(pattern, input_lower)
-                for match in matches:
-                    for course, synonyms in courses_dict.items():
-                        if course in match or any(alias in match for alias in synonyms):
-                            if course not in found_courses:
-                                found_courses.append(course)
-                            # endif
-                        # endif
-                    # endfor
-                # endfor
-            # endfor
+            tails: list[tuple[int, int]] = find_tails(phrase_patterns["interest_tail"], document.lower)
+            found_courses = course_matcher.find_values_in_tails(document.lower, tails)
+
+            # No course name there at all, so look for misspelled ones (e.g. "medecine")
+            if not found_courses and synonyms.get("course_fuzzy") is not None:
+                found_courses = synonyms["course_fuzzy"].find_values_in_tails(document.lower, tails)
+            # endif
         # endif
 
         # If no courses and no interest phrase matched, checks the input for any course names anyway
         if not found_courses and not found_interest_phrase:
-            for course, synonyms in courses_dict.items():
-                all_names: list[str] = [course] + synonyms
-                for name in all_names:
-                    pattern: str = r'\b' + re.escape(name) + r'\b'
-                    if re.search(pattern, cleaned_joined):
-                        if course not in found_courses:
-                            found_courses.append(course)
-                        # endif
-                        break
-                    # endif
-                # endfor
-            # endfor
+            found_courses = course_matcher.find_values(cleaned_joined)
         # endif
 
-        # Removes overlapping course names (e.g., "english" inside "english literature"), keep the longest only
-        clean_courses: list[str] = []
+        # Overlapping course names (e.g., "english" inside "english literature") are already
+        # handled by the matcher, which keeps the longest match only
+        clean_courses: list[str] = found_courses
 
-        for i in range(len(found_courses)):
-            current: str = found_courses[i]
-            found_overlap: bool = False
-            for j in range(len(found_courses)):
-                # If current course name is fully inside another, skip it (unless it's the same)
-                if i != j and current in found_courses[j]:
-                    found_overlap = True
-                    break
+        # Returns the final list of main course names the user is interested in
+        return clean_courses
+
+    # enddef
+
+    def find_interests(self, input: str | Document, grades: dict[str, str]) -> list[str]:
+        """
+        Finds the courses the user is interested in, leaving out subjects that only come up with a grade.
+
+        :param input: str | Document
+            User input containing grades, dropped subjects, and course interests
+        :param grades: dict[str, str]
+            Grades found in the same input (from find_all_grades)
+        :return: list[str]
+            Main course names the user is interested in
+        """
+
+        document: Document = as_document(input)
+
+        # Gets all the course interests from the original input
+        with self._stage("find_course_interest", document.text) as timer:
+            interests: list[str] = self.find_course_interest(document)
+            timer.matches = len(interests)
+        # endwith
+
+        # Need to also handle - "I like Maths" pattern
+        # When found, keep mathematics as an interest even if there's a grade for it
+        keep_subjects_with_grades = []
+        input_lower = document.lower
+
+        # Check for explicit "I like X" pattern where X is a subject
+        with self._stage("like_pass", document.text) as timer:
+            like_matches = self.LIKE_PATTERN.findall(input_lower)
+            for match in like_matches:
+                subject_norm = self.normalize_subject(match, synonyms=document.synonyms)
+                if subject_norm != match and subject_norm in interests:
+                    keep_subjects_with_grades.append(subject_norm)
                 # endif
             # endfor
+            timer.matches = len(keep_subjects_with_grades)
+        # endwith
+
+        with self._stage("merge", document.text) as timer:
+            # Detect explicit interest phrases like "want to do" so we don't drop them from interests
+            explicit_interest = document.synonyms["phrase_patterns"]["interest"].search(input_lower) is not None
+
+            # Removes any course from interests if it already appears in grades
+            # UNLESS it was explicitly mentioned (interest phrases) or "I like/love/enjoy"
+            clean_interests: list[str] = []
+            for i in interests:
+                if explicit_interest or i not in grades or i in keep_subjects_with_grades:
+                    clean_interests.append(i)
+                # endif
+            # endfor
+            timer.matches = len(clean_interests)
+        # endwith
 
-            if not found_overlap:
-                clean_courses.append(current)
-            # endif
-        # endfor
-
-        # Returns the final list of main course names the user is interested in
-        return clean_courses
+        return clean_interests
 
     # enddef
 
-    def parse(self, input: str) -> dict:
+    def parse(self, input: str, fields: tuple[str, ...] = FIELDS) -> ParseResult:
         """
         Parses the user's raw input and returns a summary of grades and course interests.
         This function uses all helper functions to process, extract, and organize the user's input
@@ -487,53 +627,352 @@ class GradeParser:
 
         :param input: str
             User input containing grades, dropped subjects, and course interests
-        :return: dict
+        :param fields: tuple[str, ...]
+            Fields the result should have, e.g. ("grades",) when the course interests aren't needed.
+            Stages that only the other fields need never run.
+        :return: ParseResult
+            Reads like the dictionary
             {
                 "grades": {normalized_subject: grade, ...},
                 "interests": [list of main course names the user is interested in]
             }
+            with just the fields asked for. Each field is worked out the first time it is used.
         """
 
-        # Use the new unified function to get all grades
-        all_grades: dict[str, str] = self.find_all_grades(input)
+        fields = check_fields(fields)
 
-        # Gets all the course interests from the original input
-        interests: list[str] = self.find_course_interest(input)
-
-        # Need to also handle - "I like Maths" pattern
-        # When found, keep mathematics as an interest even if there's a grade for it
-        keep_subjects_with_grades = []
-        input_lower = input.lower()
+        if self.recorder is not None:
+            self.recorder.record(input)
+        # endif
 
-        # Check for explicit "I like X" pattern where X is a subject
-        like_pattern = r'\b(?:i\s+)?(?:like|love|enjoy)\s+([a-z]+)'
-        like_matches = re.findall(like_pattern, input_lower)
-        for match in like_matches:
-            subject_norm = self.normalize_subject(match)
-            if subject_norm != match and subject_norm in interests:
-                keep_subjects_with_grades.append(subject_norm)
+        # The result is worked out with the synonyms in use now, even if they are refreshed before it is read
+        synonyms: Mapping = get_synonyms()
+
+        # If there is a cache, inputs that only differ by surrounding whitespace share a result.
+        # The synonyms version is part of the key so results from old synonyms are never reused,
+        # and the engine is too in case parsers with different engines share a cache
+        if self.cache is not None:
+            cache_key: tuple = (synonyms["version"], self.engine, fields, input.strip())
+            cached: ParseResult | None = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
             # endif
+        # endif
+
+        result = ParseResult(self, Document(input, synonyms), fields)
+
+        if self.cache is not None:
+            # storing it copies it, which works out every field
+            self.cache.put(cache_key, result)
+        # endif
+
+        return result
+
+    # enddef
+
+    def parse_many(self, inputs: Iterable[str], workers: int | None = None,
+                   chunksize: int = 64) -> list[ParseResult]:
+        """
+        Parses a batch of inputs, spread over several processes, and returns the results in input order.
+
+        :param inputs: Iterable[str]
+            The user inputs to parse
+        :param workers: int | None
+            Number of worker processes, defaults to the number of CPUs. 1 parses everything in this process.
+        :param chunksize: int
+            How many inputs each worker gets at a time
+        :return: list[ParseResult]
+            One parse result per input, in the same order as the inputs
+        """
+
+        inputs: list[str] = list(inputs)
+        results: list = [None] * len(inputs)
+
+        for index, result in self.iter_parse_many(inputs, workers=workers, chunksize=chunksize):
+            results[index] = result
         # endfor
 
-        # Detect explicit interest phrases like "want to do" so we don't drop them from interests
-        explicit_interest = any(phrase in input_lower for phrase in get_synonyms()["interest"])
+        return results
 
-        # Removes any course from interests if it already appears in grades
-        # UNLESS it was explicitly mentioned (interest phrases) or "I like/love/enjoy"
-        clean_interests: list[str] = []
-        for i in interests:
-            if explicit_interest or i not in all_grades or i in keep_subjects_with_grades:
-                clean_interests.append(i)
-            # endif
+    # enddef
+
+    def iter_parse_many(self, inputs: Iterable[str], workers: int | None = None,
+                        chunksize: int = 64) -> Iterator[tuple[int, ParseResult]]:
+        """
+        Parses a batch of inputs, spread over several processes, and yields each result as soon as it is ready.
+        Identical inputs are only parsed once. Every worker gets a copy of this process's synonyms
+        when it starts, so workers don't reload them per input (or hit the database at all).
+
+        :param inputs: Iterable[str]
+            The user inputs to parse
+        :param workers: int | None
+            Number of worker processes, defaults to the number of CPUs. 1 parses everything in this process.
+        :param chunksize: int
+            How many inputs each worker gets at a time
+        :return: Iterator[tuple[int, ParseResult]]
+            (input index, parse result) pairs, in the order they finish
+        """
+
+        if chunksize < 1:
+            raise ValueError("chunksize must be at least 1")
+        # endif
+
+        # Group the positions of identical inputs so each distinct input is parsed once
+        positions: dict[str, list[int]] = {}
+        for index, text in enumerate(inputs):
+            positions.setdefault(text, []).append(index)
         # endfor
 
-        # Builds and return the final result as a dictionary
-        result: dict = {
-            "grades": all_grades,
-            "interests": clean_interests
-        }
+        unique_inputs: list[str] = list(positions)
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        # endif
+
+        # Not worth starting processes for a single chunk
+        if workers <= 1 or len(unique_inputs) <= chunksize:
+            for text in unique_inputs:
+                yield from _spread_result(positions[text], self.parse(text))
+            # endfor
+            return
+        # endif
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker,
+                                 initargs=(get_synonyms(),)) as pool:
+            futures: dict = {}
+            for start in range(0, len(unique_inputs), chunksize):
+                chunk: list[str] = unique_inputs[start:start + chunksize]
+                futures[pool.submit(_parse_chunk, type(self), self.engine, chunk)] = chunk
+            # endfor
+
+            for future in as_completed(futures):
+                for text, result in zip(futures[future], future.result()):
+                    yield from _spread_result(positions[text], result)
+                # endfor
+            # endfor
+        # endwith
 
-        return result
+    # enddef
+
+    def parse_stream(self, inputs: Iterable[str], workers: int | None = None, chunksize: int = 64,
+                     max_pending: int | None = None) -> Iterator[ParseResult]:
+        """
+        Parses a stream of inputs and yields the results in input order, reading the inputs as it goes.
+        Unlike parse_many the inputs are never all held at once, only the chunks being worked on,
+        so it can go through inputs that don't fit in memory (e.g. lines of a big file).
+
+        :param inputs: Iterable[str]
+            The user inputs to parse, read lazily
+        :param workers: int | None
+            Number of worker processes, defaults to the number of CPUs. 1 parses everything in this process.
+        :param chunksize: int
+            How many inputs each worker gets at a time
+        :param max_pending: int | None
+            Most chunks being parsed or waiting to be yielded at once, defaults to twice the number of workers
+        :return: Iterator[ParseResult]
+            One parse result per input, in the same order as the inputs
+        """
+
+        if chunksize < 1:
+            raise ValueError("chunksize must be at least 1")
+        # endif
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        # endif
+
+        if workers <= 1:
+            for text in inputs:
+                yield self.parse(text)
+            # endfor
+            return
+        # endif
+
+        if max_pending is None:
+            max_pending = workers * 2
+        # endif
+
+        inputs: Iterator[str] = iter(inputs)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker,
+                                 initargs=(get_synonyms(),)) as pool:
+            # Futures of the submitted chunks, oldest first, so results come out in input order
+            pending: deque = deque()
+
+            while True:
+                chunk: list[str] = list(itertools.islice(inputs, chunksize))
+                if not chunk:
+                    break
+                # endif
+
+                pending.append(pool.submit(_parse_chunk, type(self), self.engine, chunk))
+
+                if len(pending) >= max(max_pending, 1):
+                    yield from pending.popleft().result()
+                # endif
+            # endwhile
+
+            while pending:
+                yield from pending.popleft().result()
+            # endwhile
+        # endwith
     # enddef
 
 # endclass
+
+
+def _finditer_lazy(pattern: str, head: str, run: str, text: str) -> Iterator[re.Match]:
+    """
+    Finds the same matches as re.finditer(pattern, text, re.IGNORECASE), in time linear in the length of the text,
+    for patterns made of a head, then a lazy group of run characters, then something that ends it.
+    When a match from one head fails, the lazy group has already been tried up to the end of the run after it,
+    so any other head that ends inside that run would fail the same way and isn't tried again
+    (finditer would try each of them, which is quadratic on long runs of repeated heads).
+
+    :param pattern: The whole pattern
+    :param head: The start of the pattern, every match of pattern starts with a match of it
+    :param run: Pattern matching the characters the lazy group can take
+    :param text: Text to search
+    :return: Iterator of the matches of pattern, in order
+    """
+
+    pattern_re: re.Pattern = re.compile(pattern, re.IGNORECASE)
+    head_re: re.Pattern = re.compile(head, re.IGNORECASE)
+    run_re: re.Pattern = re.compile(run, re.IGNORECASE)
+
+    pos: int = 0
+    failed_end: int = -1
+
+    while pos <= len(text):
+        head_match: re.Match | None = head_re.search(text, pos)
+        if head_match is None:
+            break
+        # endif
+
+        start: int = head_match.start()
+        if head_match.end() <= failed_end:
+            pos = start + 1
+            continue
+        # endif
+
+        match: re.Match | None = pattern_re.match(text, start)
+        if match is None:
+            # every head that ends before the end of this run fails too
+            failed_end = run_re.match(text, head_match.end()).end()
+            pos = start + 1
+        else:
+            yield match
+            pos = match.end() if match.end() > start else start + 1
+        # endif
+    # endwhile
+
+
+# enddef
+
+
+def _find_colon_grades(text: str) -> list[tuple[str, str]]:
+    """
+    Finds the same (subject, grade) pairs as the subject_colon_grade pattern of find_all_grades_regex
+    ("maths: A", "physics - B"), in time linear in the length of the text. A findall of that pattern tries every start
+    in a long run of letters against the whole run, so instead each separator is found and the subject is the run
+    of letters and spaces just before it.
+
+    :param text: Text to search
+    :return: List of (subject, grade) tuples, in order
+    """
+
+    # end of each run of letters and spaces -> where it starts
+    run_starts: dict[int, int] = {match.end(): match.start()
+                                  for match in re.finditer(r"[a-zA-Z\s]+", text, re.IGNORECASE)}
+
+    found: list[tuple[str, str]] = []
+    pos: int = 0
+
+    for separator in re.finditer(r"[:\-]\s*(A\*|D\*|A|B|C|D|E|U|M|P)", text, re.IGNORECASE):
+        colon: int = separator.start()
+        start: int = max(run_starts.get(colon, colon), pos)
+        if start >= colon:
+            continue
+        # endif
+
+        # the subject is as short as it can be, so the spaces before the separator aren't part of it
+        end: int = max(start + 1, start + len(text[start:colon].rstrip()))
+        found.append((text[start:end], separator.group(1)))
+        pos = separator.end()
+    # endfor
+
+    return found
+
+
+# enddef
+
+
+def _remove_spans(text: str, spans: list[tuple[int, int]]) -> str:
+    """
+    :param text: Text to remove parts of
+    :param spans: (start, end) of each part, in order and not overlapping
+    :return: The text without those parts, the text itself if there are none
+    """
+
+    if not spans:
+        return text
+    # endif
+
+    parts: list[str] = []
+    pos: int = 0
+    for start, end in spans:
+        parts.append(text[pos:start])
+        pos = end
+    # endfor
+    parts.append(text[pos:])
+
+    return "".join(parts)
+
+
+# enddef
+
+
+def _spread_result(indexes: list[int], result: ParseResult) -> Iterator[tuple[int, ParseResult]]:
+    """
+    Gives the same parse result to every position an input appeared at.
+    Each repeat gets its own copy so changing one result doesn't change the others.
+
+    :param indexes: Positions of the input in the batch
+    :param result: Parse result for the input
+    :return: Iterator of (input index, parse result) pairs
+    """
+    yield indexes[0], result
+
+    for index in indexes[1:]:
+        yield index, copy.deepcopy(result)
+    # endfor
+
+
+# enddef
+
+
+def _init_parse_worker(synonyms: dict) -> None:
+    """
+    Runs once when a worker process starts, so it uses the same synonyms as the parent process.
+
+    :param synonyms: Synonyms dictionary from the parent process
+    """
+    set_synonyms(synonyms)
+
+
+# enddef
+
+
+def _parse_chunk(parser_class: type, engine: str, inputs: list[str]) -> list[ParseResult]:
+    """
+    Parses one chunk of inputs inside a worker process.
+
+    :param parser_class: GradeParser (or subclass) to parse with
+    :param engine: Grade engine of the parser that sent the chunk
+    :param inputs: Inputs in this chunk
+    :return: Parse results in the same order as the inputs, already worked out
+    """
+    parser = parser_class(engine=engine)
+
+    return [parser.parse(text).evaluate() for text in inputs]
+# enddef
@@ -0,0 +1,215 @@
+"""
+Optional timing of each stage of the grade parser.
+Pass a hook (any function that takes a StageTiming) to GradeParser to get told how long each stage took,
+or use StageStats to collect histograms of the timings.
+"""
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple
+
+
+class StageTiming(NamedTuple):
+    """
+    How long one parser stage took on one input.
+
+    stage is the stage name (e.g. "find_dropped_subjects", "tokenize", "find_course_interest").
+    wall_time and cpu_time are in seconds.
+    input_length is the length of the input the stage ran on.
+    matches is how many things the stage found (grades, courses, tokens, ...).
+    """
+    stage: str
+    wall_time: float
+    cpu_time: float
+    input_length: int
+    matches: int
+
+
+# endclass
+
+
+# Function that gets a StageTiming after every stage
+TimingHook = Callable[[StageTiming], None]
+
+
+class StageTimer:
+    """
+    Context manager that times one stage and passes the timing to the hook when the stage ends.
+    Set matches inside the block to report how many things the stage found.
+    """
+
+    __slots__ = ("hook", "stage", "input_length", "matches", "wall_start", "cpu_start")
+
+    def __init__(self, hook: TimingHook, stage: str, input_length: int):
+        self.hook: TimingHook = hook
+        self.stage: str = stage
+        self.input_length: int = input_length
+        self.matches: int = 0
+        self.wall_start: float = 0.0
+        self.cpu_start: float = 0.0
+
+    # enddef
+
+    def __enter__(self) -> "StageTimer":
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    # enddef
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        wall_time: float = time.perf_counter() - self.wall_start
+        cpu_time: float = time.process_time() - self.cpu_start
+        self.hook(StageTiming(self.stage, wall_time, cpu_time, self.input_length, self.matches))
+    # enddef
+
+
+# endclass
+
+
+class NullTimer:
+    """
+    Stand-in for StageTimer when no hook is set, so the parser stages cost nothing extra to time.
+    """
+
+    __slots__ = ("matches",)
+
+    def __enter__(self) -> "NullTimer":
+        return self
+
+    # enddef
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+    # enddef
+
+
+# endclass
+
+
+# Shared instance, matches written to it are just ignored
+NULL_TIMER: NullTimer = NullTimer()
+
+# Upper bounds of the histogram buckets in seconds (the last bucket takes everything slower)
+DEFAULT_BUCKETS: List[float] = [
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+]
+
+
+class StageTotals:
+    """
+    Totals and wall time histogram of one stage, kept by StageStats.
+    """
+
+    __slots__ = ("count", "wall_time", "cpu_time", "max_wall_time", "input_length", "matches", "histogram")
+
+    def __init__(self, buckets: int):
+        """
+        :param buckets: Number of histogram buckets
+        """
+
+        self.count: int = 0
+        self.wall_time: float = 0.0
+        self.cpu_time: float = 0.0
+        self.max_wall_time: float = 0.0
+        self.input_length: int = 0
+        self.matches: int = 0
+        # one count per bucket, plus one for anything slower than the last bucket
+        self.histogram: List[int] = [0] * (buckets + 1)
+    # enddef
+
+
+# endclass
+
+
+class StageStats:
+    """
+    Timing hook that keeps a histogram of wall times per stage, plus totals.
+    Safe to share between threads. Call dump() to get everything collected so far.
+    """
+
+    def __init__(self, buckets: List[float] | None = None):
+        """
+        :param buckets: Upper bounds of the histogram buckets in seconds, defaults to DEFAULT_BUCKETS
+        """
+
+        self.buckets: List[float] = sorted(buckets if buckets is not None else DEFAULT_BUCKETS)
+        self._stages: Dict[str, StageTotals] = {}
+        self._lock = threading.Lock()
+
+    # enddef
+
+    def __call__(self, timing: StageTiming) -> None:
+        """
+        Adds one stage timing. It runs after every stage of every parse, so it is kept short.
+
+        :param timing: Timing from the parser
+        """
+
+        stage, wall_time, cpu_time, input_length, matches = timing
+        bucket: int = bisect.bisect_left(self.buckets, wall_time)
+
+        with self._lock:
+            totals: StageTotals | None = self._stages.get(stage)
+
+            if totals is None:
+                totals = self._stages[stage] = StageTotals(len(self.buckets))
+            # endif
+
+            totals.count += 1
+            totals.wall_time += wall_time
+            totals.cpu_time += cpu_time
+            if wall_time > totals.max_wall_time:
+                totals.max_wall_time = wall_time
+            # endif
+            totals.input_length += input_length
+            totals.matches += matches
+            totals.histogram[bucket] += 1
+        # endwith
+
+    # enddef
+
+    def dump(self) -> Dict[str, Dict]:
+        """
+        Gets a copy of everything collected so far.
+
+        :return: Dictionary of stage name to its stats: count, total wall_time/cpu_time (seconds),
+            max_wall_time, total input_length, total matches, and "histogram" as a list of
+            (bucket upper bound in seconds, count) with None as the bound of the last bucket
+        """
+
+        with self._lock:
+            dumped: Dict[str, Dict] = {}
+
+            bounds: List[float | None] = list(self.buckets) + [None]
+
+            for stage, totals in self._stages.items():
+                dumped[stage] = {
+                    "count": totals.count,
+                    "wall_time": totals.wall_time,
+                    "cpu_time": totals.cpu_time,
+                    "max_wall_time": totals.max_wall_time,
+                    "input_length": totals.input_length,
+                    "matches": totals.matches,
+                    "histogram": list(zip(bounds, totals.histogram)),
+                }
+            # endfor
+
+            return dumped
+        # endwith
+
+    # enddef
+
+    def reset(self) -> None:
+        """
+        Forgets everything collected so far.
+        """
+
+        with self._lock:
+            self._stages.clear()
+        # endwith
+    # enddef
+
+
+# endclass
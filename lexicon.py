@@ -0,0 +1,63 @@
+"""
+The built lexicon: the combined synonyms and everything derived from them, as one read-only object.
+"""
+from typing import Mapping, NoReturn
+
+
+class Lexicon(dict):
+    """
+    Read-only dictionary of the built synonyms (see load_combined_synonyms), plus the version it was built as.
+    Changing the synonyms always makes a new Lexicon that is swapped in whole, so anything holding one
+    keeps seeing exactly the same synonyms, and the version can be used in cache keys.
+
+    It is still a dict, so lookups cost the same as before and it pickles for worker processes.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, synonyms: Mapping, version: int):
+        """
+        :param synonyms: Built synonyms, copied (not deeply) into the lexicon
+        :param version: Version number of this lexicon, also stored under "version"
+        """
+
+        super().__init__(synonyms)
+        dict.__setitem__(self, "version", version)
+
+    # enddef
+
+    @property
+    def version(self) -> int:
+        """
+        :return: Version number of this lexicon
+        """
+        return dict.__getitem__(self, "version")
+
+    # enddef
+
+    def _read_only(self, *args, **kwargs) -> NoReturn:
+        raise TypeError("Lexicon is read-only, build a new one (see apply_synonym_changes) instead")
+
+    # enddef
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self) -> tuple:
+        # pickle by value, the default for dict subclasses sets the items one by one
+        return Lexicon, (dict(self), self.version)
+
+    # enddef
+
+    def __copy__(self) -> "Lexicon":
+        return self
+
+    # enddef
+
+    def __deepcopy__(self, memo: dict) -> "Lexicon":
+        # nothing in it is ever changed, so copies can share it
+        return self
+    # enddef
+
+
+# endclass
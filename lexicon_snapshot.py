@@ -0,0 +1,179 @@
+"""
+Saves the built lexicon (combined synonyms, indexes and matchers) to disk, so a new worker process can load it
+in milliseconds instead of building it again. Each snapshot is keyed by a fingerprint of everything it was built from
+(the hardcoded synonyms and the Course/SubjectRequirement rows), so a snapshot is only used for exactly the same data.
+
+Snapshots are pickles, so only point this at a directory that only the deployment can write to.
+
+Build one ahead of time from a fixtures dump with
+    python manage.py dumpdata coursefinder.Course coursefinder.SubjectRequirement > fixtures.json
+    python -m mysite.apps.nlp build-lexicon fixtures.json --output /var/cache/nlp
+and start the workers with NLP_LEXICON_SNAPSHOT_DIR=/var/cache/nlp.
+"""
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import tempfile
+from typing import Dict
+
+from .parser_utils import DatabaseRows
+from .synonyms import SYNONYMS
+
+# Bump when what goes into a snapshot (or how the lexicon is built) changes, so old snapshots aren't used
+SNAPSHOT_FORMAT: int = 6
+
+# Environment variable with the snapshot directory, used by load_combined_synonyms
+SNAPSHOT_DIR_ENV: str = "NLP_LEXICON_SNAPSHOT_DIR"
+
+# Model labels of the rows in a Django fixtures dump
+COURSE_MODEL: str = "coursefinder.course"
+SUBJECT_MODEL: str = "coursefinder.subjectrequirement"
+
+
+def lexicon_fingerprint(rows: DatabaseRows) -> str:
+    """
+    Works out a fingerprint of everything the lexicon is built from.
+
+    :param rows: Database rows the lexicon is built from
+    :return: Hex digest that changes whenever the hardcoded synonyms, the rows or the snapshot format change
+    """
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps([SNAPSHOT_FORMAT, SYNONYMS], sort_keys=True).encode())
+
+    for table in (rows.courses, rows.subjects):
+        table_rows: list = sorted(table.items(), key=lambda row: str(row[0]))
+        digest.update(json.dumps(table_rows, default=str).encode())
+    # endfor
+
+    return digest.hexdigest()
+
+
+# enddef
+
+
+def snapshot_path(directory: str, fingerprint: str) -> str:
+    """
+    :param directory: Snapshot directory
+    :param fingerprint: Fingerprint from lexicon_fingerprint
+    :return: Path of the snapshot for that fingerprint
+    """
+    return os.path.join(directory, f"lexicon-v{SNAPSHOT_FORMAT}-{fingerprint[:32]}.pickle")
+
+
+# enddef
+
+
+def save_snapshot(directory: str, synonyms: Dict, fingerprint: str) -> str | None:
+    """
+    Saves a built lexicon. The file is written under a temporary name and then renamed,
+    so other processes never see half a snapshot.
+
+    :param directory: Snapshot directory, made if it doesn't exist
+    :param synonyms: Dictionary from build_combined_synonyms
+    :param fingerprint: Fingerprint of the rows it was built from
+    :return: Path of the snapshot, or None if it couldn't be written
+    """
+
+    # the version only means something inside one process
+    lexicon: Dict = {key: value for key, value in synonyms.items() if key != "version"}
+    payload: Dict = {"format": SNAPSHOT_FORMAT, "fingerprint": fingerprint, "synonyms": lexicon}
+    path: str = snapshot_path(directory, fingerprint)
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+
+        handle, temp_path = tempfile.mkstemp(dir=directory, prefix=".lexicon-", suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as temp_file:
+                pickle.dump(payload, temp_file, protocol=pickle.HIGHEST_PROTOCOL)
+            # endwith
+            # mkstemp makes it private, workers may run as another user
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        # endtry
+
+    except OSError:
+        # a read-only or missing directory just means building the lexicon every time, like without snapshots
+        return None
+    # endtry
+
+    return path
+
+
+# enddef
+
+
+def load_snapshot(directory: str, fingerprint: str) -> Dict | None:
+    """
+    Loads the lexicon saved for a fingerprint. The file is memory-mapped and unpickled straight from the map.
+
+    :param directory: Snapshot directory
+    :param fingerprint: Fingerprint of the rows the lexicon should be built from
+    :return: The synonyms dictionary (without a version), or None if there is no usable snapshot for it
+    """
+
+    path: str = snapshot_path(directory, fingerprint)
+
+    try:
+        with open(path, "rb") as snapshot_file:
+            with mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                payload = pickle.loads(mapped)
+            # endwith
+        # endwith
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        # missing, empty, or written by code that no longer matches: build the lexicon instead
+        return None
+    # endtry
+
+    if not isinstance(payload, dict) or payload.get("format") != SNAPSHOT_FORMAT \
+            or payload.get("fingerprint") != fingerprint:
+        return None
+    # endif
+
+    return payload["synonyms"]
+
+
+# enddef
+
+
+def read_fixture_rows(path: str) -> DatabaseRows:
+    """
+    Reads the Course and SubjectRequirement rows from a Django fixtures dump (dumpdata as json or jsonl),
+    without needing Django or a database.
+
+    :param path: Path of the fixtures file
+    :return: DatabaseRows with the course names and subjects in the dump
+    """
+
+    with open(path, encoding="utf-8") as fixture_file:
+        text: str = fixture_file.read()
+    # endwith
+
+    if text.lstrip().startswith("["):
+        objects: list = json.loads(text)
+    else:
+        objects = [json.loads(line) for line in text.splitlines() if line.strip()]
+    # endif
+
+    courses: Dict = {}
+    subjects: Dict = {}
+
+    for obj in objects:
+        model: str = str(obj.get("model", "")).lower()
+        fields: Dict = obj.get("fields") or {}
+
+        if model == COURSE_MODEL and fields.get("name"):
+            courses[obj.get("pk")] = fields["name"]
+        elif model == SUBJECT_MODEL and fields.get("subject"):
+            subjects[obj.get("pk")] = fields["subject"]
+        # endif
+    # endfor
+
+    return DatabaseRows(courses=courses, subjects=subjects)
+# enddef
@@ -0,0 +1,704 @@
+"""
+Prebuilt matchers for the phrase lists and course names in the synonyms, so each
+parsing stage can scan the input once instead of once per phrase
+"""
+import bisect
+import re
+import sys
+from array import array
+from typing import Dict, List, Tuple
+
+
+def build_phrase_pattern(phrases: List[str]) -> str:
+    """
+    Builds one regex alternation that matches any of the given phrases.
+    The phrases are put into a character trie first, so shared prefixes are only written once
+    (e.g. "dropped" and "dropped out" become "dropped(?: out)?") and the longest phrase is always tried first.
+
+    :param phrases: List of plain text phrases (e.g. ["gave up", "gave in", "quit"])
+    :return: Regex source string matching any of the phrases, with all special characters escaped
+    """
+
+    # Build the trie, "" marks the end of a phrase
+    trie: dict = {}
+
+    for phrase in phrases:
+        if not phrase:
+            continue
+        # endif
+
+        node: dict = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        # endfor
+        node[""] = {}
+    # endfor
+
+    if not trie:
+        # Nothing to match, so use a pattern that can never match
+        return r"(?!)"
+    # endif
+
+    return _trie_to_pattern(trie)
+
+
+# enddef
+
+
+def _trie_to_pattern(node: dict) -> str:
+    """
+    Turns one trie node into regex source for everything below it.
+
+    :param node: Trie node from build_phrase_pattern
+    :return: Regex source string for the phrases under this node
+    """
+
+    is_end: bool = "" in node
+    branches: list[str] = []
+
+    for char in sorted(key for key in node if key):
+        branches.append(re.escape(char) + _trie_to_pattern(node[char]))
+    # endfor
+
+    if not branches:
+        return ""
+    # endif
+
+    if len(branches) == 1 and not is_end:
+        return branches[0]
+    # endif
+
+    body: str = "(?:" + "|".join(branches) + ")"
+
+    # A phrase also ends here, so the rest is optional (greedy, so the longer phrase is tried first)
+    if is_end:
+        body += "?"
+    # endif
+
+    return body
+
+
+# enddef
+
+
+def build_phrase_patterns(synonyms: Dict) -> Dict[str, re.Pattern]:
+    """
+    Compiles the phrase lists in the synonyms into the patterns used by the parser.
+    This is done once per synonyms load so the parser never builds regexes per phrase.
+
+    :param synonyms: Dictionary with "dropped", "interest" and "none" phrase lists
+    :return: Dictionary of compiled patterns:
+        "dropped" / "interest" / "none" - match any phrase from that list
+        "dropped_clause" - a dropped phrase plus the subjects after it (e.g. "i dropped music and drama")
+        "interest_tail" - an interest phrase that has words after it, find_tails gets where those words are
+
+    Every pattern takes time linear in the length of the text: none of them has nested or overlapping
+    quantifiers that could backtrack, and none of them looks at more than the words right after a match.
+    """
+
+    dropped: str = build_phrase_pattern(synonyms["dropped"])
+    interest: str = build_phrase_pattern(synonyms["interest"])
+    none: str = build_phrase_pattern(synonyms["none"])
+
+    patterns: Dict[str, re.Pattern] = {
+        "dropped": re.compile(dropped),
+        "interest": re.compile(interest),
+        "none": re.compile(none),
+        # The subjects run to the first character that isn't a letter or space ("and" is part of the run)
+        "dropped_clause": re.compile(rf"(?:\bi\s+)?(?:{dropped})\s+([a-z\s]+)"),
+        # Only checks that words come after the phrase, capturing them here would scan the rest of the input
+        # again for every phrase in it
+        "interest_tail": re.compile(rf"(?:{interest})(?=\s[a-z\s])"),
+    }
+
+    return patterns
+# enddef
+
+
+# Pieces find_tails works out the words after an interest phrase with
+TAIL_SPACE_PATTERN = re.compile(r"\s+")
+TAIL_WORDS_PATTERN = re.compile(r"[a-z\s]*")
+
+
+def find_tails(pattern: re.Pattern, text: str) -> List[Tuple[int, int]]:
+    r"""
+    Finds the words after each match of an "interest_tail" pattern: the letters and spaces after the phrase
+    (past the spaces right after it) up to the first other character, the same as r"\s+([a-z\s]+)" captures.
+
+    Tails in the same run of letters and spaces all end where the run ends, so each run is only scanned once
+    however many phrases are in it, and the whole search is linear in the length of the text.
+
+    :param pattern: The "interest_tail" pattern from build_phrase_patterns
+    :param text: Lowercase text to search
+    :return: List of (start, end) of each tail, in text order
+    """
+
+    tails: List[Tuple[int, int]] = []
+    run_end: int = 0
+
+    for match in pattern.finditer(text):
+        words_start: int = TAIL_SPACE_PATTERN.match(text, match.end()).end()
+
+        if words_start >= run_end:
+            run_end = TAIL_WORDS_PATTERN.match(text, words_start).end()
+        # endif
+
+        if words_start < run_end:
+            tails.append((words_start, run_end))
+        else:
+            # only spaces before the run ends, the pattern made sure there are at least two, the last one is the tail
+            tails.append((words_start - 1, words_start))
+        # endif
+    # endfor
+
+    return tails
+
+
+# enddef
+
+
+# Punctuation that ends a sentence when whitespace comes after it
+SENTENCE_ENDS: str = ".!?;"
+
+
+def build_sentence_pattern(synonyms: Dict) -> re.Pattern:
+    """
+    Builds the pattern inputs are split into sentences with. None of the parser's rules look past these
+    (grade lists, dropped clauses, interest phrases and course names all stop at them),
+    so every sentence can be parsed on its own. Punctuation that some phrase in the synonyms has
+    before a space or at its end is left out, so no phrase is ever split.
+
+    :param synonyms: Dictionary with the "subject_index", "courses" (name -> aliases),
+        "dropped", "interest" and "none" phrases
+    :return: Pattern matching the end of each sentence
+    """
+
+    phrases: List[str] = list(synonyms["subject_index"]) + list(synonyms["dropped"]) \
+        + list(synonyms["interest"]) + list(synonyms["none"]) + list(synonyms["courses"])
+    for aliases in synonyms["courses"].values():
+        phrases.extend(aliases)
+    # endfor
+
+    ends: str = ""
+    for end in SENTENCE_ENDS:
+        end_pattern: re.Pattern = re.compile(re.escape(end) + r"(?:\s|$)")
+        # the substring check skips the regex for almost every phrase, this runs on every synonym change
+        if not any(end in phrase and end_pattern.search(phrase) for phrase in phrases):
+            ends += end
+        # endif
+    # endfor
+
+    if not ends:
+        # Nothing is safe to split at, every input is one sentence
+        return re.compile(r"(?!)")
+    # endif
+
+    return re.compile(rf"[{re.escape(ends)}](?=\s)")
+
+
+# enddef
+
+
+def find_sentences(pattern: re.Pattern, text: str) -> List[Tuple[int, int]]:
+    """
+    Finds the sentences of a text. Each one ends right after its sentence end, and the whitespace after it
+    goes with the next one, so the sentences cover the whole text.
+
+    :param pattern: Pattern from build_sentence_pattern
+    :param text: Text to split
+    :return: List of (start, end) of each sentence, in text order, empty for an empty text
+    """
+
+    sentences: List[Tuple[int, int]] = []
+    start: int = 0
+
+    for match in pattern.finditer(text):
+        sentences.append((start, match.end()))
+        start = match.end()
+    # endfor
+
+    if start < len(text):
+        sentences.append((start, len(text)))
+    # endif
+
+    return sentences
+
+
+# enddef
+
+
+# Tokens the extra phrases of a LayeredPhraseMatcher are looked up by: runs of word characters
+# (the same ones _is_word_char accepts) and single punctuation characters
+PHRASE_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+class PhraseMatcher:
+    """
+    Finds every phrase from a fixed set in a piece of text in one pass (Aho-Corasick automaton).
+    Matches only count on whole words, and overlapping matches are resolved by keeping the
+    leftmost, then longest one (e.g. "english literature" wins over "english").
+
+    Once built it is never changed, and it is kept compact so processes forked after building it share it:
+    the fail links are one array and the outputs are tuples. The transitions stay one small dictionary per state,
+    they only hold strings and ints so the garbage collector never tracks them, and looking characters up in them
+    is about twice as fast as in flat array tables.
+    """
+
+    __slots__ = ("phrases", "goto", "fail", "output")
+
+    def __init__(self, phrases: Dict[str, Tuple[str, ...]]):
+        """
+        Builds the automaton for the given phrases.
+
+        :param phrases: Dictionary of lowercase phrase to the values it stands for,
+            e.g. {"ecology": ("biology", "environmental science")}
+        """
+
+        # Phrases the automaton was built from
+        self.phrases: Dict[str, Tuple[str, ...]] = phrases
+
+        # goto[state] maps a character to the next state, state 0 is the root
+        self.goto: list[dict[str, int]] = [{}]
+        fail: list[int] = [0]
+        # Every phrase ending at a state, as (phrase length, values)
+        output: list[list[tuple[int, Tuple[str, ...]]]] = [[]]
+
+        for phrase, values in phrases.items():
+            if not phrase:
+                continue
+            # endif
+
+            state: int = 0
+            for char in phrase:
+                next_state: int = self.goto[state].get(char, -1)
+                if next_state == -1:
+                    next_state = len(self.goto)
+                    self.goto.append({})
+                    fail.append(0)
+                    output.append([])
+                    self.goto[state][char] = next_state
+                # endif
+                state = next_state
+            # endfor
+
+            output[state].append((len(phrase), values))
+        # endfor
+
+        # Breadth-first pass to set the fail links, each state also reports the phrases of its fail state
+        queue: list[int] = list(self.goto[0].values())
+        head: int = 0
+
+        while head < len(queue):
+            state: int = queue[head]
+            head += 1
+
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+
+                fallback: int = fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = fail[fallback]
+                # endwhile
+
+                fail[next_state] = self.goto[fallback].get(char, 0)
+                output[next_state] = output[next_state] + output[fail[next_state]]
+            # endfor
+        # endwhile
+
+        self.fail: array = array("l", fail)
+        # Most states have no output, they all share the empty tuple
+        self.output: Tuple[Tuple[tuple[int, Tuple[str, ...]], ...], ...] = tuple(tuple(ends) for ends in output)
+
+    # enddef
+
+    def find_candidates(self, text: str) -> list[tuple[int, int, Tuple[str, ...]]]:
+        """
+        Finds all whole-word phrase matches in the text, including overlapping ones.
+
+        :param text: Lowercase text to search
+        :return: List of (start, end, values) for each match, in no particular order
+        """
+
+        candidates: list[tuple[int, int, Tuple[str, ...]]] = []
+        state: int = 0
+        text_length: int = len(text)
+
+        for i, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            # endwhile
+            state = self.goto[state].get(char, 0)
+
+            for length, values in self.output[state]:
+                start: int = i - length + 1
+                end: int = i + 1
+
+                # Only keep it if it's a whole word (not "art" inside "party")
+                if start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                # endif
+                if end < text_length and _is_word_char(text[end]):
+                    continue
+                # endif
+
+                candidates.append((start, end, values))
+            # endfor
+        # endfor
+
+        return candidates
+
+    # enddef
+
+    def find_all(self, text: str) -> list[tuple[int, int, Tuple[str, ...]]]:
+        """
+        Finds all whole-word phrase matches in the text, without overlaps.
+
+        :param text: Lowercase text to search
+        :return: List of (start, end, values) for each match, in the order they appear in the text
+        """
+
+        candidates: list[tuple[int, int, Tuple[str, ...]]] = self.find_candidates(text)
+
+        # Keep the leftmost match, and the longest one when they start at the same place
+        candidates.sort(key=lambda match: (match[0], -match[1]))
+
+        matches: list[tuple[int, int, Tuple[str, ...]]] = []
+        last_end: int = 0
+
+        for match in candidates:
+            if match[0] >= last_end:
+                matches.append(match)
+                last_end = match[1]
+            elif matches and match[:2] == matches[-1][:2]:
+                # The same phrase found twice (see LayeredPhraseMatcher), keep the values of both
+                start, end, values = matches[-1]
+                matches[-1] = (start, end, values + tuple(value for value in match[2] if value not in values))
+            # endif
+        # endfor
+
+        return matches
+
+    # enddef
+
+    def find_values(self, text: str) -> list[str]:
+        """
+        Finds the values of all phrases in the text.
+
+        :param text: Lowercase text to search
+        :return: List of values for the matched phrases, in text order with duplicates removed
+        """
+
+        found: list[str] = []
+
+        for start, end, values in self.find_all(text):
+            for value in values:
+                if value not in found:
+                    found.append(value)
+                # endif
+            # endfor
+        # endfor
+
+        return found
+
+    # enddef
+
+    def find_values_in_tails(self, text: str, tails: List[Tuple[int, int]]) -> list[str]:
+        """
+        Finds the values of all phrases in each tail (see find_tails), the same as calling find_values on each
+        tail and joining the results with duplicates removed.
+
+        Tails that end at the same place are the ends of one run of words, so the run is matched once and
+        each tail only follows the matches after its start until it reaches ones an earlier tail already went
+        through. This stays linear in the length of the text even when every word starts a tail.
+
+        :param text: Lowercase text the tails are in
+        :param tails: (start, end) of each tail in text order, each starting at a word or a space
+        :return: List of values for the matched phrases, in order with duplicates removed
+        """
+
+        found: list[str] = []
+        seen: set[str] = set()
+        first: int = 0
+
+        while first < len(tails):
+            run_start, run_end = tails[first]
+            last: int = first
+            while last < len(tails) and tails[last][1] == run_end:
+                last += 1
+            # endwhile
+
+            # Matches in the run the same way find_all picks them: leftmost, then longest,
+            # with the values of the same phrase found twice put together
+            starts: list[int] = []
+            ends: list[int] = []
+            values: list[Tuple[str, ...]] = []
+            for start, end, match_values in sorted(self.find_candidates(text[run_start:run_end]),
+                                                   key=lambda match: (match[0], -match[1])):
+                if starts and starts[-1] == start and ends[-1] == end:
+                    values[-1] = values[-1] + tuple(value for value in match_values if value not in values[-1])
+                else:
+                    starts.append(start)
+                    ends.append(end)
+                    values.append(match_values)
+                # endif
+            # endfor
+
+            # A tail takes the first match at or after its start, then the first one after that match, and so on
+            taken: set[int] = set()
+            for tail_start, _ in tails[first:last]:
+                index: int = bisect.bisect_left(starts, tail_start - run_start)
+                while index < len(starts) and index not in taken:
+                    taken.add(index)
+                    for value in values[index]:
+                        if value not in seen:
+                            seen.add(value)
+                            found.append(value)
+                        # endif
+                    # endfor
+                    index = bisect.bisect_left(starts, ends[index])
+                # endwhile
+            # endfor
+
+            first = last
+        # endwhile
+
+        return found
+
+    # enddef
+
+    def values_for(self, phrase: str) -> Tuple[str, ...]:
+        """
+        :param phrase: Lowercase phrase
+        :return: Values the phrase stands for, empty if it isn't one of the phrases
+        """
+        return self.phrases.get(phrase, ())
+    # enddef
+
+
+# endclass
+
+
+class LayeredPhraseMatcher(PhraseMatcher):
+    """
+    PhraseMatcher with extra phrases on top that can be changed without rebuilding the automaton.
+    The automaton is shared with the base matcher. The extra phrases are kept in dictionaries keyed by
+    their tokens (words and punctuation), so each word of the text is only checked against the extra
+    phrases starting with it, and changing them only copies those dictionaries.
+    Used for the courses, where the hardcoded ones never change and the ones from the database do.
+    """
+
+    __slots__ = ("base", "extra", "extra_keys", "extra_first_tokens", "extra_max_tokens")
+
+    def __init__(self, base: PhraseMatcher, extra: Dict[str, Tuple[str, ...]]):
+        """
+        :param base: Matcher built from the phrases that don't change
+        :param extra: Dictionary of lowercase phrase to the values it stands for, on top of the base ones
+        """
+
+        self.base: PhraseMatcher = base
+        self.phrases: Dict[str, Tuple[str, ...]] = base.phrases
+        self.goto = base.goto
+        self.fail = base.fail
+        self.output = base.output
+
+        self.extra: Dict[str, Tuple[str, ...]] = {}
+
+        # tokens of a phrase -> extra phrases with those tokens (they can differ in spacing)
+        self.extra_keys: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+        # first token -> number of extra token keys starting with it
+        self.extra_first_tokens: Dict[str, int] = {}
+
+        # most tokens in an extra phrase (never goes down, a higher value only means a few more lookups)
+        self.extra_max_tokens: int = 0
+
+        for phrase, values in extra.items():
+            self._set_extra(phrase, values)
+        # endfor
+
+    # enddef
+
+    def _set_extra(self, phrase: str, values: Tuple[str, ...]) -> None:
+        """
+        Adds, changes or (with no values) removes one extra phrase.
+
+        :param phrase: Lowercase phrase
+        :param values: Values it stands for on top of the base ones
+        """
+
+        key: Tuple[str, ...] = tuple(PHRASE_TOKEN_PATTERN.findall(phrase))
+        if not key:
+            return
+        # endif
+
+        phrases: Tuple[str, ...] = self.extra_keys.get(key, ())
+
+        if values:
+            self.extra[phrase] = values
+
+            if phrase not in phrases:
+                if not phrases:
+                    self.extra_first_tokens[key[0]] = self.extra_first_tokens.get(key[0], 0) + 1
+                # endif
+                self.extra_keys[key] = phrases + (phrase,)
+                self.extra_max_tokens = max(self.extra_max_tokens, len(key))
+            # endif
+        elif phrase in self.extra:
+            del self.extra[phrase]
+            phrases = tuple(other for other in phrases if other != phrase)
+
+            if phrases:
+                self.extra_keys[key] = phrases
+            else:
+                del self.extra_keys[key]
+
+                self.extra_first_tokens[key[0]] -= 1
+                if not self.extra_first_tokens[key[0]]:
+                    del self.extra_first_tokens[key[0]]
+                # endif
+            # endif
+        # endif
+
+    # enddef
+
+    def with_values_moved(self, moves: List[Tuple[str, set[str], set[str]]]) -> "LayeredPhraseMatcher":
+        """
+        Makes a copy where some values stand for a new set of phrases instead of their old one,
+        e.g. courses from the database that were added, renamed or deleted. This matcher isn't changed.
+
+        :param moves: List of (value, phrases it stood for before, phrases it stands for now),
+            with an empty set of old phrases for a new value and of new phrases for a removed one
+        :return: New LayeredPhraseMatcher sharing this one's automaton
+        """
+
+        changed: LayeredPhraseMatcher = LayeredPhraseMatcher(self.base, {})
+        changed.extra = dict(self.extra)
+        changed.extra_keys = dict(self.extra_keys)
+        changed.extra_first_tokens = dict(self.extra_first_tokens)
+        changed.extra_max_tokens = self.extra_max_tokens
+
+        for value, old_phrases, new_phrases in moves:
+            for phrase in old_phrases | new_phrases:
+                values: Tuple[str, ...] = tuple(other for other in changed.extra.get(phrase, ()) if other != value)
+
+                # Only values the base doesn't already give for this phrase are extra
+                if phrase in new_phrases and value not in self.base.phrases.get(phrase, ()):
+                    values = values + (value,)
+                # endif
+
+                changed._set_extra(phrase, values)
+            # endfor
+        # endfor
+
+        return changed
+
+    # enddef
+
+    def values_for(self, phrase: str) -> Tuple[str, ...]:
+        """
+        :param phrase: Lowercase phrase
+        :return: Values the phrase stands for in the base and then the extra phrases, empty if it is in neither
+        """
+        return self.base.phrases.get(phrase, ()) + self.extra.get(phrase, ())
+
+    # enddef
+
+    def find_candidates(self, text: str) -> list[tuple[int, int, Tuple[str, ...]]]:
+        """
+        Finds all whole-word matches of the base and extra phrases in the text, including overlapping ones.
+
+        :param text: Lowercase text to search
+        :return: List of (start, end, values) for each match, in no particular order
+        """
+
+        candidates: list[tuple[int, int, Tuple[str, ...]]] = super().find_candidates(text)
+
+        if not self.extra:
+            return candidates
+        # endif
+
+        tokens: list[re.Match] = list(PHRASE_TOKEN_PATTERN.finditer(text))
+        text_length: int = len(text)
+
+        for i, token in enumerate(tokens):
+            start: int = token.start()
+
+            if token.group() not in self.extra_first_tokens:
+                continue
+            # endif
+
+            # Only whole words (punctuation tokens can follow a word straight away)
+            if start > 0 and _is_word_char(text[start - 1]):
+                continue
+            # endif
+
+            key: list[str] = []
+            for last in tokens[i:i + self.extra_max_tokens]:
+                key.append(last.group())
+                end: int = last.end()
+
+                for phrase in self.extra_keys.get(tuple(key), ()):
+                    if text[start:end] == phrase and not (end < text_length and _is_word_char(text[end])):
+                        candidates.append((start, end, self.extra[phrase]))
+                    # endif
+                # endfor
+            # endfor
+        # endfor
+
+        return candidates
+    # enddef
+
+
+# endclass
+
+
+def _is_word_char(char: str) -> bool:
+    """
+    Checks if a character counts as part of a word (same idea as regex \\w).
+
+    :param char: Single character
+    :return: True if it is a letter, digit or underscore
+    """
+    return char.isalnum() or char == "_"
+
+
+# enddef
+
+
+def build_course_matcher(courses: Dict[str, List[str]], base: PhraseMatcher | None = None) -> PhraseMatcher:
+    """
+    Builds a matcher that finds every course name and alias in a piece of text.
+
+    :param courses: Dictionary of main course names to their list of aliases
+    :param base: Optional matcher already built for some of these courses (e.g. the hardcoded ones).
+        If given, only the names/aliases it doesn't have go into a LayeredPhraseMatcher on top of it.
+    :return: PhraseMatcher mapping each name/alias to the main course names it belongs to
+    """
+
+    phrases: Dict[str, Tuple[str, ...]] = {}
+
+    for course, aliases in courses.items():
+        for name in [course] + list(aliases):
+            name = sys.intern(name.lower().strip())
+            values: Tuple[str, ...] = phrases.get(name, ())
+            if course not in values:
+                phrases[name] = values + (course,)
+            # endif
+        # endfor
+    # endfor
+
+    if base is None:
+        return PhraseMatcher(phrases)
+    # endif
+
+    extra: Dict[str, Tuple[str, ...]] = {}
+
+    for name, values in phrases.items():
+        new_values: Tuple[str, ...] = tuple(value for value in values if value not in base.phrases.get(name, ()))
+        if new_values:
+            extra[name] = new_values
+        # endif
+    # endfor
+
+    return LayeredPhraseMatcher(base, extra)
+# enddef
@@ -0,0 +1,252 @@
+"""
+Parser metrics in the Prometheus text format, written to a file (for node_exporter's textfile collector)
+or served on a local port for Prometheus to scrape.
+
+    stats = StageStats()
+    parser = GradeParser(cache=ParseCache(), timing_hook=stats, timing_sample=10)
+    exporter = MetricsExporter(stats, parser.cache)
+    exporter.serve(9464)                                          # or, every so often:
+    exporter.write("/var/lib/node_exporter/textfile/nlp_parser.prom")
+
+The stage timings come from the parser's timing hook (see instrumentation.py), so parses cost nothing extra
+when nothing collects them, and only a little when one stage run in timing_sample is timed (the stage metrics
+are then of the timed runs only). Everything else (cache counters, lexicon size and build time) is only read
+when the metrics are rendered.
+"""
+import math
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+from .instrumentation import StageStats
+from .parse_cache import ParseCache
+from .parser_utils import get_lexicon_cache_stats, get_lexicon_stats
+
+# Start of every metric name
+PREFIX: str = "nlp_parser"
+
+# Content type of the Prometheus text format
+CONTENT_TYPE: str = "text/plain; version=0.0.4; charset=utf-8"
+
+# Lexicon stats (see get_lexicon_stats) exported as gauges, with their help text
+LEXICON_GAUGES: Dict[str, str] = {
+    "version": "Version of the lexicon in use, goes up every time it is rebuilt",
+    "subjects": "Main subjects in the lexicon",
+    "subject_aliases": "Subject names and synonyms in the lexicon",
+    "courses": "Main courses in the lexicon",
+    "course_rows": "Course rows the lexicon was built from",
+    "subject_rows": "SubjectRequirement rows the lexicon was built from",
+    "build_seconds": "Seconds the last load or set of changes took to build the lexicon",
+}
+
+
+def format_value(value: float) -> str:
+    """
+    :param value: Number to write
+    :return: The number as Prometheus writes it
+    """
+
+    if isinstance(value, int):
+        return str(value)
+    elif math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    # endif
+
+    return repr(float(value))
+
+
+# enddef
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    """
+    :param labels: Label name -> value
+    :return: The labels as Prometheus writes them, e.g. '{stage="tokenize"}', "" if there are none
+    """
+
+    if not labels:
+        return ""
+    # endif
+
+    escaped: List[str] = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    # endfor
+
+    return "{" + ",".join(escaped) + "}"
+
+
+# enddef
+
+
+class MetricsExporter:
+    """
+    Collects the parser's metrics into the Prometheus text format:
+    - latency histograms, CPU time, input length and match counts per parser stage (the regex engine's stages
+      are its patterns, so these are also the match counts per pattern)
+    - hits, misses and hit ratio of the parse cache and of the lexicon's fuzzy lookups and course name cleaning
+    - size, version and build time of the lexicon
+    """
+
+    def __init__(self, stats: StageStats | None = None, cache: ParseCache | None = None):
+        """
+        :param stats: Timing hook the parser was made with, None leaves out the stage metrics
+        :param cache: Cache the parser was made with, None leaves out the parse cache metrics
+        """
+
+        self.stats: StageStats | None = stats
+        self.cache: ParseCache | None = cache
+
+    # enddef
+
+    def render(self) -> str:
+        """
+        :return: Every metric, in the Prometheus text format
+        """
+
+        lines: List[str] = []
+
+        def add(name: str, kind: str, help: str, samples: List[Tuple[str, Dict[str, str], float]]) -> None:
+            lines.append(f"# HELP {PREFIX}_{name} {help}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{PREFIX}_{name}{suffix}{format_labels(labels)} {format_value(value)}")
+            # endfor
+
+        # enddef
+
+        if self.stats is not None:
+            stages: Dict[str, Dict] = self.stats.dump()
+
+            histogram: List[Tuple[str, Dict[str, str], float]] = []
+            for stage, stage_stats in stages.items():
+                count: int = 0
+                for bound, bucket_count in stage_stats["histogram"]:
+                    # Prometheus buckets count everything up to their bound, the last one everything
+                    count += bucket_count
+                    le: str = format_value(math.inf if bound is None else float(bound))
+                    histogram.append(("_bucket", {"stage": stage, "le": le}, count))
+                # endfor
+                histogram.append(("_sum", {"stage": stage}, stage_stats["wall_time"]))
+                histogram.append(("_count", {"stage": stage}, stage_stats["count"]))
+            # endfor
+
+            add("stage_seconds", "histogram", "Wall time of each parser stage", histogram)
+            add("stage_cpu_seconds_total", "counter", "CPU time spent in each parser stage",
+                [("", {"stage": stage}, stage_stats["cpu_time"]) for stage, stage_stats in stages.items()])
+            add("stage_input_characters_total", "counter", "Characters of input each parser stage ran on",
+                [("", {"stage": stage}, stage_stats["input_length"]) for stage, stage_stats in stages.items()])
+            add("stage_matches_total", "counter", "Things (grades, courses, tokens, pattern matches) each stage found",
+                [("", {"stage": stage}, stage_stats["matches"]) for stage, stage_stats in stages.items()])
+        # endif
+
+        caches: Dict[str, Dict[str, int]] = self.cache_stats()
+        add("cache_hits_total", "counter", "Lookups answered from a cache",
+            [("", {"cache": cache}, cache_stats["hits"]) for cache, cache_stats in caches.items()])
+        add("cache_misses_total", "counter", "Lookups a cache didn't have",
+            [("", {"cache": cache}, cache_stats["misses"]) for cache, cache_stats in caches.items()])
+        add("cache_hit_ratio", "gauge", "Share of lookups answered from a cache so far",
+            [("", {"cache": cache}, cache_stats["hits"] / max(1, cache_stats["hits"] + cache_stats["misses"]))
+             for cache, cache_stats in caches.items()])
+        add("cache_size", "gauge", "Entries in a cache",
+            [("", {"cache": cache}, cache_stats["size"]) for cache, cache_stats in caches.items()])
+
+        lexicon: Dict[str, float] = get_lexicon_stats()
+        for name, help in LEXICON_GAUGES.items():
+            if name in lexicon:
+                add(f"lexicon_{name}", "gauge", help, [("", {}, lexicon[name])])
+            # endif
+        # endfor
+
+        return "\n".join(lines) + "\n"
+
+    # enddef
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        :return: Cache name -> its hits, misses and size, for the parse cache (if there is one)
+            and the caches behind the lexicon (see get_lexicon_cache_stats)
+        """
+
+        caches: Dict[str, Dict[str, int]] = {}
+
+        if self.cache is not None:
+            caches["parse"] = self.cache.stats()
+        # endif
+
+        caches.update(get_lexicon_cache_stats())
+
+        return caches
+
+    # enddef
+
+    def write(self, path: str) -> None:
+        """
+        Writes the metrics to a file. The file is written under a temporary name and then renamed,
+        so whatever reads it never sees half of it.
+
+        :param path: File to write, e.g. in node_exporter's textfile collector directory (ending in .prom)
+        """
+
+        directory: str = os.path.dirname(os.path.abspath(path))
+        handle, temp_path = tempfile.mkstemp(dir=directory, prefix=".nlp-metrics-", suffix=".tmp")
+        try:
+            with os.fdopen(handle, "w", encoding="utf-8") as temp_file:
+                temp_file.write(self.render())
+            # endwith
+            # mkstemp makes it private, the collector may run as another user
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        # endtry
+
+    # enddef
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """
+        Serves the metrics on /metrics from a background thread.
+
+        :param port: Port to listen on, 0 picks a free one (see server.server_port)
+        :param host: Address to listen on, only this machine by default
+        :return: The server, call shutdown() on it to stop it
+        """
+
+        exporter: MetricsExporter = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                # endif
+
+                body: bytes = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            # enddef
+
+            def log_message(self, format: str, *args) -> None:
+                # scrapes every few seconds would fill the logs
+                pass
+            # enddef
+
+        # endclass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="nlp-metrics", daemon=True).start()
+
+        return server
+    # enddef
+
+
+# endclass
@@ -0,0 +1,130 @@
+"""
+Size-limited cache for parse results, so repeated inputs don't go through the whole parser again
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable
+
+
+class ParseCache:
+    """
+    Least-recently-used cache of parse results, with an optional time limit per entry.
+    Results are copied going in and coming out, so callers can change what they get back
+    without changing the cached copy.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None):
+        """
+        :param maxsize: Most results to keep, the least recently used one is dropped after that
+        :param ttl: Seconds a result stays valid for, None keeps it until it is dropped
+        """
+
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        # endif
+
+        self.maxsize: int = maxsize
+        self.ttl: float | None = ttl
+
+        # key -> (time stored, result), oldest first
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    # enddef
+
+    def get(self, key: Hashable) -> dict | None:
+        """
+        Gets a copy of a cached result.
+
+        :param key: Cache key (see GradeParser.parse)
+        :return: Copy of the cached result, or None if it isn't cached or has expired
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+            # endif
+
+            stored_at, result = entry
+
+            if self.ttl is not None and time.monotonic() - stored_at >= self.ttl:
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            # endif
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # endwith
+
+        return copy.deepcopy(result)
+
+    # enddef
+
+    def put(self, key: Hashable, result: dict) -> None:
+        """
+        Stores a copy of a result, dropping the least recently used ones if the cache is full.
+
+        :param key: Cache key (see GradeParser.parse)
+        :param result: Parse result to store
+        """
+
+        stored: dict = copy.deepcopy(result)
+
+        with self._lock:
+            self._entries[key] = (time.monotonic(), stored)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            # endwhile
+        # endwith
+
+    # enddef
+
+    def clear(self) -> None:
+        """
+        Removes every cached result. The counters are kept.
+        """
+
+        with self._lock:
+            self._entries.clear()
+        # endwith
+
+    # enddef
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Gets the cache counters.
+
+        :return: Dictionary with hits, misses, evictions and the current size
+        """
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
+        # endwith
+
+    # enddef
+
+    def __len__(self) -> int:
+        return len(self._entries)
+    # enddef
+
+
+# endclass
@@ -0,0 +1,234 @@
+"""
+Result of GradeParser.parse, with each field only worked out when it is first used
+"""
+from copy import copy, deepcopy
+from typing import Dict, Iterator, List, Mapping, Tuple
+
+from .document import Document
+from .parser_utils import get_row_ids
+
+# Fields a parse result can have, in the order they are listed
+FIELDS: Tuple[str, ...] = ("grades", "interests")
+
+
+def check_fields(fields: Tuple[str, ...] | List[str]) -> Tuple[str, ...]:
+    """
+    Checks the fields asked for and puts them in the usual order.
+
+    :param fields: Field names, any of FIELDS
+    :return: Tuple of the fields in FIELDS order, without repeats
+    """
+
+    unknown: List[str] = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields {', '.join(map(repr, unknown))}, expected any of {', '.join(FIELDS)}")
+    # endif
+
+    return tuple(field for field in FIELDS if field in fields)
+
+
+# enddef
+
+
+class ParseResult(Mapping):
+    """
+    Grades and course interests found in one input. It is read like the dictionary parse used to return
+    (result["grades"], result["interests"], == against a dict, dict(result)), and also has them as attributes.
+    It is a Mapping but not a dict, so isinstance(result, dict) is False and json.dumps(result) raises TypeError:
+    use to_dict() for anything that needs a real dictionary, like a JSON response.
+
+    Nothing is parsed until a field is first used, and only the stages that field needs run:
+    grades only find grades, interests find the course interests (and the grades, to drop subjects that have one).
+    Every field (and the row ids, see course_ids) is worked out with the synonyms in use when parse was called
+    (see Document), however much later it is first read. Fields that weren't asked for aren't in the result at all.
+    Copying or pickling a result works out every field it has first, so copies and results sent back from worker
+    processes are complete. Copies keep the synonyms, pickles leave them out (they are the size of the lexicon),
+    so a result sent from another process looks its row ids up in the synonyms of the one that reads it.
+    """
+
+    __slots__ = ("fields", "synonyms", "_parser", "_input", "_grades", "_interests")
+
+    def __init__(self, parser, input: Document | None, fields: Tuple[str, ...] = FIELDS):
+        """
+        :param parser: GradeParser that works the fields out, None if they are all given already
+        :param input: User input to parse, shared by every stage that works out a field
+        :param fields: Fields the result has, from check_fields
+        """
+
+        self.fields: Tuple[str, ...] = fields
+        # lexicon the result is worked out with, None for results made from values with none given
+        self.synonyms: Mapping | None = input.synonyms if input is not None else None
+        self._parser = parser
+        self._input: Document | None = input
+        self._grades: Dict[str, str] | None = None
+        self._interests: List[str] | None = None
+
+    # enddef
+
+    @classmethod
+    def from_values(cls, grades: Dict[str, str] | None = None, interests: List[str] | None = None,
+                    synonyms: Mapping | None = None) -> "ParseResult":
+        """
+        Makes a result from fields that are already worked out.
+
+        :param grades: Grades, None if the result doesn't have them
+        :param interests: Course interests, None if the result doesn't have them
+        :param synonyms: Lexicon the fields were worked out with, None looks the row ids up in the current one
+        :return: ParseResult with just the fields given
+        """
+
+        result = cls(None, None, tuple(field for field, value in zip(FIELDS, (grades, interests)) if value is not None))
+        result._grades = grades
+        result._interests = interests
+        result.synonyms = synonyms
+
+        return result
+
+    # enddef
+
+    def _check(self, field: str) -> None:
+        if field not in self.fields:
+            raise KeyError(f"{field!r} wasn't asked for when parsing (fields={self.fields})")
+        # endif
+
+    # enddef
+
+    @property
+    def grades(self) -> Dict[str, str]:
+        """
+        :return: Dictionary of normalized subject to grade
+        """
+
+        if self._grades is None:
+            self._check("grades")
+            self._grades = self._parser.find_all_grades(self._input)
+            self._release()
+        # endif
+
+        return self._grades
+
+    # enddef
+
+    @property
+    def interests(self) -> List[str]:
+        """
+        :return: List of main course names the user is interested in
+        """
+
+        if self._interests is None:
+            self._check("interests")
+            # the grades are needed to leave out subjects that are only mentioned with a grade
+            grades: Dict[str, str] = self._grades
+            if grades is None:
+                grades = self._parser.find_all_grades(self._input)
+                if "grades" in self.fields:
+                    self._grades = grades
+                # endif
+            # endif
+            self._interests = self._parser.find_interests(self._input, grades)
+            self._release()
+        # endif
+
+        return self._interests
+
+    # enddef
+
+    def _release(self) -> None:
+        """
+        Lets go of the parser and input once every field is worked out.
+        """
+
+        if (self._grades is not None or "grades" not in self.fields) \
+                and (self._interests is not None or "interests" not in self.fields):
+            self._parser = None
+            self._input = None
+        # endif
+
+    # enddef
+
+    def evaluate(self) -> "ParseResult":
+        """
+        Works out every field now instead of when it is first used,
+        e.g. so the parsing happens in an executor thread rather than wherever the result is read.
+
+        :return: This result
+        """
+
+        for field in self.fields:
+            getattr(self, field)
+        # endfor
+
+        return self
+
+    # enddef
+
+    def to_dict(self) -> Dict:
+        """
+        Works out every field and gives them as a plain dictionary, e.g. for json.dumps.
+
+        :return: Dictionary of each field the result has to a copy of its value
+        """
+
+        self.evaluate()
+        values: Dict = {"grades": self._grades, "interests": self._interests}
+
+        # copies, the result itself can be shared through the parse cache
+        return {field: copy(values[field]) for field in self.fields}
+
+    # enddef
+
+    def course_ids(self) -> List[int]:
+        """
+        :return: Primary keys of the Course rows behind the interests, for one id__in query (see get_row_ids)
+        """
+        return get_row_ids("course_ids", self.interests, self.synonyms)
+
+    # enddef
+
+    def subject_requirement_ids(self) -> List[int]:
+        """
+        :return: Primary keys of the SubjectRequirement rows behind the subjects with grades (see get_row_ids)
+        """
+        return get_row_ids("subject_ids", self.grades, self.synonyms)
+
+    # enddef
+
+    def __getitem__(self, field: str):
+        if field not in self.fields:
+            raise KeyError(field)
+        # endif
+
+        return getattr(self, field)
+
+    # enddef
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.fields)
+
+    # enddef
+
+    def __len__(self) -> int:
+        return len(self.fields)
+
+    # enddef
+
+    def __reduce__(self) -> tuple:
+        # the parser isn't sent along, so work everything out first
+        self.evaluate()
+        return ParseResult.from_values, (self._grades, self._interests)
+
+    # enddef
+
+    def __deepcopy__(self, memo: dict) -> "ParseResult":
+        # the same as pickling, but the copy keeps the synonyms (a Lexicon isn't copied, see Lexicon.__deepcopy__)
+        self.evaluate()
+        return ParseResult.from_values(deepcopy(self._grades, memo), deepcopy(self._interests, memo), self.synonyms)
+
+    # enddef
+
+    def __repr__(self) -> str:
+        return f"ParseResult({dict(self)!r})"
+    # enddef
+
+
+# endclass
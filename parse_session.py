@@ -0,0 +1,240 @@
+"""
+Incremental parsing for input that is parsed again every time it changes a little, like a chat box
+that is parsed on every pause in typing.
+
+    session = ParseSession()
+    result = session.parse(text_so_far)
+
+The input is split into sentences (see Document.sentences), and what each sentence contributes
+(its grades, course names, interest phrases...) is kept, so only the sentences that changed since the last call
+are parsed again.
+"""
+import re
+from typing import Dict, List, Tuple
+
+from .document import Document
+from .grade_grammar import add_standalone_grades, walk_grades
+from .grade_parser import GradeParser
+from .matchers import find_tails
+from .parse_result import ParseResult
+from .parser_utils import get_synonyms
+
+
+class SentenceParts:
+    """
+    Everything one sentence adds to the parse result, worked out once and reused for as long as the sentence
+    stays the same. Course names are only found if no sentence has an interest phrase, so they are worked out
+    the first time they are needed.
+    """
+
+    __slots__ = ("document", "grades", "standalone", "interest_phrase", "explicit_interest", "interest_courses",
+                 "liked", "_parser", "_courses", "_tails", "_misspelled_courses")
+
+    def __init__(self, parser: GradeParser, text: str, case_matters: bool, synonyms: Dict):
+        """
+        :param parser: Parser whose stages are used
+        :param text: The sentence
+        :param case_matters: False if the whole input is in capitals (see find_grades_in_tokens)
+        :param synonyms: Lexicon the whole input is parsed with
+        """
+
+        phrase_patterns: Dict[str, re.Pattern] = synonyms["phrase_patterns"]
+
+        self.document: Document = Document(text, synonyms)
+        text_lower: str = self.document.lower
+
+        # Same as find_all_grades, with the grade blocks with no subjects kept apart until every sentence is in
+        self.grades: Dict[str, str]
+        self.standalone: List[Tuple[str, ...]]
+        self.grades, self.standalone = walk_grades(self.document.tokens, case_matters)
+
+        # Same as find_course_interest, which searches the cleaned input for an interest phrase
+        # and then takes the courses after each one
+        self.interest_phrase: bool = phrase_patterns["interest"].search(parser.clean_input(self.document)) is not None
+        self._tails: List[Tuple[int, int]] = find_tails(phrase_patterns["interest_tail"], text_lower)
+        self.interest_courses: List[str] = synonyms["course_matcher"].find_values_in_tails(text_lower, self._tails)
+
+        # Same as find_interests, which keeps liked subjects and everything after an interest phrase
+        self.explicit_interest: bool = phrase_patterns["interest"].search(text_lower) is not None
+        self.liked: List[str] = []
+        for match in parser.LIKE_PATTERN.findall(text_lower):
+            subject: str = parser.normalize_subject(match, synonyms=synonyms)
+            if subject != match:
+                self.liked.append(subject)
+            # endif
+        # endfor
+
+        self._parser: GradeParser = parser
+        self._courses: List[str] | None = None
+        self._misspelled_courses: List[str] | None = None
+
+    # enddef
+
+    def courses(self) -> List[str]:
+        """
+        :return: Every course name in the sentence, for inputs with no interest phrase at all
+        """
+
+        if self._courses is None:
+            matcher = self.document.synonyms["course_matcher"]
+            self._courses = matcher.find_values(self._parser.clean_input(self.document))
+        # endif
+
+        return self._courses
+
+    # enddef
+
+    def misspelled_courses(self) -> List[str]:
+        """
+        :return: Misspelled course names after the interest phrases in the sentence,
+            for inputs with interest phrases but no course names after them
+        """
+
+        if self._misspelled_courses is None:
+            fuzzy = self.document.synonyms.get("course_fuzzy")
+            self._misspelled_courses = fuzzy.find_values_in_tails(self.document.lower, self._tails) \
+                if fuzzy is not None else []
+        # endif
+
+        return self._misspelled_courses
+    # enddef
+
+
+# endclass
+
+
+class ParseSession:
+    """
+    Parses one user's input again and again as it changes, only parsing the sentences that changed.
+    Gives exactly the same results as GradeParser.parse on the whole input.
+
+    Keeps the sentences of the last input only, so use one session per chat box (they aren't thread-safe).
+    """
+
+    def __init__(self, parser: GradeParser | None = None):
+        """
+        :param parser: Parser to use, defaults to GradeParser(). With the "regex" engine every call parses
+            the whole input, as its passes look across sentences.
+        """
+
+        self.parser: GradeParser = parser if parser is not None else GradeParser()
+
+        # (sentence, case_matters) -> its parts, for the sentences of the last input
+        self._sentences: Dict[Tuple[str, bool], SentenceParts] = {}
+        self._version: int | None = None
+
+        self.parsed: int = 0
+        self.reused: int = 0
+
+    # enddef
+
+    def parse(self, input: str) -> ParseResult:
+        """
+        Parses the input, reusing what didn't change since the last call.
+
+        :param input: The whole user input so far
+        :return: ParseResult with every field worked out, the same as GradeParser.parse(input) gives
+        """
+
+        if self.parser.engine != "grammar":
+            return self.parser.parse(input).evaluate()
+        # endif
+
+        synonyms: Dict = get_synonyms()
+
+        # Sentences parsed with other synonyms can't be reused
+        if synonyms["version"] != self._version:
+            self._sentences = {}
+            self._version = synonyms["version"]
+        # endif
+
+        document: Document = Document(input, synonyms)
+        case_matters: bool = document.case_matters
+
+        parts: List[SentenceParts] = []
+        sentences: Dict[Tuple[str, bool], SentenceParts] = {}
+
+        for start, end in document.sentences:
+            text: str = input[start:end]
+            key: Tuple[str, bool] = (text, case_matters)
+            sentence: SentenceParts | None = self._sentences.get(key) or sentences.get(key)
+
+            if sentence is None:
+                sentence = SentenceParts(self.parser, text, case_matters, synonyms)
+                self.parsed += 1
+            else:
+                self.reused += 1
+            # endif
+
+            sentences[key] = sentence
+            parts.append(sentence)
+        # endfor
+
+        self._sentences = sentences
+
+        grades: Dict[str, str] = self._grades(parts)
+
+        return ParseResult.from_values(grades, self._interests(parts, grades), synonyms)
+
+    # enddef
+
+    def _grades(self, parts: List[SentenceParts]) -> Dict[str, str]:
+        """
+        :param parts: Parts of every sentence, in input order
+        :return: Grades of the whole input, as find_all_grades gives
+        """
+
+        grades: Dict[str, str] = {}
+        standalone: List[Tuple[str, ...]] = []
+
+        # The first grade found for a subject wins, across sentences as much as inside one
+        for sentence in parts:
+            for subject, grade in sentence.grades.items():
+                grades.setdefault(subject, grade)
+            # endfor
+            standalone.extend(sentence.standalone)
+        # endfor
+
+        return add_standalone_grades(grades, standalone)
+
+    # enddef
+
+    def _interests(self, parts: List[SentenceParts], grades: Dict[str, str]) -> List[str]:
+        """
+        :param parts: Parts of every sentence, in input order
+        :param grades: Grades of the whole input
+        :return: Course interests of the whole input, as find_interests gives
+        """
+
+        interest_phrase: bool = any(sentence.interest_phrase for sentence in parts)
+
+        # An interest phrase anywhere means only the courses after interest phrases count
+        found: List[str] = []
+        for sentence in parts:
+            courses: List[str] = sentence.interest_courses if interest_phrase else sentence.courses()
+            for course in courses:
+                if course not in found:
+                    found.append(course)
+                # endif
+            # endfor
+        # endfor
+
+        # Same as find_course_interest, misspelled course names only count when no course name was found
+        if interest_phrase and not found:
+            for sentence in parts:
+                for course in sentence.misspelled_courses():
+                    if course not in found:
+                        found.append(course)
+                    # endif
+                # endfor
+            # endfor
+        # endif
+
+        explicit_interest: bool = any(sentence.explicit_interest for sentence in parts)
+        liked: List[str] = [subject for sentence in parts for subject in sentence.liked if subject in found]
+
+        return [course for course in found if explicit_interest or course not in grades or course in liked]
+    # enddef
+
+
+# endclass
@@ -1,13 +1,91 @@
 """
 Utils for integrating NLP parser with Django database
 """
-from typing import Dict
-
+import gc
+import os
+import sys
+import threading
+import time
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Tuple
+
+from .fuzzy import FuzzyIndex
+from .grade_grammar import build_grammar_tables
+from .lexicon import Lexicon
+from .matchers import SENTENCE_ENDS, LayeredPhraseMatcher, PhraseMatcher, build_course_matcher, \
+    build_phrase_patterns, build_sentence_pattern
 from .synonyms import SYNONYMS
 
-# cache for combined synonyms
+# cache for combined synonyms, a Lexicon that is only ever replaced whole
 _cached_synonyms = None
 
+# goes up by one every time the synonyms are rebuilt, so caches know when their results are stale
+_synonyms_version = 0
+
+# goes up by one every time a full load finishes, so a load that waited for another one can use its result
+_load_generation = 0
+
+# database rows the cached synonyms were built from
+_database_rows = None
+
+# seconds the last load or set of changes took to make the cached synonyms, reading the database included
+_last_build_seconds = 0.0
+
+# only one load or set of changes updates the cached synonyms at a time, reading them needs no lock
+_refresh_lock = threading.RLock()
+
+# matcher for the hardcoded courses, built once, the database courses are layered on top of it
+_hardcoded_course_matcher = None
+
+
+def build_base_lexicon(synonyms: Dict) -> Mapping:
+    """
+    Makes a read-only copy of the hardcoded synonyms for the lexicon to be built on.
+    Database courses and subjects are added on top of it in new dictionaries, so nothing ever changes it
+    and reloading the lexicon doesn't grow it.
+
+    :param synonyms: The hardcoded SYNONYMS dictionary
+    :return: Read-only mapping with "subjects" and "courses" (read-only mappings of name to a frozenset of aliases)
+        and the "dropped", "interest" and "none" phrases as tuples. Every string in it is interned.
+    """
+
+    def frozen(aliases: Mapping[str, Iterable[str]]) -> MappingProxyType:
+        return MappingProxyType({sys.intern(name): frozenset(map(sys.intern, names)) for name, names in aliases.items()})
+
+    # enddef
+
+    return MappingProxyType({
+        "subjects": frozen(synonyms["subjects"]),
+        "courses": frozen(synonyms["courses"]),
+        "dropped": tuple(map(sys.intern, synonyms["dropped"])),
+        "interest": tuple(map(sys.intern, synonyms["interest"])),
+        "none": tuple(map(sys.intern, synonyms["none"])),
+    })
+
+
+# enddef
+
+
+# the hardcoded synonyms every lexicon is built on
+BASE_LEXICON: Mapping = build_base_lexicon(SYNONYMS)
+
+
+# qualifications and joining words taken out of course names, in order. Each one leaves a space behind,
+# so a later one can come off what is left of a word ("bscba" loses "bsc" and then "ba")
+COURSE_NAME_REMOVALS: Tuple[str, ...] = (
+    ' (hons)', ' hons', ' bsc', ' ba', ' msc', ' ma',
+    ' meng', ' msci', ' llb', ' bds', ' mbbs',
+    ' degree', ' programme', ' program', ' course',
+    ' - ', ' with ', ' and ', ' & ', '(', ')'
+)
+
+# most course names whose cleaned form is kept, catalogues repeat the same few thousand names a lot
+COURSE_NAME_CACHE_SIZE: int = 1 << 16
+
+# rows read from the database at a time, so the whole table is never held in memory at once
+DATABASE_CHUNK_SIZE: int = 2000
+
 
 def extract_course_field_from_name(course_name: str) -> str:
     """
@@ -23,44 +101,218 @@ def extract_course_field_from_name(course_name: str) -> str:
     clean = course_name.lower()
 
     # remove common qualifications and brackets
-    removals = [
-        ' (hons)', ' hons', ' bsc', ' ba', ' msc', ' ma',
-        ' meng', ' msci', ' llb', ' bds', ' mbbs',
-        ' degree', ' programme', ' program', ' course',
-        ' - ', ' with ', ' and ', ' & ', '(', ')'
-    ]
+    for removal in COURSE_NAME_REMOVALS:
+        clean = clean.replace(removal, " ")
+    # endfor
+
+    # remove extra spaces
+    return " ".join(clean.split())
+
+
+# enddef
 
-    for r in removals:
-        clean = clean.replace(r, ' ')
 
+def build_subject_index(subjects: Mapping[str, Iterable[str]]) -> Dict[str, str]:
+    """
+    Builds a lookup table from every subject name and synonym to its main subject name,
+    so normalising a subject is a single dictionary lookup instead of a scan over every list.
+
+    :param subjects: Dictionary of main subject names to their list of synonyms
+    :return: Dictionary mapping each alias (and main name) to its main subject name
+    """
+    index: Dict[str, str] = {}
+
+    # the first main subject that claims an alias wins, same as scanning the lists in order
+    for main_subject, synonyms in subjects.items():
+        index.setdefault(main_subject, main_subject)
+
+        for synonym in synonyms:
+            index.setdefault(synonym, main_subject)
+        # endfor
     # endfor
 
-    # remove extra spaces
-    clean = ' '.join(clean.split())
+    return index
+
+
+# enddef
+
 
-    return clean.strip()
+@lru_cache(maxsize=COURSE_NAME_CACHE_SIZE)
+def course_alias_from_name(name: str) -> tuple[str, str]:
+    """
+    Gets the course a database course name belongs to, and the alias it adds to it.
+    Results are cached, as every row with the same name gives the same answer.
+
+    :param name: Course name from the database (e.g., "Computer Science BSc (Hons)")
+    :return: (main course name, alias), e.g. ("computer science", "computer science bsc (hons)").
+        The main course name is "" if nothing is left after cleaning. Both are interned.
+    """
+    return sys.intern(extract_course_field_from_name(name)), sys.intern(name.lower())
 
 
 # enddef
 
 
-def load_combined_synonyms() -> Dict:
+def subject_from_name(name: str) -> str:
     """
-    Gets all the subjects and course names from the database and combines them
-    with the hardcoded synonym list for parsing.
+    Gets the subject name a database subject requirement adds.
 
-    :return: Dictionary containing subjects, courses, dropped phrases, interest phrases, and none phrases
+    :param name: Subject from the database
+    :return: Lowercase subject name (interned), "" if it is blank
     """
-    global _cached_synonyms
+    return sys.intern(name.lower().strip())
 
-    # start with hardcoded synonyms
-    combined = {
-        "subjects": SYNONYMS["subjects"].copy(),
-        "courses": SYNONYMS["courses"].copy(),
-        "dropped": SYNONYMS["dropped"],
-        "interest": SYNONYMS["interest"],
-        "none": SYNONYMS["none"]
-    }
+
+# enddef
+
+
+class DatabaseRows:
+    """
+    The database rows the cached synonyms were built from, so later changes to those rows
+    can be applied without reading every row again.
+    """
+
+    def __init__(self, courses: Dict[int, str] | None = None, subjects: Dict[int, str] | None = None):
+        """
+        :param courses: Course primary key -> course name
+        :param subjects: SubjectRequirement primary key -> subject
+        """
+
+        self.courses: Dict[int, str] = {}
+        self.subjects: Dict[int, str] = {}
+
+        # main course name -> primary keys of the rows adding to it (dict used as an ordered set)
+        self.course_keys: Dict[str, Dict[int, None]] = {}
+
+        # subject name -> primary keys of the rows adding it
+        self.subject_keys: Dict[str, Dict[int, None]] = {}
+
+        # highest primary key seen so far, for polling for new rows
+        self.course_watermark: int = 0
+        self.subject_watermark: int = 0
+
+        for pk, name in (courses or {}).items():
+            self.set_course(pk, name)
+        # endfor
+
+        for pk, name in (subjects or {}).items():
+            self.set_subject(pk, name)
+        # endfor
+
+    # enddef
+
+    def set_course(self, pk: int, name: str | None) -> set[str]:
+        """
+        Adds, changes (name given) or removes (name None) a course row.
+
+        :param pk: Primary key of the row
+        :param name: New course name, None if the row was deleted
+        :return: Main course names whose aliases may have changed
+        """
+
+        touched: set[str] = set()
+
+        old_name: str | None = self.courses.pop(pk, None)
+        if old_name is not None:
+            old_course, _ = course_alias_from_name(old_name)
+            self.course_keys.get(old_course, {}).pop(pk, None)
+            touched.add(old_course)
+        # endif
+
+        if name:
+            course, _ = course_alias_from_name(name)
+            self.courses[pk] = name
+            self.course_keys.setdefault(course, {})[pk] = None
+            self.course_watermark = max(self.course_watermark, pk)
+            touched.add(course)
+        # endif
+
+        touched.discard("")
+
+        return touched
+
+    # enddef
+
+    def set_subject(self, pk: int, name: str | None) -> set[str]:
+        """
+        Adds, changes (name given) or removes (name None) a subject requirement row.
+
+        :param pk: Primary key of the row
+        :param name: New subject, None if the row was deleted
+        :return: Subject names that may have been added or removed
+        """
+
+        touched: set[str] = set()
+
+        old_name: str | None = self.subjects.pop(pk, None)
+        if old_name is not None:
+            old_subject: str = subject_from_name(old_name)
+            self.subject_keys.get(old_subject, {}).pop(pk, None)
+            touched.add(old_subject)
+        # endif
+
+        if name:
+            subject: str = subject_from_name(name)
+            self.subjects[pk] = name
+            self.subject_keys.setdefault(subject, {})[pk] = None
+            self.subject_watermark = max(self.subject_watermark, pk)
+            touched.add(subject)
+        # endif
+
+        touched.discard("")
+
+        return touched
+
+    # enddef
+
+    def course_aliases(self, course: str) -> frozenset[str] | None:
+        """
+        Works out the aliases of one course from the hardcoded synonyms and the database rows.
+
+        :param course: Main course name
+        :return: Set of aliases, or None if neither the hardcoded synonyms nor any row has this course
+        """
+
+        base: frozenset[str] | None = BASE_LEXICON["courses"].get(course)
+        keys: Dict[int, None] = self.course_keys.get(course, {})
+
+        if not keys:
+            # shared with the base lexicon, so courses the database doesn't add to cost nothing extra
+            return base
+        # endif
+
+        # a course only the database has maps to itself plus the names of its rows
+        aliases: set[str] = set(base) if base is not None else {course}
+
+        for pk in keys:
+            _, alias = course_alias_from_name(self.courses[pk])
+            aliases.add(alias)
+        # endfor
+
+        return frozenset(aliases)
+
+    # enddef
+
+    def has_subject(self, subject: str) -> bool:
+        """
+        :param subject: Subject name
+        :return: True if any database row adds this subject
+        """
+        return bool(self.subject_keys.get(subject))
+    # enddef
+
+
+# endclass
+
+
+def read_database_rows() -> DatabaseRows:
+    """
+    Reads every course name and subject requirement from the database. The rows are streamed in chunks
+    of DATABASE_CHUNK_SIZE (with a server-side cursor where the database has them) and added one at a time,
+    so only the rows kept in DatabaseRows are ever held, never a copy of the whole query result as well.
+
+    :return: DatabaseRows, empty if Django or the database isn't available
+    """
 
     try:
         # only try to load from database if Django is properly set up
@@ -71,44 +323,18 @@ def load_combined_synonyms() -> Dict:
             # import models here to avoid circular imports
             from mysite.apps.coursefinder.models import Course, SubjectRequirement
 
-            # get unique course names from database
-            course_names = Course.objects.values_list('name', flat=True).distinct()
-
-            for name in course_names:
-                if not name:
-                    continue
-                # endif
+            rows = DatabaseRows()
 
-                # use our function to clean the course name
-                clean_name = extract_course_field_from_name(name)
-
-                # add to courses dict if not already there
-                if clean_name and clean_name not in combined["courses"]:
-                    # create a new entry with the course name mapping to itself
-                    combined["courses"][clean_name] = [clean_name, name.lower()]
-                elif clean_name and clean_name in combined["courses"]:
-                    # add as an alias if not already there
-                    if name.lower() not in combined["courses"][clean_name]:
-                        combined["courses"][clean_name].append(name.lower())
-                    # endif
-                # endif
+            for pk, name in Course.objects.values_list('pk', 'name').iterator(chunk_size=DATABASE_CHUNK_SIZE):
+                rows.set_course(pk, name)
             # endfor
 
-            # get unique subjects from subject requirements
-            subject_names = SubjectRequirement.objects.values_list('subject', flat=True).distinct()
-
-            for name in subject_names:
-                if not name:
-                    continue
-                # endif
-
-                clean_name = name.lower().strip()
-
-                # add to subjects dict if not already there
-                if clean_name and clean_name not in combined["subjects"]:
-                    combined["subjects"][clean_name] = [clean_name]
-                # endif
+            for pk, name in SubjectRequirement.objects.values_list('pk', 'subject') \
+                    .iterator(chunk_size=DATABASE_CHUNK_SIZE):
+                rows.set_subject(pk, name)
             # endfor
+
+            return rows
         # endif
 
     except Exception as e:
@@ -116,25 +342,628 @@ def load_combined_synonyms() -> Dict:
         pass
     # endtry
 
-    # cache the result
-    _cached_synonyms = combined
+    return DatabaseRows()
+
+
+# enddef
+
+
+def build_combined_synonyms(rows: DatabaseRows) -> Dict:
+    """
+    Combines database rows with the hardcoded synonym list and builds everything the parser looks up.
+
+    :param rows: Course and subject requirement rows to add to the hardcoded synonyms
+    :return: Dictionary containing subjects, courses, dropped phrases, interest phrases, none phrases,
+        the subject lookup index, the compiled phrase patterns, the course matcher, the fuzzy indexes for misspelled
+        subjects and courses ("subject_fuzzy", "course_fuzzy"), the grammar tables built from them,
+        the pattern inputs are split into sentences with ("sentence_pattern"),
+        and the primary keys of the rows behind each main course ("course_ids") and main subject ("subject_ids")
+    """
+
+    # start with the hardcoded synonyms, the dictionaries are new but the alias sets are shared with the base
+    combined = {
+        "subjects": dict(BASE_LEXICON["subjects"]),
+        "courses": dict(BASE_LEXICON["courses"]),
+        "dropped": BASE_LEXICON["dropped"],
+        "interest": BASE_LEXICON["interest"],
+        "none": BASE_LEXICON["none"]
+    }
+
+    # add the courses from the database, as new courses or as aliases of the ones we have
+    for course in rows.course_keys:
+        aliases: frozenset[str] | None = rows.course_aliases(course)
+        if course and aliases is not None:
+            combined["courses"][course] = aliases
+        # endif
+    # endfor
+
+    # add the subjects from subject requirements if not already there
+    for subject in rows.subject_keys:
+        if subject and subject not in combined["subjects"] and rows.has_subject(subject):
+            combined["subjects"][subject] = frozenset((subject,))
+        # endif
+    # endfor
+
+    # build the subject lookups once here so the parser doesn't scan every synonym list per call
+    combined["subject_index"] = build_subject_index(combined["subjects"])
+    combined["subject_aliases"] = frozenset(combined["subject_index"])
+
+    # compile the dropped/interest/none phrase lists into single patterns
+    combined["phrase_patterns"] = build_phrase_patterns(combined)
+
+    # one automaton over every hardcoded course name and alias, so finding courses is a single pass,
+    # with the ones from the database on top so they can change without rebuilding it
+    combined["course_matcher"] = build_course_matcher(combined["courses"], base=get_hardcoded_course_matcher())
+
+    # indexes for misspelled subject and course names, used when the exact lookups find nothing
+    combined["subject_fuzzy"] = FuzzyIndex(combined["subject_index"])
+    combined["course_fuzzy"] = build_course_fuzzy_index(combined["courses"])
+
+    # lookup tables for the tokenizer used by the grammar engine
+    combined["grammar"] = build_grammar_tables(combined)
+
+    # where inputs can be split into sentences without splitting any phrase
+    combined["sentence_pattern"] = build_sentence_pattern(combined)
+
+    # the rows behind each course and subject, so parse results can be looked up by primary key
+    combined["course_ids"] = {course: tuple(keys) for course, keys in rows.course_keys.items() if course and keys}
+    combined["subject_ids"] = {}
+    for subject in {combined["subject_index"].get(subject, subject) for subject in rows.subject_keys if subject}:
+        ids: tuple[int, ...] = _subject_row_ids(subject, combined, rows)
+        if ids:
+            combined["subject_ids"][subject] = ids
+        # endif
+    # endfor
+
     return combined
 
 
 # enddef
 
 
-def get_synonyms() -> Dict:
+def load_combined_synonyms(snapshot_dir: str | None = None) -> Lexicon:
+    """
+    Gets all the subjects and course names from the database and combines them
+    with the hardcoded synonym list for parsing.
+
+    Only one load runs at a time. Callers that ask for a load while one is running wait for it
+    and get its result instead of reading the database again. Parses keep using the lexicon they already have
+    until the new one is swapped in.
+
+    If a snapshot directory is given (or set in the NLP_LEXICON_SNAPSHOT_DIR environment variable),
+    an already built lexicon for exactly these rows is loaded from it instead of building it again,
+    and a newly built one is saved there for the next process (see lexicon_snapshot.py).
+
+    :param snapshot_dir: Directory of lexicon snapshots, defaults to NLP_LEXICON_SNAPSHOT_DIR (unset means no snapshots)
+    :return: Lexicon containing subjects, courses, dropped phrases, interest phrases, none phrases,
+        the subject lookup index, the compiled phrase patterns, the course matcher and the grammar tables built from them,
+        plus the version number of this load
+    """
+    global _cached_synonyms, _synonyms_version, _load_generation, _database_rows, _hardcoded_course_matcher, \
+        _last_build_seconds
+
+    # imported here as lexicon_snapshot needs this module
+    from .lexicon_snapshot import SNAPSHOT_DIR_ENV, lexicon_fingerprint, load_snapshot, save_snapshot
+
+    generation: int = _load_generation
+
+    with _refresh_lock:
+        if _load_generation != generation and _cached_synonyms is not None:
+            # another load finished while this one waited for the lock, it read the database just now
+            return _cached_synonyms
+        # endif
+
+        if snapshot_dir is None:
+            snapshot_dir = os.environ.get(SNAPSHOT_DIR_ENV) or None
+        # endif
+
+        started: float = time.perf_counter()
+        rows: DatabaseRows = read_database_rows()
+        combined: Dict | None = None
+
+        if snapshot_dir:
+            fingerprint: str = lexicon_fingerprint(rows)
+            combined = load_snapshot(snapshot_dir, fingerprint)
+
+            if combined is None:
+                combined = build_combined_synonyms(rows)
+                save_snapshot(snapshot_dir, combined, fingerprint)
+            elif _hardcoded_course_matcher is None:
+                # the snapshot's course matcher already has the hardcoded courses built
+                _hardcoded_course_matcher = getattr(combined["course_matcher"], "base", None)
+            # endif
+        else:
+            combined = build_combined_synonyms(rows)
+        # endif
+
+        _synonyms_version += 1
+        lexicon = Lexicon(combined, _synonyms_version)
+
+        # cache the result
+        _database_rows = rows
+        _cached_synonyms = lexicon
+        _load_generation += 1
+        _last_build_seconds = time.perf_counter() - started
+    # endwith
+
+    return lexicon
+
+
+# enddef
+
+
+def apply_synonym_changes(course_changes: Dict[int, str | None] | None = None,
+                          subject_changes: Dict[int, str | None] | None = None) -> Lexicon:
+    """
+    Applies changed database rows to the cached synonyms without reading the rest of the database.
+    Only the courses and subjects those rows touch are worked out again. Changed courses are moved in the
+    course matcher on their own (the automaton isn't rebuilt), the subject index is updated a subject at a time,
+    and the grammar tables and fuzzy indexes are only rebuilt if a subject or course was added, removed or changed. The result is swapped in as
+    a new Lexicon with a new version, so parses already running keep using the old one.
+
+    :param course_changes: Course primary key -> new name, or None if the row was deleted
+    :param subject_changes: SubjectRequirement primary key -> new subject, or None if the row was deleted
+    :return: The new lexicon (the same one as before if nothing changed)
+    """
+    global _cached_synonyms, _synonyms_version, _last_build_seconds
+
+    with _refresh_lock:
+        if _cached_synonyms is None or _database_rows is None:
+            # nothing to apply the changes to yet (or the synonyms came from set_synonyms),
+            # a full load reads every row anyway
+            return load_combined_synonyms()
+        # endif
+
+        started: float = time.perf_counter()
+        current: Lexicon = _cached_synonyms
+        combined: Dict = dict(current)
+
+        touched_courses: set[str] = set()
+        for pk, name in (course_changes or {}).items():
+            touched_courses |= _database_rows.set_course(pk, name)
+        # endfor
+
+        touched_subjects: set[str] = set()
+        for pk, name in (subject_changes or {}).items():
+            touched_subjects |= _database_rows.set_subject(pk, name)
+        # endfor
+
+        # copy the course dictionary only if one of its courses really changed,
+        # and move just the changed courses in the matcher
+        courses: Dict[str, frozenset[str]] = current["courses"]
+        course_moves: List[tuple[str, set[str], set[str]]] = []
+        for course in touched_courses:
+            aliases: frozenset[str] | None = _database_rows.course_aliases(course)
+            old_aliases: frozenset[str] | None = courses.get(course)
+
+            if aliases == old_aliases:
+                continue
+            # endif
+
+            if courses is current["courses"]:
+                courses = dict(courses)
+            # endif
+
+            if aliases is None:
+                del courses[course]
+            else:
+                courses[course] = aliases
+            # endif
+
+            course_moves.append((course, _course_phrases(course, old_aliases), _course_phrases(course, aliases)))
+        # endfor
+
+        # database subjects only ever map to themselves, so the index is updated a subject at a time
+        subjects: Dict[str, frozenset[str]] = current["subjects"]
+        subject_index: Dict[str, str] = current["subject_index"]
+        for subject in touched_subjects:
+            wanted: bool = subject in BASE_LEXICON["subjects"] or _database_rows.has_subject(subject)
+            if wanted == (subject in subjects):
+                continue
+            # endif
+
+            if subjects is current["subjects"]:
+                subjects = dict(subjects)
+                subject_index = dict(subject_index)
+            # endif
+
+            if wanted:
+                subjects[subject] = frozenset((subject,))
+                subject_index.setdefault(subject, subject)
+            else:
+                del subjects[subject]
+                if subject_index.get(subject) == subject:
+                    del subject_index[subject]
+                # endif
+            # endif
+        # endfor
+
+        # the rows behind the touched courses and subjects, which can change without any alias changing
+        course_ids: Dict[str, tuple[int, ...]] = current.get("course_ids", {})
+        for course in touched_courses:
+            ids: tuple[int, ...] = tuple(_database_rows.course_keys.get(course, {}))
+            if ids != course_ids.get(course, ()):
+                if course_ids is current.get("course_ids"):
+                    course_ids = dict(course_ids)
+                # endif
+                _set_row_ids(course_ids, course, ids)
+            # endif
+        # endfor
+
+        subject_ids: Dict[str, tuple[int, ...]] = current.get("subject_ids", {})
+        lookup: Dict = {"subjects": subjects, "subject_index": subject_index}
+        for subject in {index.get(subject, subject) for subject in touched_subjects
+                        for index in (current["subject_index"], subject_index)}:
+            ids = _subject_row_ids(subject, lookup, _database_rows)
+            if ids != subject_ids.get(subject, ()):
+                if subject_ids is current.get("subject_ids"):
+                    subject_ids = dict(subject_ids)
+                # endif
+                _set_row_ids(subject_ids, subject, ids)
+            # endif
+        # endfor
+
+        if courses is current["courses"] and subjects is current["subjects"] \
+                and course_ids is current.get("course_ids") and subject_ids is current.get("subject_ids"):
+            return current
+        # endif
+
+        combined["course_ids"] = course_ids
+        combined["subject_ids"] = subject_ids
+
+        if courses is not current["courses"]:
+            combined["courses"] = courses
+
+            course_matcher: PhraseMatcher = current["course_matcher"]
+            if isinstance(course_matcher, LayeredPhraseMatcher):
+                combined["course_matcher"] = course_matcher.with_values_moved(course_moves)
+                combined["course_fuzzy"] = _move_fuzzy_courses(current["course_fuzzy"], combined["course_matcher"],
+                                                               course_moves)
+            else:
+                combined["course_matcher"] = build_course_matcher(courses, base=get_hardcoded_course_matcher())
+                combined["course_fuzzy"] = build_course_fuzzy_index(courses)
+            # endif
+        # endif
+
+        if subjects is not current["subjects"]:
+            combined["subjects"] = subjects
+            combined["subject_index"] = subject_index
+            combined["subject_aliases"] = frozenset(subject_index)
+            # only the touched subjects can have come or gone, or stand for another main subject
+            old_index: Dict[str, str] = current["subject_index"]
+            gone: List[str] = [subject for subject in touched_subjects
+                               if subject in old_index and subject not in subject_index]
+            moved: Dict[str, str] = {subject: subject_index[subject] for subject in touched_subjects
+                                     if subject in subject_index and old_index.get(subject) != subject_index[subject]}
+            combined["subject_fuzzy"] = current["subject_fuzzy"].with_names_changed(gone, moved)
+            combined["grammar"] = build_grammar_tables(combined)
+        # endif
+
+        # only names with sentence end punctuation in them change where sentences can be split
+        changed_names: set[str] = {phrase for _, old_phrases, new_phrases in course_moves
+                                   for phrase in old_phrases ^ new_phrases} | touched_subjects
+        if any(end in name for name in changed_names for end in SENTENCE_ENDS):
+            combined["sentence_pattern"] = build_sentence_pattern(combined)
+        # endif
+
+        _synonyms_version += 1
+        lexicon = Lexicon(combined, _synonyms_version)
+
+        _cached_synonyms = lexicon
+        _last_build_seconds = time.perf_counter() - started
+
+        return lexicon
+    # endwith
+
+
+# enddef
+
+
+def _subject_row_ids(subject: str, synonyms: Mapping, rows: DatabaseRows) -> tuple[int, ...]:
+    """
+    :param subject: Main subject name
+    :param synonyms: Synonyms with the "subjects" and "subject_index" to use
+    :param rows: Database rows
+    :return: Primary keys of the subject requirement rows whose subject is this one or an alias of it
+    """
+
+    index: Mapping[str, str] = synonyms["subject_index"]
+    names: set[str] = {subject} | set(synonyms["subjects"].get(subject, ()))
+
+    return tuple(pk for name in sorted(names) if index.get(name, name) == subject
+                 for pk in rows.subject_keys.get(name, {}))
+
+
+# enddef
+
+
+def _set_row_ids(index: Dict[str, tuple[int, ...]], name: str, ids: tuple[int, ...]) -> None:
+    """
+    Sets (or removes, when there are none) the primary keys of one name in a course_ids or subject_ids index.
+    """
+
+    if ids:
+        index[name] = ids
+    else:
+        index.pop(name, None)
+    # endif
+
+
+# enddef
+
+
+def _course_phrases(course: str, aliases: frozenset[str] | None) -> set[str]:
+    """
+    :param course: Main course name
+    :param aliases: Its aliases, None if it doesn't exist
+    :return: Every phrase the course matcher finds the course by (see build_course_matcher)
+    """
+
+    if aliases is None:
+        return set()
+    # endif
+
+    return {name.lower().strip() for name in [course] + list(aliases)}
+
+
+# enddef
+
+
+def build_course_fuzzy_index(courses: Mapping[str, Iterable[str]]) -> FuzzyIndex:
+    """
+    :param courses: Main course name -> its aliases
+    :return: FuzzyIndex over every phrase the course matcher finds each course by
+    """
+
+    names: Dict[str, str] = {}
+    for course, aliases in courses.items():
+        for name in _course_phrases(course, frozenset(aliases)):
+            names.setdefault(name, course)
+        # endfor
+    # endfor
+
+    return FuzzyIndex(names)
+
+
+# enddef
+
+
+def _move_fuzzy_courses(index: FuzzyIndex, course_matcher: PhraseMatcher,
+                        moves: List[tuple[str, set[str], set[str]]]) -> FuzzyIndex:
+    """
+    Updates the course fuzzy index for courses whose phrases changed, without working the other courses out again.
+
+    :param index: Course fuzzy index from before the changes
+    :param course_matcher: Course matcher with the changes made (see LayeredPhraseMatcher.with_values_moved)
+    :param moves: List of (course, phrases it had before, phrases it has now)
+    :return: New FuzzyIndex where each changed phrase stands for a course that still has it, as build_course_fuzzy_index
+        gives (a phrase keeps its course as long as the course has it, otherwise it goes to the first course left)
+    """
+
+    removed: List[str] = []
+    added: Dict[str, str] = {}
+
+    for phrase in {phrase for _, old_phrases, new_phrases in moves for phrase in old_phrases ^ new_phrases}:
+        courses: Tuple[str, ...] = course_matcher.values_for(phrase)
+        course: str | None = index.get(phrase)
+
+        if course is not None and course in courses:
+            continue
+        elif courses:
+            added[phrase] = courses[0]
+        elif course is not None:
+            removed.append(phrase)
+        # endif
+    # endfor
+
+    return index.with_names_changed(removed, added)
+
+
+# enddef
+
+
+def get_hardcoded_course_matcher() -> PhraseMatcher:
     """
-    Gets the cached combined synonyms dictionary.
+    Gets the matcher for just the hardcoded courses, building it the first time.
 
-    :return: Dictionary containing all synonym data (subjects, courses, dropped, interest, none)
+    :return: PhraseMatcher over the course names and aliases in SYNONYMS
     """
-    global _cached_synonyms
+    global _hardcoded_course_matcher
 
-    if _cached_synonyms is None:
-        load_combined_synonyms()
+    if _hardcoded_course_matcher is None:
+        _hardcoded_course_matcher = build_course_matcher(BASE_LEXICON["courses"])
     # endif
 
-    return _cached_synonyms
+    return _hardcoded_course_matcher
+
+
+# enddef
+
+
+def get_database_rows() -> DatabaseRows | None:
+    """
+    Gets the database rows the cached synonyms were built from (see apply_synonym_changes).
+
+    :return: DatabaseRows of the current synonyms, don't change it directly.
+        None if the synonyms were installed with set_synonyms.
+    """
+    get_synonyms()
+
+    return _database_rows
+
+
+# enddef
+
+
+def get_synonyms() -> Lexicon:
+    """
+    Gets the cached combined synonyms, loading them the first time.
+    Threads that ask at the same time before they are loaded all wait for the same load.
+
+    :return: Lexicon containing all synonym data (subjects, courses, dropped, interest, none)
+        the derived lookups (subject_index, subject_aliases, phrase_patterns, course_matcher, subject_fuzzy,
+        course_fuzzy, grammar, sentence_pattern),
+        the database row indexes (course_ids, subject_ids) and its version
+    """
+
+    # read once, it can be swapped for a newer one at any time
+    synonyms: Lexicon | None = _cached_synonyms
+
+    if synonyms is None:
+        with _refresh_lock:
+            if _cached_synonyms is None:
+                load_combined_synonyms()
+            # endif
+
+            synonyms = _cached_synonyms
+        # endwith
+    # endif
+
+    return synonyms
+# enddef
+
+
+def get_lexicon_stats() -> Dict[str, float]:
+    """
+    Gets the size of the cached synonyms and how long they took to make, e.g. for metrics.
+    Doesn't load the synonyms if they aren't loaded yet.
+
+    :return: Dictionary with the version, the number of main subjects ("subjects"), subject names and synonyms
+        ("subject_aliases"), main courses ("courses") and database rows ("course_rows", "subject_rows"),
+        and the seconds the last load or set of changes took ("build_seconds"). Empty if nothing is loaded.
+    """
+
+    # read once, it can be swapped for a newer one at any time
+    synonyms: Lexicon | None = _cached_synonyms
+    rows: DatabaseRows | None = _database_rows
+
+    if synonyms is None:
+        return {}
+    # endif
+
+    return {
+        "version": synonyms.version,
+        "subjects": len(synonyms["subjects"]),
+        "subject_aliases": len(synonyms.get("subject_index", ())),
+        "courses": len(synonyms["courses"]),
+        "course_rows": len(rows.courses) if rows is not None else 0,
+        "subject_rows": len(rows.subjects) if rows is not None else 0,
+        "build_seconds": _last_build_seconds,
+    }
+
+
+# enddef
+
+
+def get_lexicon_cache_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Gets the counters of the caches behind the lexicon, e.g. for metrics.
+    Doesn't load the synonyms if they aren't loaded yet.
+
+    :return: Cache name -> its hits, misses and size, for the fuzzy lookups of the lexicon in use
+        ("subject_fuzzy", "course_fuzzy", left out if nothing is loaded) and the course name cleaning ("course_name")
+    """
+
+    caches: Dict[str, Dict[str, int]] = {}
+
+    synonyms: Lexicon | None = _cached_synonyms
+    for name in ("subject_fuzzy", "course_fuzzy"):
+        index: FuzzyIndex | None = synonyms.get(name) if synonyms is not None else None
+        if index is not None:
+            caches[name] = index.stats()
+        # endif
+    # endfor
+
+    info = course_alias_from_name.cache_info()
+    caches["course_name"] = {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+
+    return caches
+
+
+# enddef
+
+
+def get_row_ids(index: str, names: Iterable[str], synonyms: Mapping | None = None) -> List[int]:
+    """
+    Gets the primary keys of the database rows behind main course or subject names, e.g. for the interests
+    or grades of a parse result, so the rows can be read in one query:
+        Course.objects.filter(id__in=get_row_ids("course_ids", result["interests"], result.synonyms))
+
+    :param index: "course_ids" for Course rows, "subject_ids" for SubjectRequirement rows
+    :param names: Main course names or main subject names
+    :param synonyms: Lexicon the names were found with (e.g. ParseResult.synonyms), None uses the current one
+    :return: Primary keys of every row behind the names, in name order, without repeats.
+        Names only the hardcoded synonyms have (and synonyms installed with set_synonyms) have no rows.
+    """
+
+    if synonyms is None:
+        synonyms = get_synonyms()
+    # endif
+
+    ids: Mapping[str, tuple[int, ...]] = synonyms.get(index, {})
+
+    return list(dict.fromkeys(pk for name in names for pk in ids.get(name, ())))
+
+
+# enddef
+
+
+def freeze_lexicon() -> Lexicon:
+    """
+    Loads the lexicon if it isn't yet, then moves it (and everything else allocated so far) out of the
+    garbage collector's reach with gc.freeze(). Forked workers then share the lexicon's memory with the process
+    that forked them instead of each copying it the first time a collection walks over it.
+
+    Call it in the process that forks the workers, once the app is loaded, e.g. with preload_app in gunicorn.conf.py:
+        def when_ready(server):
+            freeze_lexicon()
+
+    Nothing in a Lexicon is ever changed, so freezing it is safe: the fuzzy indexes keep the results of their lookups
+    outside it, in each worker (see fuzzy.LookupCache). Lexicons built later (after synonym changes) belong to
+    the worker that built them.
+
+    :return: The frozen lexicon
+    """
+
+    synonyms: Lexicon = get_synonyms()
+
+    # collect first so garbage isn't kept forever, this also stops tracking tuples that only hold strings
+    gc.collect()
+    gc.freeze()
+
+    return synonyms
+
+
+# enddef
+
+
+def set_synonyms(synonyms: Dict) -> None:
+    """
+    Replaces the cached synonyms with an already built synonyms dictionary.
+    Used by worker processes so they parse with exactly the same synonyms as the process that started them,
+    without going to the database again.
+
+    :param synonyms: Lexicon returned by load_combined_synonyms, or a synonyms dictionary.
+        Anything without a version newer than the current synonyms gets a new version
+    """
+    global _cached_synonyms, _synonyms_version
+
+    with _refresh_lock:
+        if synonyms is _cached_synonyms:
+            return
+        # endif
+
+        # versions never go backwards or repeat in a process, or an old cache key could match the new synonyms
+        version = synonyms.get("version") or 0
+        if version <= _synonyms_version:
+            version = _synonyms_version + 1
+        # endif
+
+        if not isinstance(synonyms, Lexicon) or version != synonyms.version:
+            synonyms = Lexicon(synonyms, version)
+        # endif
+
+        _synonyms_version = version
+        _cached_synonyms = synonyms
+    # endwith
 # enddef
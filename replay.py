@@ -0,0 +1,342 @@
+"""
+Replays captured parser inputs (see traffic.py) to check a parser change before it goes out:
+which inputs now parse differently, and how the parse times compare.
+
+Run it as a module from the project root, e.g. to compare the two grade engines on the captured inputs
+    python -m mysite.apps.nlp.replay engines /var/lib/nlp/traffic-*.jsonl* --baseline regex --candidate grammar
+or to compare two versions of the parser, run each one on the same files and compare the results
+    python -m mysite.apps.nlp.replay run /var/lib/nlp/traffic-*.jsonl* --output before.json
+    python -m mysite.apps.nlp.replay run /var/lib/nlp/traffic-*.jsonl* --output after.json
+    python -m mysite.apps.nlp.replay compare before.json after.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from .benchmark import percentile
+from .grade_parser import GradeParser
+from .traffic import hash_input
+
+# Percentiles of the parse times reported
+PERCENTILES: Tuple[int, ...] = (50, 90, 99)
+
+
+def read_captured(paths: Iterable[str]) -> Iterator[Dict]:
+    """
+    Reads captured inputs. Lines that aren't records (e.g. cut short by a full disk) are skipped.
+
+    :param paths: Capture files, rotated ones included
+    :return: Iterator of {"hash", "text"} records, in file order. Records captured without a hash get one.
+    """
+
+    for path in paths:
+        with open(path, encoding="utf-8") as capture_file:
+            for line in capture_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                # endtry
+
+                if not isinstance(record, dict) or not isinstance(record.get("text"), str):
+                    continue
+                # endif
+
+                yield {"hash": record.get("hash") or hash_input(record["text"]), "text": record["text"]}
+            # endfor
+        # endwith
+    # endfor
+
+
+# enddef
+
+
+def summarize(times_us: List[float]) -> Dict[str, float]:
+    """
+    :param times_us: Parse times in microseconds
+    :return: Dictionary with the count, mean_us, p50_us, p90_us, p99_us and max_us
+    """
+
+    ordered: List[float] = sorted(times_us)
+
+    summary: Dict[str, float] = {
+        "count": len(ordered),
+        "mean_us": sum(ordered) / len(ordered) if ordered else 0.0,
+    }
+    for percent in PERCENTILES:
+        summary[f"p{percent}_us"] = percentile(ordered, percent)
+    # endfor
+    summary["max_us"] = ordered[-1] if ordered else 0.0
+
+    return summary
+
+
+# enddef
+
+
+def time_parse(parser: GradeParser, text: str, repeat: int) -> Tuple[Dict, float]:
+    """
+    :param parser: Parser to use
+    :param text: Input to parse
+    :param repeat: Parses of the input, the fastest one counts
+    :return: (the result as a plain dictionary, microseconds the fastest parse took)
+    """
+
+    best: float = float("inf")
+    output: Dict = {}
+
+    for _ in range(repeat):
+        start: int = time.perf_counter_ns()
+        # parse only works the fields out when they are used
+        result = parser.parse(text).evaluate()
+        best = min(best, (time.perf_counter_ns() - start) / 1000)
+        output = result.to_dict()
+    # endfor
+
+    # the same shape as after saving and loading, so results can be compared either way
+    return json.loads(json.dumps(output)), best
+
+
+# enddef
+
+
+def run_settings(parser: GradeParser, repeat: int) -> Dict:
+    """
+    :param parser: Parser the inputs are replayed against
+    :param repeat: Parses of each input
+    :return: Settings saved with a run
+    """
+    return {
+        "engine": parser.engine,
+        "repeat": repeat,
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+# enddef
+
+
+def run(parser: GradeParser, records: Iterable[Dict], repeat: int = 1) -> Dict:
+    """
+    Parses every captured input and keeps each result and how long it took.
+
+    :param parser: Parser to replay the inputs against, without a cache so every input is parsed
+    :param records: Records from read_captured
+    :param repeat: Parses of each input, the fastest one counts
+    :return: Dictionary with the settings, each input with its output and time ("inputs")
+        and the distribution of the parse times ("latency", see summarize)
+    """
+
+    # once before timing, so loading the synonyms isn't counted
+    parser.parse("").evaluate()
+
+    inputs: List[Dict] = []
+    for record in records:
+        output, time_us = time_parse(parser, record["text"], repeat)
+        inputs.append({"hash": record["hash"], "text": record["text"], "output": output, "us": time_us})
+    # endfor
+
+    return {
+        "settings": run_settings(parser, repeat),
+        "inputs": inputs,
+        "latency": summarize([entry["us"] for entry in inputs]),
+    }
+
+
+# enddef
+
+
+def run_pair(baseline: GradeParser, candidate: GradeParser, records: Iterable[Dict],
+             repeat: int = 1) -> Tuple[Dict, Dict]:
+    """
+    Same as run for two parsers in this process, taking turns on each input so neither is timed
+    while the machine is busier than for the other.
+
+    :param baseline: Parser the outputs are compared against
+    :param candidate: Parser being checked
+    :param records: Records from read_captured
+    :param repeat: Parses of each input, the fastest one counts
+    :return: (run of the baseline, run of the candidate)
+    """
+
+    runs: Tuple[Dict, Dict] = ({"inputs": []}, {"inputs": []})
+    parsers: Tuple[GradeParser, GradeParser] = (baseline, candidate)
+
+    for parser in parsers:
+        parser.parse("").evaluate()
+    # endfor
+
+    for record in records:
+        for parser, replayed in zip(parsers, runs):
+            output, time_us = time_parse(parser, record["text"], repeat)
+            replayed["inputs"].append({"hash": record["hash"], "text": record["text"], "output": output, "us": time_us})
+        # endfor
+    # endfor
+
+    for parser, replayed in zip(parsers, runs):
+        replayed["settings"] = run_settings(parser, repeat)
+        replayed["latency"] = summarize([entry["us"] for entry in replayed["inputs"]])
+    # endfor
+
+    return runs
+
+
+# enddef
+
+
+def compare_runs(before: Dict, after: Dict) -> Dict:
+    """
+    Compares two runs over the same captured inputs. Inputs are matched up by hash, and each different input
+    is compared once however many times it was captured.
+
+    :param before: Result of run for the baseline
+    :param after: Result of run for the candidate
+    :return: Dictionary with the number of different inputs in both runs ("compared"), the ones only in one
+        ("unmatched"), each input whose output changed ("diffs": hash, text, before, after, before_us, after_us)
+        and the latency of both runs over every input (see summarize)
+    """
+
+    after_inputs: Dict[str, Dict] = {}
+    for entry in after["inputs"]:
+        after_inputs.setdefault(entry["hash"], entry)
+    # endfor
+
+    compared: int = 0
+    seen: set = set()
+    diffs: List[Dict] = []
+
+    for entry in before["inputs"]:
+        if entry["hash"] in seen or entry["hash"] not in after_inputs:
+            continue
+        # endif
+        seen.add(entry["hash"])
+        compared += 1
+
+        other: Dict = after_inputs[entry["hash"]]
+        if entry["output"] != other["output"]:
+            diffs.append({"hash": entry["hash"], "text": entry["text"], "before": entry["output"],
+                          "after": other["output"], "before_us": entry["us"], "after_us": other["us"]})
+        # endif
+    # endfor
+
+    return {
+        "compared": compared,
+        "unmatched": len(set(after_inputs) | {entry["hash"] for entry in before["inputs"]}) - compared,
+        "diffs": diffs,
+        "latency": {"before": before["latency"], "after": after["latency"]},
+    }
+
+
+# enddef
+
+
+def report(comparison: Dict, max_diffs: int = 20) -> List[str]:
+    """
+    :param comparison: Result of compare_runs
+    :param max_diffs: Most changed outputs to list
+    :return: Lines of a text report: how many outputs changed, the first of them, and the latency of both runs
+    """
+
+    diffs: List[Dict] = comparison["diffs"]
+    lines: List[str] = [f"{len(diffs)} of {comparison['compared']} inputs parse differently"
+                        + (f" ({comparison['unmatched']} only replayed in one run)" if comparison["unmatched"] else "")]
+
+    for diff in diffs[:max_diffs]:
+        lines.append(f"  {diff['text']!r}")
+        lines.append(f"    before {json.dumps(diff['before'], ensure_ascii=False)}")
+        lines.append(f"    after  {json.dumps(diff['after'], ensure_ascii=False)}")
+    # endfor
+
+    if len(diffs) > max_diffs:
+        lines.append(f"  ... and {len(diffs) - max_diffs} more")
+    # endif
+
+    columns: List[str] = ["mean"] + [f"p{percent}" for percent in PERCENTILES] + ["max"]
+    lines.append(f"{'latency':<10}" + "".join(f"{column:>12}" for column in columns))
+    for name in ("before", "after"):
+        latency: Dict[str, float] = comparison["latency"][name]
+        lines.append(f"{name:<10}" + "".join(f"{latency[f'{column}_us']:>10.1f}us" for column in columns))
+    # endfor
+
+    return lines
+
+
+# enddef
+
+
+def main(argv: List[str] | None = None) -> int:
+    """
+    Command line entry point.
+
+    :param argv: Command line arguments, defaults to sys.argv
+    :return: Exit code, 1 if compare or engines found outputs that changed
+    """
+
+    arg_parser = argparse.ArgumentParser(description="Replay captured parser inputs to compare parsers")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    run_command = commands.add_parser("run", help="parse the captured inputs and save the outputs and times")
+    run_command.add_argument("captures", nargs="+", help="capture files from TrafficRecorder")
+    run_command.add_argument("--engine", choices=GradeParser.ENGINES, default="grammar", help="grade engine")
+    run_command.add_argument("--repeat", type=int, default=1, help="parses of each input, the fastest counts")
+    run_command.add_argument("--output", required=True, help="file to write the run to as JSON")
+
+    engines_command = commands.add_parser("engines", help="compare two grade engines on the captured inputs")
+    engines_command.add_argument("captures", nargs="+", help="capture files from TrafficRecorder")
+    engines_command.add_argument("--baseline", choices=GradeParser.ENGINES, default="regex", help="engine to compare against")
+    engines_command.add_argument("--candidate", choices=GradeParser.ENGINES, default="grammar", help="engine to check")
+    engines_command.add_argument("--repeat", type=int, default=1, help="parses of each input, the fastest counts")
+    engines_command.add_argument("--max-diffs", type=int, default=20, help="most changed outputs to list")
+    engines_command.add_argument("--output", help="file to write the comparison to as JSON")
+
+    compare_command = commands.add_parser("compare", help="compare two saved runs")
+    compare_command.add_argument("before", help="run of the baseline")
+    compare_command.add_argument("after", help="run of the candidate")
+    compare_command.add_argument("--max-diffs", type=int, default=20, help="most changed outputs to list")
+    compare_command.add_argument("--output", help="file to write the comparison to as JSON")
+
+    args = arg_parser.parse_args(argv)
+
+    if args.command == "run":
+        replayed: Dict = run(GradeParser(engine=args.engine), read_captured(args.captures), args.repeat)
+
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(replayed, output_file, ensure_ascii=False)
+        # endwith
+
+        latency: Dict[str, float] = replayed["latency"]
+        print(f"{latency['count']} inputs, mean {latency['mean_us']:.1f}us, p99 {latency['p99_us']:.1f}us")
+        return 0
+    # endif
+
+    if args.command == "engines":
+        before, after = run_pair(GradeParser(engine=args.baseline), GradeParser(engine=args.candidate),
+                                 read_captured(args.captures), args.repeat)
+    else:
+        with open(args.before, encoding="utf-8") as before_file, open(args.after, encoding="utf-8") as after_file:
+            before, after = json.load(before_file), json.load(after_file)
+        # endwith
+    # endif
+
+    comparison: Dict = compare_runs(before, after)
+    print("\n".join(report(comparison, args.max_diffs)))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(comparison, output_file, ensure_ascii=False, indent=2)
+        # endwith
+    # endif
+
+    return 1 if comparison["diffs"] else 0
+
+
+# enddef
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+# endif
@@ -0,0 +1,110 @@
+"""
+Keeps the parser synonyms up to date as courses and subject requirements change in the database,
+by applying just the changed rows instead of reloading everything (see parser_utils.apply_synonym_changes).
+
+Either connect the signals once at startup (NlpConfig.ready does this) so every save/delete made through
+Django is applied straight away, or call poll_synonym_changes now and then (e.g. from a scheduled job)
+to pick up rows written some other way.
+"""
+from typing import Dict
+
+from .parser_utils import apply_synonym_changes, get_database_rows, load_combined_synonyms
+
+
+def _after_commit(course_changes: Dict[int, str | None] | None = None,
+                  subject_changes: Dict[int, str | None] | None = None) -> None:
+    """
+    Applies changed rows once the transaction they were made in commits,
+    so changes that get rolled back never reach the synonyms.
+
+    :param course_changes: Course primary key -> new name, or None if deleted
+    :param subject_changes: SubjectRequirement primary key -> new subject, or None if deleted
+    """
+    from django.db import transaction
+
+    transaction.on_commit(lambda: apply_synonym_changes(course_changes, subject_changes))
+
+
+# enddef
+
+
+def _course_saved(sender, instance, **kwargs) -> None:
+    _after_commit(course_changes={instance.pk: instance.name})
+
+
+# enddef
+
+
+def _course_deleted(sender, instance, **kwargs) -> None:
+    _after_commit(course_changes={instance.pk: None})
+
+
+# enddef
+
+
+def _subject_saved(sender, instance, **kwargs) -> None:
+    _after_commit(subject_changes={instance.pk: instance.subject})
+
+
+# enddef
+
+
+def _subject_deleted(sender, instance, **kwargs) -> None:
+    _after_commit(subject_changes={instance.pk: None})
+
+
+# enddef
+
+
+def connect_synonym_signals() -> None:
+    """
+    Applies every Course and SubjectRequirement save/delete to the synonyms as it happens.
+    Safe to call more than once, the handlers are only connected once.
+    """
+    from django.db.models.signals import post_delete, post_save
+    from mysite.apps.coursefinder.models import Course, SubjectRequirement
+
+    post_save.connect(_course_saved, sender=Course, dispatch_uid="nlp_synonyms_course_saved")
+    post_delete.connect(_course_deleted, sender=Course, dispatch_uid="nlp_synonyms_course_deleted")
+    post_save.connect(_subject_saved, sender=SubjectRequirement, dispatch_uid="nlp_synonyms_subject_saved")
+    post_delete.connect(_subject_deleted, sender=SubjectRequirement, dispatch_uid="nlp_synonyms_subject_deleted")
+
+
+# enddef
+
+
+def poll_synonym_changes(full: bool = False) -> Dict:
+    """
+    Checks the database for rows the synonyms don't have yet and applies them.
+
+    :param full: False only fetches rows added since the last poll (primary key above the highest one seen),
+        which is cheap. True compares every row's primary key and name, so changed and deleted rows are found too.
+    :return: The synonyms dictionary after the changes
+    """
+    from mysite.apps.coursefinder.models import Course, SubjectRequirement
+
+    rows = get_database_rows()
+
+    if rows is None:
+        return load_combined_synonyms()
+    # endif
+
+    if not full:
+        course_changes: Dict[int, str | None] = dict(
+            Course.objects.filter(pk__gt=rows.course_watermark).values_list('pk', 'name'))
+        subject_changes: Dict[int, str | None] = dict(
+            SubjectRequirement.objects.filter(pk__gt=rows.subject_watermark).values_list('pk', 'subject'))
+
+        return apply_synonym_changes(course_changes, subject_changes)
+    # endif
+
+    courses: Dict[int, str] = dict(Course.objects.values_list('pk', 'name'))
+    course_changes = {pk: name for pk, name in courses.items() if rows.courses.get(pk) != name}
+    course_changes.update({pk: None for pk in rows.courses if pk not in courses})
+
+    subjects: Dict[int, str] = dict(SubjectRequirement.objects.values_list('pk', 'subject'))
+    subject_changes = {pk: name for pk, name in subjects.items() if rows.subjects.get(pk) != name}
+    subject_changes.update({pk: None for pk in rows.subjects if pk not in subjects})
+
+    return apply_synonym_changes(course_changes, subject_changes)
+# enddef
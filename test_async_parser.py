@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from async_parser import AsyncGradeParser, make_process_executor
+from grade_parser import GradeParser
+
+
+class CountingParser(GradeParser):
+    """
+    Parser that counts its parses and can be held until a test lets it go
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+        self.release = threading.Event()
+
+    # enddef
+
+    def parse(self, input):
+        self.calls += 1
+        self.release.wait(5)
+        return super().parse(input)
+    # enddef
+
+
+# endclass
+
+
+class TestAsyncGradeParser(unittest.IsolatedAsyncioTestCase):
+    async def test_aparse_matches_parse(self):
+        parser = AsyncGradeParser()
+        result = await parser.aparse("A in maths, interested in law")
+        self.assertEqual(result, GradeParser().parse("A in maths, interested in law"))
+
+    # enddef
+
+    async def test_aparse_many_order(self):
+        parser = AsyncGradeParser(max_concurrency=2)
+        inputs = ["A in maths", "B in physics", "C in chemistry", "interested in medicine"]
+        results = await parser.aparse_many(inputs)
+        self.assertEqual(results, [GradeParser().parse(text) for text in inputs])
+
+    # enddef
+
+    async def test_identical_inputs_share_a_parse(self):
+        counting = CountingParser()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            parser = AsyncGradeParser(counting, executor=executor)
+            waiting = asyncio.gather(parser.aparse("A in maths"), parser.aparse("A in maths "),
+                                     parser.aparse("B in physics"))
+            await asyncio.sleep(0.05)
+            counting.release.set()
+            first, second, third = await waiting
+        # endwith
+
+        self.assertEqual(counting.calls, 2)
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+        self.assertEqual(third["grades"], {"physics": "B"})
+
+    # enddef
+
+    async def test_cancelled_caller_keeps_shared_parse(self):
+        counting = CountingParser()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            parser = AsyncGradeParser(counting, executor=executor)
+            cancelled = asyncio.ensure_future(parser.aparse("A in maths"))
+            kept = asyncio.ensure_future(parser.aparse("A in maths"))
+            await asyncio.sleep(0.05)
+            cancelled.cancel()
+            counting.release.set()
+            result = await kept
+        # endwith
+
+        self.assertEqual(result["grades"], {"mathematics": "A"})
+        self.assertEqual(counting.calls, 1)
+
+    # enddef
+
+    async def test_process_executor(self):
+        with make_process_executor(2) as executor:
+            parser = AsyncGradeParser(GradeParser(engine="regex"), executor=executor)
+            results = await parser.aparse_many(["A in maths", "B in physics"])
+        # endwith
+
+        self.assertEqual(results[0]["grades"], {"mathematics": "A"})
+        self.assertEqual(results[1]["grades"], {"physics": "B"})
+    # enddef
+
+
+# endclass
+
+
+if __name__ == "__main__":
+    unittest.main()
+# endif
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from cli import main, read_records
+
+
+class TestCli(unittest.TestCase):
+    def run_cli(self, text, *args):
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        code = main(["parse", *args], stdin=io.StringIO(text), stdout=stdout, stderr=stderr)
+        self.assertEqual(code, 0)
+        return [json.loads(line) for line in stdout.getvalue().splitlines()], stderr.getvalue()
+
+    # enddef
+
+    def test_read_records_auto(self):
+        records = list(read_records(['A in maths\n', '\n', '{"id": 1, "text": "B in physics"}\n', '{"id": 2}\n']))
+        self.assertEqual(records[0], ({"text": "A in maths"}, "A in maths"))
+        self.assertEqual(records[1], ({"id": 1, "text": "B in physics"}, "B in physics"))
+        self.assertIsNone(records[2][1])
+        self.assertEqual(records[2][0]["line"], 4)
+
+    # enddef
+
+    def test_parse_plain_lines(self):
+        records, stats = self.run_cli("A in maths\ninterested in law\n")
+        self.assertEqual(records[0], {"text": "A in maths", "parsed": {"grades": {"mathematics": "A"}, "interests": []}})
+        self.assertEqual(records[1]["parsed"]["interests"], ["law"])
+        self.assertIn("2 records (0 errors)", stats)
+
+    # enddef
+
+    def test_parse_jsonl_keeps_fields_and_order(self):
+        text = '{"id": 1, "answer": "B in physics"}\nnot json\n{"id": 3, "answer": "C in chemistry"}\n'
+        records, stats = self.run_cli(text, "--format", "jsonl", "--field", "answer", "--output-field", "result")
+        self.assertEqual([record.get("id") for record in records], [1, None, 3])
+        self.assertEqual(records[0]["result"]["grades"], {"physics": "B"})
+        self.assertIn("error", records[1])
+        self.assertEqual(records[2]["result"]["grades"], {"chemistry": "C"})
+        self.assertIn("3 records (1 errors)", stats)
+
+    # enddef
+
+    def test_errors_counted_whatever_the_fields(self):
+        text = '{"answer": "B in physics", "error": "from upstream"}\nnot json\n{"answer": "C in chemistry"}\n'
+        records, stats = self.run_cli(text, "--format", "jsonl", "--field", "answer", "--output-field", "error")
+        self.assertEqual(records[0]["error"]["grades"], {"physics": "B"})
+        self.assertIn("3 records (1 errors)", stats)
+
+    # enddef
+
+    def test_parse_with_workers(self):
+        lines = ["A in maths", "B in physics", "C in chemistry", "interested in medicine", "A in maths"]
+        records, stats = self.run_cli("\n".join(lines), "--workers", "2", "--chunksize", "2")
+        self.assertEqual([record["text"] for record in records], lines)
+        self.assertEqual(records[4]["parsed"], records[0]["parsed"])
+
+    # enddef
+
+    def test_parse_writes_metrics(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "nlp_parser.prom")
+            self.run_cli("A in maths\ninterested in law\n", "--metrics", path)
+            with open(path, encoding="utf-8") as metrics_file:
+                metrics = metrics_file.read()
+            # endwith
+        # endwith
+        self.assertIn('nlp_parser_stage_seconds_count{stage="find_course_interest"} 2', metrics)
+        self.assertIn("nlp_parser_lexicon_version ", metrics)
+    # enddef
+
+
+# endclass
+
+
+if __name__ == "__main__":
+    unittest.main()
+# endif
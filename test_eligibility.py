@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+import random
+import unittest
+from unittest import mock
+
+import eligibility
+from eligibility import CourseMatch, RequirementTable, grade_ordinal
+from grade_parser import GradeParser
+
+
+class TestRequirementTable(unittest.TestCase):
+    def setUp(self):
+        self.table = RequirementTable([
+            ("medicine", "Chemistry", "A"),
+            ("medicine", "biology", "A"),
+            ("law", "english", ""),
+            ("engineering", "maths", "A"),
+            ("engineering", "physics", "B"),
+            ("engineering", "Mathematics", "A*"),
+        ], tariffs={"law": 120, "art": 96})
+
+    # enddef
+
+    def test_compiled_rows(self):
+        self.assertEqual(self.table.courses, ("medicine", "law", "engineering", "art"))
+        self.assertIn("mathematics", self.table.subjects)
+        self.assertNotIn("maths", self.table.subjects)
+        self.assertEqual(len(self.table), 4)
+
+    # enddef
+
+    def test_match_order(self):
+        matches = self.table.match({"grades": {"mathematics": "A*", "physics": "A", "chemistry": "B"}})
+        self.assertEqual(matches, [
+            CourseMatch("engineering", True, 0, 0, 0),
+            CourseMatch("art", True, 0, 0, 0),
+            CourseMatch("law", False, 1, 1, 0),
+            CourseMatch("medicine", False, 1, 7, 0),
+        ])
+
+    # enddef
+
+    def test_eligible_only_and_k(self):
+        result = {"grades": {"english": "E"}}
+        self.assertEqual(self.table.match(result, eligible_only=True), [])
+        self.assertEqual(self.table.match(result, k=2), [CourseMatch("art", False, 0, 0, 80),
+                                                         CourseMatch("law", False, 0, 0, 104)])
+
+    # enddef
+
+    def test_match_parse_result(self):
+        result = GradeParser().parse("A* in maths and A in physics")
+        self.assertEqual(self.table.match(result, k=1), [CourseMatch("engineering", True, 0, 0, 0)])
+
+    # enddef
+
+    def test_match_many_same_without_numpy(self):
+        rnd = random.Random(3)
+        subjects = ["mathematics", "physics", "chemistry", "biology", "english", "history", "art"]
+        rows = [(course, rnd.choice(subjects), rnd.choice(["", "E", "C", "B", "A", "A*"]))
+                for course in range(200) for _ in range(rnd.randint(0, 3))]
+        table = RequirementTable(rows, tariffs={course: rnd.choice([0, 96, 120, 144]) for course in range(0, 200, 7)})
+        results = [{"grades": {subject: rnd.choice(["A*", "A", "B", "C", "D", "E", "U", "M"])
+                               for subject in rnd.sample(subjects, 3)}} for _ in range(30)]
+
+        matches = table.match_many(results, k=15)
+        eligible = table.match_many(results, eligible_only=True)
+        self.assertEqual(eligible, [[match for match in applicant if match.eligible][:10]
+                                    for applicant in table.match_many(results, k=len(table))])
+        with mock.patch.object(eligibility, "numpy", None):
+            self.assertEqual(table.match_many(results, k=15), matches)
+            self.assertEqual(table.match_many(results, eligible_only=True), eligible)
+        # endwith
+
+    # enddef
+
+    def test_unknown_required_grade(self):
+        with self.assertRaises(ValueError):
+            RequirementTable([("law", "english", "Z")])
+        # endwith
+        self.assertEqual(grade_ordinal("a*"), 7)
+        self.assertEqual(grade_ordinal("M"), 0)
+    # enddef
+
+
+# endclass
+
+
+if __name__ == "__main__":
+    unittest.main()
+# endif
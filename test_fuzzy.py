@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+import pickle
+import unittest
+
+from fuzzy import FuzzyIndex, _lookup_caches, edit_distance
+from matchers import build_phrase_patterns, find_tails
+
+
+class TestFuzzyIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = FuzzyIndex({"physics": "physics", "chemistry": "chemistry", "psychology": "psychology",
+                                 "maths": "mathematics", "french": "french", "further maths": "further mathematics",
+                                 "geology": "geology", "geography": "geography", "biology": "biology"})
+
+    # enddef
+
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance("phsyics", "physics", 2), 1)
+        self.assertEqual(edit_distance("chemestry", "chemistry", 2), 1)
+        self.assertEqual(edit_distance("kitten", "sitting", 3), 3)
+        self.assertEqual(edit_distance("kitten", "sitting", 2), 3)
+        self.assertEqual(edit_distance("abc", "abc", 0), 0)
+        self.assertEqual(edit_distance("", "abc", 2), 3)
+
+    # enddef
+
+    def test_lookup_misspellings(self):
+        self.assertEqual(self.index.lookup("phsyics"), "physics")
+        self.assertEqual(self.index.lookup("chemestry"), "chemistry")
+        self.assertEqual(self.index.lookup("psycology"), "psychology")
+        self.assertEqual(self.index.lookup("furthr maths"), "further mathematics")
+        self.assertEqual(self.index.lookup("maths"), "mathematics")
+
+    # enddef
+
+    def test_lookup_leaves_other_words(self):
+        # too short, another first letter, too far away, and as close to two subjects
+        self.assertIsNone(self.index.lookup("mahts"))
+        self.assertIsNone(self.index.lookup("trench"))
+        self.assertIsNone(self.index.lookup("physiology"))
+        self.assertIsNone(FuzzyIndex({"geology": "geology", "gemology": "gemology"}).lookup("geoology"))
+
+    # enddef
+
+    def test_lookup_cached_and_picklable(self):
+        self.assertEqual(self.index.lookup("biolgy"), "biology")
+        self.assertIn("biolgy", self.index.cache.results)
+
+        self.assertEqual(self.index.lookup("biolgy"), "biology")
+        self.assertEqual(self.index.stats(), {"hits": 1, "misses": 1, "size": 1})
+
+        copy = pickle.loads(pickle.dumps(self.index))
+        self.assertEqual(copy.stats(), {"hits": 0, "misses": 0, "size": 0})
+        self.assertEqual(copy.lookup("biolgy"), "biology")
+        self.assertEqual(len(copy), len(self.index))
+
+    # enddef
+
+    def test_names_changed(self):
+        changed = self.index.with_names_changed(["geology", "french"], {"geologi": "geology", "maths": "maths"})
+        self.assertEqual(changed.lookup("geolgi"), "geology")
+        self.assertIsNone(changed.lookup("frenhc"))
+        self.assertEqual(changed.get("maths"), "maths")
+        self.assertEqual(self.index.lookup("frenhc"), "french")
+        self.assertEqual(changed.stats(), {"hits": 0, "misses": 2, "size": 2})
+
+        rebuilt = FuzzyIndex({name: changed.get(name) for name in changed._values})
+        self.assertEqual({deletion: set(names) for deletion, names in changed._deletions.items()},
+                         {deletion: set(names) for deletion, names in rebuilt._deletions.items()})
+
+    # enddef
+
+    def test_lookup_cache_kept_out_of_index(self):
+        state = pickle.dumps(self.index)
+        self.assertEqual(self.index.lookup("biolgy"), "biology")
+        self.assertEqual(pickle.dumps(self.index), state)
+
+        # the cache goes with its index
+        caches = len(_lookup_caches)
+        self.index = None
+        self.assertEqual(len(_lookup_caches), caches - 1)
+
+    # enddef
+
+    def test_find_values_in_tails(self):
+        patterns = build_phrase_patterns({"dropped": ["dropped"], "interest": ["want to do", "into"], "none": []})
+        text = "want to do phsyics or furthr maths. into chemestry and biolgy"
+        tails = find_tails(patterns["interest_tail"], text)
+        self.assertEqual(self.index.find_values_in_tails(text, tails),
+                         ["physics", "further mathematics", "chemistry", "biology"])
+    # enddef
+
+
+# endclass
+
+
+if __name__ == "__main__":
+    unittest.main()
+# endif
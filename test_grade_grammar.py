@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+import unittest
+
+from grade_grammar import find_grades, split_grades, tokenize
+from parser_utils import get_synonyms
+
+
+class TestGradeGrammar(unittest.TestCase):
+    def setUp(self):
+        self.tables = get_synonyms()["grammar"]
+
+    # enddef
+
+    # Tests for split_grades function
+    def test_split_grades(self):
+        self.assertEqual(split_grades("A*AB"), ("A*", "A", "B"))
+        self.assertEqual(split_grades("d*m"), ("D*", "M"))
+        self.assertIsNone(split_grades("B*"))
+        self.assertIsNone(split_grades("maths"))
+
+    # enddef
+
+    # Tests for tokenize function
+    def test_tokenize_kinds(self):
+        tokens = tokenize("I got A* in Further Maths, and dropped art", self.tables)
+        kinds = [(token.kind, token.text) for token in tokens]
+        self.assertEqual(kinds, [
+            ("word", "i"), ("word", "got"), ("grade", "a*"), ("connective", "in"),
+            ("subject", "further maths"), ("punct", ","), ("connective", "and"), ("dropped", "dropped"),
+            ("subject", "art"),
+        ])
+        self.assertEqual(tokens[4].value, "further mathematics")
+
+    # enddef
+
+    def test_tokenize_offsets(self):
+        text = "Maths: A*"
+        tokens = tokenize(text, self.tables)
+        self.assertEqual([text[token.start:token.end] for token in tokens], ["Maths", ":", "A*"])
+
+    # enddef
+
+    def test_tokenize_grades_before_in(self):
+        # "de" is a subject alias, but grades followed by "in" are always grades
+        tokens = tokenize("DE in maths", self.tables)
+        self.assertEqual(tokens[0].kind, "grade")
+        self.assertEqual(tokens[0].value, ("D", "E"))
+
+    # enddef
+
+    # Tests for find_grades function
+    def test_find_grades_ignores_words_made_of_grade_letters(self):
+        self.assertEqual(find_grades("I'm thinking about med as my degree.", self.tables), {})
+        self.assertEqual(find_grades("Which course is best for me?", self.tables), {})
+
+    # enddef
+
+    def test_find_grades_interest_words_are_not_grades(self):
+        grades = find_grades("A* in Maths, B in Chemistry, interested in engineering", self.tables)
+        self.assertEqual(grades, {"mathematics": "A*", "chemistry": "B"})
+
+    # enddef
+
+    def test_find_grades_multi_grade_list_stops_at_own_grade(self):
+        grades = find_grades("EBA in hindi, graphics and aviation, english literature D*", self.tables)
+        self.assertEqual(grades["english literature"], "D*")
+        self.assertEqual(grades["aviation"], "A")
+
+    # enddef
+
+    def test_find_grades_standalone(self):
+        self.assertEqual(find_grades("I got BBA", self.tables), {"subject_1": "B", "subject_2": "B", "subject_3": "A"})
+        self.assertEqual(find_grades("I got BBA and A in maths", self.tables), {"mathematics": "A"})
+
+    # enddef
+
+    def test_find_grades_dropped_clause(self):
+        grades = find_grades("dropped chemistry and got A in maths", self.tables)
+        self.assertEqual(grades, {"mathematics": "A"})
+    # enddef
+
+
+# endclass
+
+
+if __name__ == "__main__":
+    unittest.main()
+# endif
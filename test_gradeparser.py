@@ -1,7 +1,14 @@
 #!/usr/bin/env python3
+import json
+import pickle
+import re
 import unittest
 
-from grade_parser import GradeParser
+from document import Document
+from grade_parser import GradeParser, _find_colon_grades, _finditer_lazy
+from instrumentation import StageStats
+from parse_cache import ParseCache
+from parser_utils import BASE_LEXICON, get_synonyms, set_synonyms
 
 
 class TestGradeParser(unittest.TestCase):
@@ -131,6 +138,13 @@ class TestGradeParser(unittest.TestCase):
 
     # enddef
 
+    def test_normalize_subject_unknown(self):
+        # Unknown words come back lowercased and stripped, not mapped to anything
+        self.assertEqual(self.parser.normalize_subject("  Basket Weaving "), "basket weaving")
+        self.assertEqual(self.parser.normalize_subject(""), "")
+
+    # enddef
+
     # Tests for find_all_grades function (handles single grade pairs)
     def test_find_grade_subject_pairs(self):
         pairs = self.parser.find_all_grades(
@@ -488,6 +502,280 @@ class TestGradeParser(unittest.TestCase):
         result = self.parser.parse("a* in ENGLISH literature, b in PSYCH, looking forward to law or criminology")
         self.assertEqual(result["grades"], {"english literature": "A*", "psychology": "B"})
         self.assertCountEqual(result["interests"], ["law", "criminology"])
+
+    # enddef
+
+    # Tests for picking the grade engine
+    def test_regex_engine_still_available(self):
+        parser = GradeParser(engine="regex")
+        self.assertEqual(parser.find_all_grades("A in maths, B in physics"), {"mathematics": "A", "physics": "B"})
+
+    # enddef
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            GradeParser(engine="magic")
+        # endwith
+
+    # enddef
+
+    # Tests for parse_many function
+    def test_parse_many_keeps_order(self):
+        inputs = [
+            "AAB in maths, physics, chemistry",
+            "I want to study law",
+            "AAB in maths, physics, chemistry",
+            "Maths: A, Physics: B",
+        ]
+        results = self.parser.parse_many(inputs, workers=1)
+        self.assertEqual(results, [self.parser.parse(text) for text in inputs])
+
+    # enddef
+
+    def test_parse_many_duplicates_are_copies(self):
+        results = self.parser.parse_many(["A in maths", "A in maths"], workers=1)
+        results[0]["grades"]["physics"] = "B"
+        self.assertEqual(results[1]["grades"], {"mathematics": "A"})
+
+    # enddef
+
+    def test_parse_many_workers(self):
+        inputs = ["A in maths", "B in physics", "C in chemistry", "interested in medicine", "A in maths"]
+        results = self.parser.parse_many(inputs, workers=2, chunksize=2)
+        self.assertEqual(results, [self.parser.parse(text) for text in inputs])
+
+    # enddef
+
+    def test_iter_parse_many_indexes(self):
+        inputs = ["A in maths", "B in physics", "A in maths"]
+        indexes = sorted(index for index, result in self.parser.iter_parse_many(inputs, workers=1))
+        self.assertEqual(indexes, [0, 1, 2])
+
+    # enddef
+
+    def test_parse_stream_order(self):
+        inputs = ["A in maths", "B in physics", "C in chemistry", "interested in medicine", "A in maths"]
+        expected = [self.parser.parse(text) for text in inputs]
+        self.assertEqual(list(self.parser.parse_stream(iter(inputs), workers=1)), expected)
+        self.assertEqual(list(self.parser.parse_stream(iter(inputs), workers=2, chunksize=2, max_pending=1)), expected)
+
+    # enddef
+
+    # Tests for the parse result cache
+    def test_parse_cache_hit(self):
+        cache = ParseCache(maxsize=10)
+        parser = GradeParser(cache=cache)
+        first = parser.parse("A in maths, interested in law")
+        second = parser.parse("  A in maths, interested in law ")
+        self.assertEqual(first, second)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    # enddef
+
+    def test_parse_cache_returns_copies(self):
+        parser = GradeParser(cache=ParseCache(maxsize=10))
+        parser.parse("A in maths")["grades"]["physics"] = "B"
+        self.assertEqual(parser.parse("A in maths")["grades"], {"mathematics": "A"})
+
+    # enddef
+
+    def test_parse_cache_evicts_least_recent(self):
+        cache = ParseCache(maxsize=2)
+        parser = GradeParser(cache=cache)
+        parser.parse("A in maths")
+        parser.parse("B in physics")
+        parser.parse("A in maths")
+        parser.parse("C in chemistry")
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertEqual(len(cache), 2)
+
+        # physics was used least recently so it was the one dropped
+        parser.parse("A in maths")
+        parser.parse("B in physics")
+        self.assertEqual(cache.stats()["hits"], 2)
+        self.assertEqual(cache.stats()["misses"], 4)
+
+    # enddef
+
+    def test_parse_cache_ttl(self):
+        cache = ParseCache(maxsize=10, ttl=0)
+        parser = GradeParser(cache=cache)
+        parser.parse("A in maths")
+        parser.parse("A in maths")
+        self.assertEqual(cache.stats()["hits"], 0)
+
+    # enddef
+
+    # Tests for the stage timing hook
+    def test_timing_hook_stages(self):
+        timings = []
+        parser = GradeParser(timing_hook=timings.append)
+        parser.parse("A in maths, interested in law").evaluate()
+        stages = [timing.stage for timing in timings]
+        self.assertEqual(stages, ["tokenize", "grammar", "find_course_interest", "like_pass", "merge"])
+        self.assertEqual(timings[1].matches, 1)
+        self.assertEqual(timings[0].input_length, len("A in maths, interested in law"))
+
+    # enddef
+
+    def test_timing_hook_regex_stages(self):
+        stats = StageStats()
+        parser = GradeParser(engine="regex", timing_hook=stats)
+        parser.parse("AAB in maths, physics and chemistry, dropped biology").evaluate()
+        dumped = stats.dump()
+        for stage in ["find_dropped_subjects", "multi_grade", "grade_in_subject", "subject_colon_grade"]:
+            self.assertEqual(dumped[stage]["count"], 1)
+        # endfor
+        self.assertEqual(dumped["find_dropped_subjects"]["matches"], 1)
+        self.assertEqual(dumped["multi_grade"]["matches"], 1)
+
+    # enddef
+
+    def test_stage_stats_histogram(self):
+        stats = StageStats(buckets=[0.001, 0.01])
+        parser = GradeParser(timing_hook=stats)
+        parser.parse("A in maths").evaluate()
+        parser.parse("B in physics").evaluate()
+        histogram = stats.dump()["grammar"]["histogram"]
+        self.assertEqual([bound for bound, count in histogram], [0.001, 0.01, None])
+        self.assertEqual(sum(count for bound, count in histogram), 2)
+        stats.reset()
+        self.assertEqual(stats.dump(), {})
+
+    # enddef
+
+    def test_timing_sample(self):
+        timings = []
+        parser = GradeParser(timing_hook=timings.append, timing_sample=5)
+        for _ in range(4):
+            self.assertEqual(parser.parse("A in maths, interested in law").evaluate().interests, ["law"])
+        # endfor
+        self.assertEqual(len(timings), 4)
+        with self.assertRaises(ValueError):
+            GradeParser(timing_sample=0)
+        # endwith
+
+    # enddef
+
+    # Tests for the lazy parse result
+    def test_parse_result_lazy(self):
+        timings = []
+        parser = GradeParser(timing_hook=timings.append)
+        result = parser.parse("A in maths, interested in law")
+        self.assertEqual(timings, [])
+        self.assertEqual(result.grades, {"mathematics": "A"})
+        self.assertEqual([timing.stage for timing in timings], ["tokenize", "grammar"])
+        self.assertEqual(result.interests, ["law"])
+        self.assertEqual(len(timings), 5)
+        self.assertEqual(result, {"grades": {"mathematics": "A"}, "interests": ["law"]})
+
+    # enddef
+
+    def test_parse_grades_only(self):
+        timings = []
+        parser = GradeParser(timing_hook=timings.append)
+        result = parser.parse("A in maths, interested in law", fields=("grades",))
+        self.assertEqual(dict(result), {"grades": {"mathematics": "A"}})
+        self.assertNotIn("find_course_interest", [timing.stage for timing in timings])
+        with self.assertRaises(KeyError):
+            result["interests"]
+        # endwith
+        with self.assertRaises(ValueError):
+            parser.parse("A in maths", fields=("grade",))
+        # endwith
+
+    # enddef
+
+    def test_parse_result_pickle(self):
+        result = self.parser.parse("A in maths, interested in law", fields=("interests",))
+        copy = pickle.loads(pickle.dumps(result))
+        self.assertEqual(dict(copy), {"interests": ["law"]})
+        self.assertEqual(copy.fields, ("interests",))
+
+    # enddef
+
+    def test_parse_result_to_dict(self):
+        result = self.parser.parse("A in maths, interested in law")
+        values = result.to_dict()
+        self.assertIs(type(values), dict)
+        self.assertEqual(json.loads(json.dumps(values)), {"grades": {"mathematics": "A"}, "interests": ["law"]})
+        values["grades"]["physics"] = "B"
+        self.assertEqual(result.grades, {"mathematics": "A"})
+        self.assertEqual(self.parser.parse("A in maths", fields=("grades",)).to_dict(), {"grades": {"mathematics": "A"}})
+
+    # enddef
+
+    def test_parse_result_keeps_its_synonyms(self):
+        synonyms = get_synonyms()
+        result = self.parser.parse("A in maths, interested in law")
+        # synonyms with nothing built from them, a result that looked them up when read would fail
+        set_synonyms(dict(BASE_LEXICON))
+        try:
+            self.assertEqual(result.to_dict(), {"grades": {"mathematics": "A"}, "interests": ["law"]})
+        finally:
+            set_synonyms(synonyms)
+        # endtry
+    # enddef
+
+    # Tests for the document shared between stages
+    def test_document_shared_between_stages(self):
+        document = Document("A in maths and B in physics, interested in law")
+        self.assertEqual(self.parser.find_all_grades(document), {"mathematics": "A", "physics": "B"})
+        tokens = document.tokens
+        self.assertEqual(self.parser.find_interests(document, {"mathematics": "A", "physics": "B"}), ["law"])
+        self.assertIs(document.tokens, tokens)
+        self.assertEqual(self.parser.clean_input(document), "a in maths, b in physics, interested in law")
+        self.assertEqual(self.parser.find_all_grades(document), self.parser.find_all_grades(document.text))
+        self.assertFalse(Document("A IN MATHS").case_matters)
+
+    # enddef
+
+    # Tests for misspelled subjects and courses
+    def test_parse_misspelled_subjects(self):
+        result = self.parser.parse("AB in phsyics and chemestry, psycology: C")
+        self.assertEqual(result["grades"], {"physics": "A", "chemistry": "B", "psychology": "C"})
+        self.assertEqual(self.parser.normalize_subject("Mathamatics"), "mathematics")
+        self.assertEqual(self.parser.normalize_subject("mathamatics", fuzzy=False), "mathamatics")
+
+    # enddef
+
+    def test_parse_misspelled_course(self):
+        self.assertEqual(self.parser.parse("I want to study medecine")["interests"], ["medicine"])
+        # an exact course name means misspelled ones aren't looked for
+        self.assertEqual(self.parser.parse("I want to study law or medecine")["interests"], ["law"])
+
+    # enddef
+
+    # Tests for the linear-time matching of the regex engine
+    def test_regex_engine_linear_matching_same_as_findall(self):
+        texts = ["A in maths, B in physics", "got A in ab in cd B in x", "AB in maths physics. C in art",
+                 "my grade in maths is A and in art  is b", "in in in x is A*", "maths: A, physics - b, art:1",
+                 "  : A ab :- B", "ab in " * 30 + "cd, e in f", "A in x " * 30, "in ab " * 30 + "is C"]
+        lazy_patterns = [
+            (r'\b(?:got\s+)?(A\*|D\*|[A-U])\s+in\s+([a-zA-Z]+(?:\s+[a-zA-Z]+)*?)(?=\s+[A-U]\s+in\s+|[,.]|$)',
+             r'\b(?:got\s+)?(?:A\*|D\*|[A-U])\s+in\s+', r'[a-zA-Z\s]*'),
+            (r"(?:my grade in|in)\s+([a-zA-Z\s]+?)\s+is\s+(A\*|D\*|A|B|C|D|E|U|M|P)", r"(?:my grade in|in)\s+",
+             r'[a-zA-Z\s]*'),
+            (r'\b((?:A\*|D\*|[A-U]){2,})\s+in\s+([a-zA-Z\s,]+?)(?:\.|,\s*[a-zA-Z]+\s+in\s|$)',
+             r'\b(?:A\*|D\*|[A-U]){2,}\s+in\s+', r'[a-zA-Z\s,]*'),
+        ]
+
+        for text in texts:
+            for pattern, head, run in lazy_patterns:
+                self.assertEqual([(match.span(), match.groups()) for match in _finditer_lazy(pattern, head, run, text)],
+                                 [(match.span(), match.groups()) for match in re.finditer(pattern, text, re.I)])
+            # endfor
+            self.assertEqual(_find_colon_grades(text),
+                             re.findall(r"([a-zA-Z\s]+?)\s*[:\-]\s*(A\*|D\*|A|B|C|D|E|U|M|P)", text, re.I))
+        # endfor
+
+    # enddef
+
+    def test_regex_engine_long_input(self):
+        parser = GradeParser(engine="regex")
+        result = parser.parse("A in maths" + " " * 20000 + ", B in physics, art: C, " + "i like maths " * 2000)
+        self.assertEqual(result["grades"], {"mathematics": "A", "physics": "B", "art": "C"})
     # enddef
 
 
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+import json
+import os
+import tempfile
+import unittest
+
+from grade_parser import GradeParser
+from lexicon_snapshot import lexicon_fingerprint, load_snapshot, read_fixture_rows, save_snapshot, snapshot_path
+from parser_utils import DatabaseRows, build_combined_synonyms, load_combined_synonyms
+
+
+class TestLexiconSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.rows = DatabaseRows(courses={1: "Oenology BSc (Hons)"}, subjects={2: "Astronomy"})
+
+    # enddef
+
+    def tearDown(self):
+        self.directory.cleanup()
+        load_combined_synonyms()
+
+    # enddef
+
+    def test_fingerprint_follows_rows(self):
+        same = DatabaseRows(courses={1: "Oenology BSc (Hons)"}, subjects={2: "Astronomy"})
+        renamed = DatabaseRows(courses={1: "Viticulture BSc"}, subjects={2: "Astronomy"})
+        self.assertEqual(lexicon_fingerprint(self.rows), lexicon_fingerprint(same))
+        self.assertNotEqual(lexicon_fingerprint(self.rows), lexicon_fingerprint(renamed))
+
+    # enddef
+
+    def test_save_and_load(self):
+        fingerprint = lexicon_fingerprint(self.rows)
+        synonyms = build_combined_synonyms(self.rows)
+        path = save_snapshot(self.directory.name, synonyms, fingerprint)
+        self.assertEqual(path, snapshot_path(self.directory.name, fingerprint))
+
+        loaded = load_snapshot(self.directory.name, fingerprint)
+        self.assertEqual(loaded["courses"], synonyms["courses"])
+        self.assertEqual(loaded["course_matcher"].find_values("oenology bsc (hons)"), ["oenology"])
+        self.assertIsNone(load_snapshot(self.directory.name, "0" * 64))
+
+    # enddef
+
+    def test_broken_snapshot_ignored(self):
+        fingerprint = lexicon_fingerprint(self.rows)
+        with open(snapshot_path(self.directory.name, fingerprint), "wb") as snapshot_file:
+            snapshot_file.write(b"not a pickle")
+        # endwith
+        self.assertIsNone(load_snapshot(self.directory.name, fingerprint))
+
+    # enddef
+
+    def test_load_combined_synonyms_uses_snapshot(self):
+        first = load_combined_synonyms(snapshot_dir=self.directory.name)
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
+
+        second = load_combined_synonyms(snapshot_dir=self.directory.name)
+        self.assertEqual(second["courses"], first["courses"])
+        self.assertEqual(second["version"], first["version"] + 1)
+        self.assertEqual(GradeParser().parse("A in maths, interested in law")["interests"], ["law"])
+
+    # enddef
+
+    def test_read_fixture_rows(self):
+        fixtures = [
+            {"model": "coursefinder.course", "pk": 1, "fields": {"name": "Oenology BSc (Hons)", "ucas_code": "X1"}},
+            {"model": "coursefinder.subjectrequirement", "pk": 2, "fields": {"subject": "Astronomy"}},
+            {"model": "coursefinder.university", "pk": 3, "fields": {"name": "Somewhere"}},
+        ]
+        path = os.path.join(self.directory.name, "fixtures.json")
+        with open(path, "w") as fixture_file:
+            json.dump(fixtures, fixture_file)
+        # endwith
+
+        rows = read_fixture_rows(path)
+        self.assertEqual(rows.courses, {1: "Oenology BSc (Hons)"})
+        self.assertEqual(rows.subjects, {2: "Astronomy"})
+        self.assertEqual(lexicon_fingerprint(rows), lexicon_fingerprint(self.rows))
+    # enddef
+
+
+# endclass
+
+
+if __name__ == "__main__":
+    unittest.main()
+# endif
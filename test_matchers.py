@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+import pickle
+import re
+import unittest
+
+from matchers import build_course_matcher, build_phrase_pattern, build_phrase_patterns, build_sentence_pattern, \
+    find_sentences, find_tails
+
+
+class TestMatchers(unittest.TestCase):
+    # Tests for build_phrase_pattern function
+    def test_build_phrase_pattern_matches_every_phrase(self):
+        phrases = ["gave up", "gave in", "gave away", "quit", "didn't take"]
+        pattern = re.compile(build_phrase_pattern(phrases))
+        for phrase in phrases:
+            self.assertEqual(pattern.fullmatch(phrase).group(0), phrase)
+        # endfor
+
+    # enddef
+
+    def test_build_phrase_pattern_longest_first(self):
+        pattern = re.compile(build_phrase_pattern(["dropped", "dropped out", "withdrew", "withdrew from"]))
+        self.assertEqual(pattern.search("i dropped out of maths").group(0), "dropped out")
+        self.assertEqual(pattern.search("withdrew from art").group(0), "withdrew from")
+
+    # enddef
+
+    def test_build_phrase_pattern_escapes(self):
+        pattern = re.compile(build_phrase_pattern(["n/a", "a.b"]))
+        self.assertIsNotNone(pattern.search("n/a"))
+        self.assertIsNone(pattern.search("axb"))
+
+    # enddef
+
+    def test_build_phrase_pattern_empty(self):
+        pattern = re.compile(build_phrase_pattern([]))
+        self.assertIsNone(pattern.search("anything"))
+
+    # enddef
+
+    # Tests for the course matcher
+    def test_course_matcher_whole_words_only(self):
+        matcher = build_course_matcher({"art": ["art", "fine art"], "computer science": ["cs"]})
+        self.assertEqual(matcher.find_values("i went to a party"), [])
+        self.assertEqual(matcher.find_values("economics"), [])
+        self.assertEqual(matcher.find_values("fine art and cs"), ["art", "computer science"])
+
+    # enddef
+
+    def test_course_matcher_longest_match(self):
+        matcher = build_course_matcher({"english": ["english"], "english literature": ["english lit"]})
+        self.assertEqual(matcher.find_values("english literature"), ["english literature"])
+        self.assertEqual(matcher.find_values("english lit, english"), ["english literature", "english"])
+
+    # enddef
+
+    def test_course_matcher_shared_alias(self):
+        matcher = build_course_matcher({"biology": ["ecology"], "environmental science": ["ecology"]})
+        self.assertEqual(matcher.find_all("ecology"), [(0, 7, ("biology", "environmental science"))])
+
+    # enddef
+
+    # Tests for the layered course matcher
+    def test_layered_matcher_extra_courses(self):
+        base = build_course_matcher({"biology": ["bio"], "english": ["english"]})
+        matcher = build_course_matcher({"biology": ["bio", "ecology"], "english": ["english"],
+                                        "english literature": ["english lit (hons)"]}, base=base)
+        self.assertEqual(matcher.extra, {"ecology": ("biology",), "english literature": ("english literature",),
+                                         "english lit (hons)": ("english literature",)})
+        self.assertEqual(matcher.find_values("bio, english literature and ecology"),
+                         ["biology", "english literature"])
+        self.assertEqual(matcher.find_values("english lit (hons)"), ["english literature"])
+        self.assertEqual(matcher.find_values("ecologyx"), [])
+
+    # enddef
+
+    def test_layered_matcher_values_moved(self):
+        base = build_course_matcher({"biology": ["ecology"]})
+        matcher = build_course_matcher({"biology": ["ecology"]}, base=base)
+        added = matcher.with_values_moved([("environmental science", set(), {"ecology", "environmental science"})])
+        self.assertEqual(added.find_all("ecology"), [(0, 7, ("biology", "environmental science"))])
+        removed = added.with_values_moved([("environmental science", {"ecology", "environmental science"}, set())])
+        self.assertEqual(removed.find_values("ecology, environmental science"), ["biology"])
+        self.assertEqual(removed.extra_keys, {})
+        # the matcher it was made from is left alone
+        self.assertEqual(added.find_values("environmental science"), ["environmental science"])
+
+    # enddef
+
+    def test_matcher_compact_and_picklable(self):
+        base = build_course_matcher({"biology": ["life sciences"]})
+        matcher = build_course_matcher({"biology": ["life sciences"], "ecology": []}, base=base)
+        self.assertFalse(hasattr(matcher, "__dict__"))
+        self.assertIsInstance(base.output, tuple)
+
+        copy = pickle.loads(pickle.dumps(matcher))
+        self.assertEqual(copy.find_values("life sciences or ecology"), ["biology", "ecology"])
+
+    # enddef
+
+    # Tests for find_tails and find_values_in_tails
+    def test_tails_same_as_capturing_them(self):
+        patterns = build_phrase_patterns({"dropped": ["dropped"], "interest": ["want to do", "want", "into"],
+                                          "none": ["none"]})
+        matcher = build_course_matcher({"law": [], "computer science": ["comp sci"], "science": []})
+        capturing = re.compile(r"(?:want to do|want|into)(?=\s+([a-z\s]+))")
+        texts = ["i want law", "i want to do comp sci, and into science", "want want  want law into",
+                 "want   ", "into 1 want computer want science law", "i want " * 50 + "law. want science"]
+
+        for text in texts:
+            tails = find_tails(patterns["interest_tail"], text)
+            self.assertEqual([text[start:end] for start, end in tails], capturing.findall(text))
+
+            expected = []
+            for tail in capturing.findall(text):
+                expected.extend(value for value in matcher.find_values(tail) if value not in expected)
+            # endfor
+            self.assertEqual(matcher.find_values_in_tails(text, tails), expected)
+        # endfor
+
+    # enddef
+
+    # Tests for build_sentence_pattern and find_sentences
+    def test_sentence_pattern_keeps_phrases_whole(self):
+        synonyms = {"subject_index": {"maths": "maths"}, "courses": {"law": frozenset({"ll.b hons"})},
+                    "dropped": ["dropped"], "interest": ["want to do"], "none": ["none!"]}
+        pattern = build_sentence_pattern(synonyms)
+        text = "A in maths. I dropped art! Want to do ll.b hons; none! B in art?"
+        self.assertEqual([text[start:end] for start, end in find_sentences(pattern, text)],
+                         ["A in maths.", " I dropped art! Want to do ll.b hons;", " none! B in art?"])
+
+    # enddef
+
+    def test_sentence_pattern_nothing_safe(self):
+        synonyms = {"subject_index": {"f. maths": "further maths"}, "courses": {}, "dropped": ["gave up!"],
+                    "interest": ["want to do?", "into;"], "none": []}
+        pattern = build_sentence_pattern(synonyms)
+        self.assertEqual(find_sentences(pattern, "A in f. maths. B in art!"), [(0, 24)])
+    # enddef
+
+
+# endclass
+
+
+if __name__ == "__main__":
+    unittest.main()
+# endif
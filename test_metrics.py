@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import unittest
+import urllib.request
+
+from grade_parser import GradeParser
+from instrumentation import StageStats
+from metrics import MetricsExporter, format_labels
+from parse_cache import ParseCache
+from parser_utils import get_lexicon_stats, load_combined_synonyms
+
+
+class TestMetricsExporter(unittest.TestCase):
+    def setUp(self):
+        load_combined_synonyms()
+        self.stats = StageStats(buckets=[0.001, 10.0])
+        self.parser = GradeParser(cache=ParseCache(), timing_hook=self.stats)
+        self.exporter = MetricsExporter(self.stats, self.parser.cache)
+
+    # enddef
+
+    def samples(self, text):
+        return dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+
+    # enddef
+
+    def test_stage_histograms(self):
+        for text in ["A in maths", "I want to study law", "A in maths"]:
+            self.parser.parse(text).evaluate()
+        # endfor
+        samples = self.samples(self.exporter.render())
+
+        self.assertEqual(samples['nlp_parser_stage_seconds_bucket{stage="tokenize",le="10.0"}'], "2")
+        self.assertEqual(samples['nlp_parser_stage_seconds_bucket{stage="tokenize",le="+Inf"}'], "2")
+        self.assertEqual(samples['nlp_parser_stage_seconds_count{stage="tokenize"}'], "2")
+        self.assertGreater(float(samples['nlp_parser_stage_seconds_sum{stage="tokenize"}']), 0)
+        # maths is found as a course too, it is only left out of the interests afterwards
+        self.assertEqual(samples['nlp_parser_stage_matches_total{stage="find_course_interest"}'], "2")
+
+        self.assertEqual(samples['nlp_parser_cache_hits_total{cache="parse"}'], "1")
+        self.assertEqual(samples['nlp_parser_cache_misses_total{cache="parse"}'], "2")
+        self.assertIn('nlp_parser_cache_hit_ratio{cache="subject_fuzzy"}', samples)
+        self.assertEqual(samples["nlp_parser_lexicon_courses"], str(get_lexicon_stats()["courses"]))
+
+    # enddef
+
+    def test_labels_escaped(self):
+        self.assertEqual(format_labels({"stage": 'a"b\\c\nd'}), '{stage="a\\"b\\\\c\\nd"}')
+        self.assertEqual(format_labels({}), "")
+
+    # enddef
+
+    def test_write_and_serve(self):
+        self.parser.parse("A in maths").evaluate()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "nlp_parser.prom")
+            self.exporter.write(path)
+            with open(path, encoding="utf-8") as metrics_file:
+                written = metrics_file.read()
+            # endwith
+            self.assertEqual(os.listdir(directory), ["nlp_parser.prom"])
+        # endwith
+        self.assertIn("# TYPE nlp_parser_stage_seconds histogram", written)
+
+        server = MetricsExporter(self.stats).serve(0)
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/metrics"
+            with urllib.request.urlopen(url) as response:
+                self.assertTrue(response.headers["Content-Type"].startswith("text/plain; version=0.0.4"))
+                served = response.read().decode("utf-8")
+            # endwith
+        finally:
+            server.shutdown()
+            server.server_close()
+        # endtry
+        self.assertIn('nlp_parser_stage_seconds_count{stage="tokenize"} 1', served)
+        self.assertNotIn('cache="parse"', served)
+    # enddef
+
+
+# endclass
+
+
+if __name__ == "__main__":
+    unittest.main()
+# endif
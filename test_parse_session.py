@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+import unittest
+
+from document import Document
+from grade_parser import GradeParser
+from parse_session import ParseSession
+
+
+class TestParseSession(unittest.TestCase):
+    def setUp(self):
+        self.parser = GradeParser()
+        self.session = ParseSession(self.parser)
+
+    # enddef
+
+    def test_same_as_parse_while_typing(self):
+        inputs = [
+            "I got AAB in maths, physics and chemistry. I dropped biology! Interested in medicine or law",
+            "Maths: A; I like maths and want to do engineering. BBB",
+            "I got BBB. Hoping to study computer science. A in art",
+            "A IN MATHS. B IN PHYSICS",
+            "A in phsyics. I want to study medecine. Interested in compter science",
+        ]
+        for text in inputs:
+            for end in range(1, len(text) + 1):
+                self.assertEqual(self.session.parse(text[:end]), self.parser.parse(text[:end]), text[:end])
+            # endfor
+        # endfor
+
+    # enddef
+
+    def test_only_changed_sentences_parsed(self):
+        self.session.parse("A in maths. B in physics. Interested in law")
+        self.assertEqual(self.session.parsed, 3)
+        result = self.session.parse("A in maths. B in physics. Interested in medicine")
+        self.assertEqual(self.session.parsed, 4)
+        self.assertEqual(self.session.reused, 2)
+        self.assertEqual(result["interests"], ["medicine"])
+
+    # enddef
+
+    def test_document_sentences(self):
+        text = "A in f. maths. B in art!  Interested in law?"
+        sentences = [text[start:end] for start, end in Document(text).sentences]
+        self.assertEqual(sentences, ["A in f.", " maths.", " B in art!", "  Interested in law?"])
+        self.assertEqual(Document("A in f.maths").sentences, [(0, 12)])
+        self.assertEqual(Document("").sentences, [])
+
+    # enddef
+
+    def test_regex_engine_parses_everything(self):
+        parser = GradeParser(engine="regex")
+        session = ParseSession(parser)
+        text = "AAB in maths, physics and chemistry. Interested in law"
+        self.assertEqual(session.parse(text), parser.parse(text))
+        self.assertEqual(session.parsed, 0)
+    # enddef
+
+
+# endclass
+
+
+if __name__ == "__main__":
+    unittest.main()
+# endif
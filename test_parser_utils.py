@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+import gc
+import pickle
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+import parser_utils
+from grade_parser import GradeParser
+from lexicon import Lexicon
+from parse_cache import ParseCache
+from parser_utils import BASE_LEXICON, DatabaseRows, apply_synonym_changes, course_alias_from_name, \
+    extract_course_field_from_name, freeze_lexicon, get_database_rows, get_synonyms, load_combined_synonyms
+from synonyms import SYNONYMS
+
+
+class TestSynonymChanges(unittest.TestCase):
+    def setUp(self):
+        load_combined_synonyms()
+        self.parser = GradeParser()
+
+    # enddef
+
+    def tearDown(self):
+        load_combined_synonyms()
+
+    # enddef
+
+    def test_new_course_found(self):
+        version = get_synonyms()["version"]
+        apply_synonym_changes(course_changes={1: "Oenology BSc (Hons)"})
+        self.assertEqual(get_synonyms()["version"], version + 1)
+        self.assertEqual(get_synonyms()["courses"]["oenology"], {"oenology", "oenology bsc (hons)"})
+        self.assertEqual(self.parser.find_course_interest("interested in oenology"), ["oenology"])
+
+    # enddef
+
+    def test_deleted_course_removed(self):
+        apply_synonym_changes(course_changes={1: "Oenology BSc", 2: "Oenology BA"})
+        apply_synonym_changes(course_changes={1: None})
+        self.assertEqual(get_synonyms()["courses"]["oenology"], {"oenology", "oenology ba"})
+        apply_synonym_changes(course_changes={2: None})
+        self.assertNotIn("oenology", get_synonyms()["courses"])
+        self.assertEqual(self.parser.find_course_interest("interested in oenology"), [])
+
+    # enddef
+
+    def test_renamed_course(self):
+        apply_synonym_changes(course_changes={1: "Oenology BSc"})
+        apply_synonym_changes(course_changes={1: "Viticulture BSc"})
+        self.assertNotIn("oenology", get_synonyms()["courses"])
+        self.assertIn("viticulture", get_synonyms()["courses"])
+        self.assertEqual(get_database_rows().course_watermark, 1)
+
+    # enddef
+
+    def test_hardcoded_courses_not_changed(self):
+        course, aliases = next(iter(SYNONYMS["courses"].items()))
+        before = list(aliases)
+        apply_synonym_changes(course_changes={1: f"{course} BSc (Hons)"})
+        self.assertIn(f"{course} bsc (hons)", get_synonyms()["courses"][course])
+        self.assertEqual(SYNONYMS["courses"][course], before)
+        apply_synonym_changes(course_changes={1: None})
+        self.assertEqual(get_synonyms()["courses"][course], set(before))
+
+    # enddef
+
+    def test_subject_added_and_removed(self):
+        apply_synonym_changes(subject_changes={5: "Astronomy"})
+        self.assertEqual(self.parser.normalize_subject("astronomy"), "astronomy")
+        self.assertEqual(self.parser.find_all_grades("A in astronomy"), {"astronomy": "A"})
+        apply_synonym_changes(subject_changes={5: None})
+        self.assertNotIn("astronomy", get_synonyms()["subject_aliases"])
+
+        # nor does loading the rows that are left again
+        with mock.patch.object(parser_utils, "read_database_rows", return_value=get_database_rows()):
+            self.assertNotIn("astronomy", load_combined_synonyms()["subject_aliases"])
+        # endwith
+
+    # enddef
+
+    def test_reload_does_not_grow_synonyms(self):
+        course = next(iter(SYNONYMS["courses"]))
+        rows = DatabaseRows(courses={1: f"{course} BSc (Hons)", 2: "Oenology BA"}, subjects={3: "Astronomy"})
+        before = {name: list(aliases) for name, aliases in SYNONYMS["courses"].items()}
+
+        with mock.patch.object(parser_utils, "read_database_rows", return_value=rows):
+            sizes = set()
+            for _ in range(5):
+                synonyms = load_combined_synonyms()
+                sizes.add(sum(len(aliases) for aliases in synonyms["courses"].values()))
+            # endfor
+        # endwith
+
+        self.assertEqual(len(sizes), 1)
+        self.assertEqual({name: list(aliases) for name, aliases in SYNONYMS["courses"].items()}, before)
+        self.assertIs(synonyms["courses"]["oenology"], get_synonyms()["courses"]["oenology"])
+
+    # enddef
+
+    def test_base_lexicon_read_only(self):
+        with self.assertRaises(TypeError):
+            BASE_LEXICON["courses"]["oenology"] = frozenset()
+        # endwith
+        self.assertIsInstance(BASE_LEXICON["subjects"]["mathematics"], frozenset)
+
+    # enddef
+
+    def test_no_change_keeps_version(self):
+        synonyms = get_synonyms()
+        self.assertIs(apply_synonym_changes(subject_changes={5: None}), synonyms)
+
+    # enddef
+
+    def test_row_ids(self):
+        rows = DatabaseRows(courses={4: "Oenology BSc", 7: "Oenology BA", 9: "Law LLB"},
+                            subjects={3: "Maths", 5: "Mathematics", 6: "Astronomy"})
+        with mock.patch.object(parser_utils, "read_database_rows", return_value=rows):
+            synonyms = load_combined_synonyms()
+        # endwith
+        self.assertEqual(synonyms["course_ids"]["oenology"], (4, 7))
+        self.assertEqual(synonyms["subject_ids"]["mathematics"], (5, 3))
+
+        result = self.parser.parse("A in maths and B in astronomy, interested in oenology and law")
+        self.assertEqual(result.course_ids(), [4, 7, 9])
+        self.assertEqual(result.subject_requirement_ids(), [5, 3, 6])
+
+        # changed rows give the same indexes as loading them all again
+        apply_synonym_changes(course_changes={4: None, 8: "Law BA"}, subject_changes={5: None, 6: "Astrology"})
+        changed = get_synonyms()
+        with mock.patch.object(parser_utils, "read_database_rows", return_value=get_database_rows()):
+            loaded = load_combined_synonyms()
+        # endwith
+        self.assertEqual(changed["course_ids"], loaded["course_ids"])
+        self.assertEqual(changed["subject_ids"], loaded["subject_ids"])
+        self.assertEqual(loaded["course_ids"]["law"], (9, 8))
+        self.assertNotIn("astronomy", loaded["subject_ids"])
+
+    # enddef
+
+    def test_row_ids_from_parsed_synonyms(self):
+        rows = DatabaseRows(courses={4: "Oenology BSc", 9: "Law LLB"}, subjects={3: "Astronomy"})
+        with mock.patch.object(parser_utils, "read_database_rows", return_value=rows):
+            load_combined_synonyms()
+        # endwith
+
+        text = "A in astronomy, interested in oenology and law"
+        result = self.parser.parse(text)
+        caching = GradeParser(cache=ParseCache())
+        caching.parse(text)
+        cached = caching.parse(text)
+        apply_synonym_changes(course_changes={4: None, 9: None}, subject_changes={3: None})
+
+        for parsed in (result, cached):
+            self.assertEqual(parsed.interests, ["oenology", "law"])
+            self.assertEqual(parsed.course_ids(), [4, 9])
+            self.assertEqual(parsed.subject_requirement_ids(), [3])
+        # endfor
+        self.assertEqual(self.parser.parse("interested in law").course_ids(), [])
+
+    # enddef
+
+    def test_sentence_pattern_only_rebuilt_for_punctuation(self):
+        pattern = get_synonyms()["sentence_pattern"]
+        apply_synonym_changes(course_changes={1: "Oenology BSc"}, subject_changes={5: "Astronomy"})
+        self.assertIs(get_synonyms()["sentence_pattern"], pattern)
+
+        apply_synonym_changes(course_changes={2: "Yahoo! Studies BA"})
+        self.assertIsNone(get_synonyms()["sentence_pattern"].search("want to do yahoo! studies"))
+        apply_synonym_changes(course_changes={2: None})
+        self.assertIsNotNone(get_synonyms()["sentence_pattern"].search("want to do yahoo! studies"))
+
+    # enddef
+
+    def test_fuzzy_indexes_changed_not_rebuilt(self):
+        apply_synonym_changes(course_changes={1: "Oenology BSc"}, subject_changes={5: "Astronomy"})
+
+        rebuilt = AssertionError("fuzzy index built again")
+        with mock.patch.object(parser_utils, "FuzzyIndex", side_effect=rebuilt), \
+                mock.patch.object(parser_utils, "build_course_fuzzy_index", side_effect=rebuilt):
+            apply_synonym_changes(course_changes={1: "Viticulture BSc", 2: "Oenology BA"},
+                                  subject_changes={5: None, 6: "Astrology"})
+        # endwith
+
+        changed = get_synonyms()
+        self.assertEqual(changed["course_fuzzy"].lookup("viticultre"), "viticulture")
+        self.assertEqual(changed["course_fuzzy"].lookup("oenolgy"), "oenology")
+        self.assertEqual(changed["subject_fuzzy"].lookup("astrologi"), "astrology")
+        self.assertIsNone(changed["subject_fuzzy"].lookup("astronomi"))
+
+        # the same indexes as loading every row again
+        with mock.patch.object(parser_utils, "read_database_rows", return_value=get_database_rows()):
+            loaded = load_combined_synonyms()
+        # endwith
+        for name in ("course_fuzzy", "subject_fuzzy"):
+            self.assertEqual(changed[name]._values, loaded[name]._values)
+            self.assertEqual({deletion: set(names) for deletion, names in changed[name]._deletions.items()},
+                             {deletion: set(names) for deletion, names in loaded[name]._deletions.items()})
+        # endfor
+
+    # enddef
+
+    def test_course_names_cleaned_once(self):
+        self.assertEqual(extract_course_field_from_name("Computer Science with Law BSc (Hons)"), "computer science law")
+        # a removal can come off what an earlier one left of a word
+        self.assertEqual(extract_course_field_from_name("Oenology BScBA"), "oenology")
+        self.assertEqual(extract_course_field_from_name("Oenology and and Law"), "oenology and law")
+
+        course_alias_from_name.cache_clear()
+        rows = DatabaseRows(courses={pk: "Oenology BSc (Hons)" for pk in range(50)})
+        self.assertEqual(rows.course_aliases("oenology"), frozenset({"oenology", "oenology bsc (hons)"}))
+        self.assertEqual(course_alias_from_name.cache_info().misses, 1)
+    # enddef
+
+
+# endclass
+
+
+class TestSynonymLoading(unittest.TestCase):
+    def setUp(self):
+        self.loads = 0
+
+    # enddef
+
+    def tearDown(self):
+        load_combined_synonyms()
+
+    # enddef
+
+    def slow_read(self):
+        self.loads += 1
+        time.sleep(0.1)
+        return DatabaseRows()
+
+    # enddef
+
+    def run_together(self, function, count=8):
+        barrier = threading.Barrier(count)
+        results = [None] * count
+
+        def run(i):
+            barrier.wait()
+            results[i] = function()
+
+        # enddef
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        # endfor
+        for thread in threads:
+            thread.join()
+        # endfor
+
+        return results
+
+    # enddef
+
+    def test_first_callers_share_one_load(self):
+        with mock.patch.object(parser_utils, "read_database_rows", self.slow_read), \
+                mock.patch.object(parser_utils, "_cached_synonyms", None):
+            results = self.run_together(get_synonyms)
+        # endwith
+
+        self.assertEqual(self.loads, 1)
+        self.assertTrue(all(result is results[0] for result in results))
+
+    # enddef
+
+    def test_concurrent_loads_share_one_load(self):
+        version = get_synonyms().version
+
+        with mock.patch.object(parser_utils, "read_database_rows", self.slow_read):
+            results = self.run_together(load_combined_synonyms)
+        # endwith
+
+        self.assertEqual(self.loads, 1)
+        self.assertEqual({result.version for result in results}, {version + 1})
+
+    # enddef
+
+    def test_lexicon_read_only(self):
+        synonyms = get_synonyms()
+        self.assertIsInstance(synonyms, Lexicon)
+        with self.assertRaises(TypeError):
+            synonyms["courses"] = {}
+        # endwith
+        with self.assertRaises(TypeError):
+            synonyms.update(version=0)
+        # endwith
+
+        copy = pickle.loads(pickle.dumps(synonyms))
+        self.assertIsInstance(copy, Lexicon)
+        self.assertEqual(copy.version, synonyms.version)
+        self.assertEqual(copy["courses"], synonyms["courses"])
+
+    # enddef
+
+    def test_lexicon_strings_interned(self):
+        apply_synonym_changes(course_changes={1: "Oenology BA"}, subject_changes={2: "Astronomy"})
+        synonyms = get_synonyms()
+        for alias, subject in synonyms["subject_index"].items():
+            self.assertIs(sys.intern(alias), alias)
+            self.assertIs(sys.intern(subject), subject)
+        # endfor
+        for alias in synonyms["courses"]["oenology"]:
+            self.assertIs(sys.intern(alias), alias)
+        # endfor
+
+    # enddef
+
+    def test_freeze_lexicon(self):
+        try:
+            self.assertIs(freeze_lexicon(), get_synonyms())
+            self.assertGreater(gc.get_freeze_count(), 0)
+        finally:
+            gc.unfreeze()
+        # endtry
+
+    # enddef
+
+    def test_versions_only_go_up(self):
+        first = get_synonyms().version
+        parser_utils.set_synonyms(dict(BASE_LEXICON))
+        second = get_synonyms().version
+        self.assertGreater(second, first)
+        self.assertGreater(load_combined_synonyms().version, second)
+    # enddef
+
+    def test_older_synonyms_get_new_version(self):
+        older = get_synonyms()
+        load_combined_synonyms()
+        newest = get_synonyms().version
+        parser_utils.set_synonyms(older)
+        restored = get_synonyms()
+        self.assertGreater(restored.version, newest)
+        self.assertEqual(dict(restored, version=older.version), older)
+        # a result cached under the newest version isn't returned for the older synonyms
+        parser_utils.set_synonyms(dict(restored, version=newest))
+        self.assertGreater(get_synonyms().version, restored.version)
+    # enddef
+
+
+# endclass
+
+
+if __name__ == "__main__":
+    unittest.main()
+# endif
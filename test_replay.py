@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from grade_parser import GradeParser
+from replay import compare_runs, main, read_captured, report, run, run_pair
+from traffic import TrafficRecorder
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.capture = os.path.join(self.directory.name, "traffic.jsonl")
+
+        recorder = TrafficRecorder(self.capture, sample=1)
+        for text in ["A in maths", "I got an A in phsyics", "A in maths", "want to do medcine"]:
+            recorder.record(text)
+        # endfor
+        recorder.close()
+
+        with open(self.capture, "a", encoding="utf-8") as capture_file:
+            capture_file.write('{"text": "B in physics"}\n{"time": 1, "te')
+        # endwith
+
+    # enddef
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # enddef
+
+    def test_read_captured(self):
+        records = list(read_captured([self.capture]))
+        self.assertEqual([record["text"] for record in records],
+                         ["A in maths", "I got an A in phsyics", "A in maths", "want to do medcine", "B in physics"])
+        self.assertEqual(records[0]["hash"], records[2]["hash"])
+
+    # enddef
+
+    def test_engines_differ(self):
+        before, after = run_pair(GradeParser(engine="regex"), GradeParser(), read_captured([self.capture]))
+        comparison = compare_runs(before, after)
+
+        self.assertEqual(comparison["compared"], 4)
+        self.assertEqual(comparison["unmatched"], 0)
+        self.assertEqual([diff["text"] for diff in comparison["diffs"]], ["I got an A in phsyics"])
+        self.assertEqual(comparison["diffs"][0]["after"]["grades"], {"physics": "A"})
+        self.assertEqual(comparison["latency"]["after"]["count"], 5)
+
+        lines = report(comparison)
+        self.assertEqual(lines[0], "1 of 4 inputs parse differently")
+        self.assertTrue(lines[-1].startswith("after"))
+
+    # enddef
+
+    def test_saved_runs(self):
+        before = os.path.join(self.directory.name, "before.json")
+        after = os.path.join(self.directory.name, "after.json")
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(main(["run", self.capture, "--output", before]), 0)
+            self.assertEqual(main(["run", self.capture, "--output", after]), 0)
+            self.assertEqual(main(["compare", before, after]), 0)
+        # endwith
+
+        with open(before, encoding="utf-8") as before_file:
+            saved = json.load(before_file)
+        # endwith
+        self.assertEqual(saved["settings"]["engine"], "grammar")
+        self.assertEqual(compare_runs(saved, run(GradeParser(), read_captured([self.capture])))["diffs"], [])
+
+        with redirect_stdout(io.StringIO()) as output:
+            self.assertEqual(main(["engines", self.capture, "--baseline", "regex"]), 1)
+        # endwith
+        self.assertIn("phsyics", output.getvalue())
+    # enddef
+
+
+# endclass
+
+
+if __name__ == "__main__":
+    unittest.main()
+# endif
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+import json
+import os
+import tempfile
+import unittest
+
+from grade_parser import GradeParser
+from traffic import TrafficRecorder, hash_input, scrub_pii
+
+
+class TestTrafficRecorder(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "traffic.jsonl")
+
+    # enddef
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # enddef
+
+    def read(self, path):
+        with open(path, encoding="utf-8") as capture_file:
+            return [json.loads(line) for line in capture_file]
+        # endwith
+
+    # enddef
+
+    def test_records_parser_inputs(self):
+        recorder = TrafficRecorder(self.path, sample=1)
+        parser = GradeParser(recorder=recorder)
+        self.assertEqual(parser.parse("A in maths, email me at jo.bloggs@example.com").grades, {"mathematics": "A"})
+        parser.parse("B in physics, call 07700 900123")
+        recorder.close()
+
+        records = self.read(self.path)
+        self.assertEqual([record["text"] for record in records],
+                         ["A in maths, email me at <email>", "B in physics, call <phone>"])
+        self.assertEqual(records[0]["hash"], hash_input("A in maths, email me at jo.bloggs@example.com"))
+        self.assertEqual(recorder.stats(), {"recorded": 2, "dropped": 0, "errors": 0})
+
+    # enddef
+
+    def test_sampling_and_hooks(self):
+        recorder = TrafficRecorder(self.path, sample=0)
+        for _ in range(100):
+            recorder.record("A in maths")
+        # endfor
+        self.assertFalse(os.path.exists(self.path))
+
+        recorder = TrafficRecorder(self.path, sample=1, hasher=None,
+                                   scrub=lambda text: None if "secret" in text else text.upper())
+        recorder.record("a in maths")
+        recorder.record("secret")
+        recorder.close()
+        self.assertEqual(self.read(self.path)[0].keys(), {"time", "text"})
+        self.assertEqual(self.read(self.path)[0]["text"], "A IN MATHS")
+        self.assertEqual(recorder.stats()["dropped"], 1)
+
+        with self.assertRaises(ValueError):
+            TrafficRecorder(self.path, sample=2)
+        # endwith
+
+    # enddef
+
+    def test_rotation_caps_size(self):
+        recorder = TrafficRecorder(self.path, sample=1, max_bytes=300, backups=2)
+        for number in range(40):
+            recorder.record(f"input {number}")
+        # endfor
+        recorder.close()
+
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ["traffic.jsonl", "traffic.jsonl.1", "traffic.jsonl.2"])
+        for name in os.listdir(self.directory.name):
+            self.assertLessEqual(os.path.getsize(os.path.join(self.directory.name, name)), 300)
+        # endfor
+        self.assertEqual(self.read(self.path)[-1]["text"], "input 39")
+        self.assertEqual(self.read(self.path + ".1")[-1]["text"], f"input {39 - len(self.read(self.path))}")
+
+    # enddef
+
+    def test_unwritable_file_counted(self):
+        recorder = TrafficRecorder(os.path.join(self.directory.name, "missing", "traffic.jsonl"), sample=1)
+        recorder.record("A in maths")
+        self.assertEqual(recorder.stats(), {"recorded": 0, "dropped": 0, "errors": 1})
+
+    # enddef
+
+    def test_scrub_pii_keeps_grades(self):
+        text = "A*AA in maths, 112 ucas points, predicted ABB in 2025"
+        self.assertEqual(scrub_pii(text), text)
+        self.assertEqual(scrub_pii("ring +44 (0)20 7946 0958"), "ring <phone>")
+    # enddef
+
+
+# endclass
+
+
+if __name__ == "__main__":
+    unittest.main()
+# endif
@@ -0,0 +1,231 @@
+"""
+Opt-in capture of the inputs the parser gets in production, to replay them against a changed parser (see replay.py).
+
+    recorder = TrafficRecorder(f"/var/lib/nlp/traffic-{os.getpid()}.jsonl", sample=0.01)
+    parser = GradeParser(recorder=recorder)
+
+A random sample of the inputs parse is called with is written to a local JSONL file, one record per input:
+    {"time": 1760000000.0, "hash": "<sha256 of the input>", "text": "<the input, scrubbed>"}
+Inputs go through a scrub hook first (scrub_pii by default, which blanks out email addresses and phone numbers),
+and the hash is of the input before scrubbing, so the same input can be counted across files without keeping it.
+The file is rotated once it reaches max_bytes and only a few old files are kept, so capturing never uses more than
+(backups + 1) * max_bytes of disk. Give each process its own file, rotation isn't shared between processes.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, TextIO
+
+# Function that takes an input and gives it back with anything personal taken out, or None to not record it
+ScrubHook = Callable[[str], str | None]
+
+# Function that takes an input and gives back the hash stored with it
+HashHook = Callable[[str], str]
+
+# Email addresses, replaced with EMAIL_PLACEHOLDER by scrub_pii
+EMAIL_PATTERN: re.Pattern = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+EMAIL_PLACEHOLDER: str = "<email>"
+
+# Phone numbers (at least 9 digits, with spaces, dashes or brackets between them), replaced with PHONE_PLACEHOLDER
+PHONE_PATTERN: re.Pattern = re.compile(r"(?<!\w)\+?\d(?:[ ()-]{0,2}\d){8,}(?!\w)")
+PHONE_PLACEHOLDER: str = "<phone>"
+
+# Default size a capture file is rotated at, and how many rotated files are kept
+DEFAULT_MAX_BYTES: int = 10 * 1024 * 1024
+DEFAULT_BACKUPS: int = 3
+
+
+def scrub_pii(text: str) -> str:
+    """
+    Default scrub hook. Replaces email addresses and phone numbers, which are about all the personal
+    details people type into a box asking for their grades.
+
+    :param text: User input
+    :return: The input with every email address and phone number replaced by a placeholder
+    """
+    return PHONE_PATTERN.sub(PHONE_PLACEHOLDER, EMAIL_PATTERN.sub(EMAIL_PLACEHOLDER, text))
+
+
+# enddef
+
+
+def hash_input(text: str) -> str:
+    """
+    Default hash hook.
+
+    :param text: User input
+    :return: Hex SHA-256 of the input
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# enddef
+
+
+class TrafficRecorder:
+    """
+    Writes a sample of parser inputs to a size-capped, rotated JSONL file. Safe to share between threads.
+    Recording never gets in the way of parsing: inputs that aren't sampled cost one random number,
+    and a file that can't be written is counted in errors rather than raised.
+    """
+
+    def __init__(self, path: str, sample: float = 0.01, max_bytes: int = DEFAULT_MAX_BYTES,
+                 backups: int = DEFAULT_BACKUPS, scrub: ScrubHook | None = scrub_pii,
+                 hasher: HashHook | None = hash_input):
+        """
+        :param path: File to write to. Rotated files get .1, .2, ... added, .1 being the newest
+        :param sample: Share of inputs to record, from 0 (none) to 1 (all)
+        :param max_bytes: Size a file is rotated at
+        :param backups: Rotated files to keep, 0 starts the file again instead
+        :param scrub: Hook every recorded input goes through first (see ScrubHook), None records inputs as they are
+        :param hasher: Hook that hashes the input (before scrubbing), None leaves the hash out
+        """
+
+        if not 0 <= sample <= 1:
+            raise ValueError("sample must be between 0 and 1")
+        # endif
+
+        if max_bytes < 1 or backups < 0:
+            raise ValueError("max_bytes must be at least 1 and backups can't be negative")
+        # endif
+
+        self.path: str = path
+        self.sample: float = sample
+        self.max_bytes: int = max_bytes
+        self.backups: int = backups
+        self.scrub: ScrubHook | None = scrub
+        self.hasher: HashHook | None = hasher
+
+        self._file: TextIO | None = None
+        self._size: int = 0
+        self._lock = threading.Lock()
+
+        self.recorded: int = 0
+        self.dropped: int = 0
+        self.errors: int = 0
+
+    # enddef
+
+    def record(self, input: str) -> None:
+        """
+        Records the input if it is sampled.
+
+        :param input: User input given to the parser
+        """
+
+        if self.sample < 1 and random.random() >= self.sample:
+            return
+        # endif
+
+        text: str | None = self.scrub(input) if self.scrub is not None else input
+        if text is None:
+            with self._lock:
+                self.dropped += 1
+            # endwith
+            return
+        # endif
+
+        record: Dict = {"time": round(time.time(), 3)}
+        if self.hasher is not None:
+            record["hash"] = self.hasher(input)
+        # endif
+        record["text"] = text
+
+        line: str = json.dumps(record, ensure_ascii=False) + "\n"
+        size: int = len(line.encode("utf-8"))
+
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._open()
+                # endif
+
+                if self._size and self._size + size > self.max_bytes:
+                    self._rotate()
+                # endif
+
+                self._file.write(line)
+                self._file.flush()
+                self._size += size
+                self.recorded += 1
+
+            except OSError:
+                # a full or read-only disk only means nothing more gets recorded
+                self.errors += 1
+                self._close()
+            # endtry
+        # endwith
+
+    # enddef
+
+    def _open(self) -> None:
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+
+    # enddef
+
+    def _close(self) -> None:
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            # endtry
+            self._file = None
+        # endif
+
+    # enddef
+
+    def _rotate(self) -> None:
+        """
+        Moves the full file to .1 (and each older file one further along, dropping the oldest)
+        and starts a new one.
+        """
+
+        self._close()
+
+        if self.backups:
+            for number in range(self.backups - 1, 0, -1):
+                older: str = f"{self.path}.{number}"
+                if os.path.exists(older):
+                    os.replace(older, f"{self.path}.{number + 1}")
+                # endif
+            # endfor
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        # endif
+
+        self._open()
+
+    # enddef
+
+    def close(self) -> None:
+        """
+        Closes the file. Recording again opens it again.
+        """
+
+        with self._lock:
+            self._close()
+        # endwith
+
+    # enddef
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Gets the counters.
+
+        :return: Dictionary with the inputs recorded, dropped by the scrub hook, and not written because of errors
+        """
+
+        with self._lock:
+            return {"recorded": self.recorded, "dropped": self.dropped, "errors": self.errors}
+        # endwith
+    # enddef
+
+
+# endclass